@@ -1,67 +1,58 @@
 import logging
-import os
-import tempfile
 
 import numpy as np
 import pandas as pd
+from django.utils import timezone
 
 from telemetry.analyzer import Analyzer
-from telemetry.influx import Influx
 from telemetry.models import Lap, Session
+from telemetry.telemetry_cache import telemetry_cache
+from telemetry.telemetry_store import LAP_SOURCES, SESSION_SETTLED, telemetry_store
 
 
 class TelemetryLoader:
-    temp_dir = tempfile.mkdtemp()
+    COLUMNS = [
+        "SpeedMs",
+        "Rpms",
+        "Throttle",
+        "Brake",
+        "DistanceRoundTrack",
+        "CurrentLap",
+        "Gear",
+        "SteeringAngle",
+        "CurrentLapTime",
+        "Handbrake",
+    ]
+    OPTIONAL_FIELDS = ["Yaw", "Pitch", "Roll"]
+    # the fields queried from influx, CurrentLap is a tag
+    FIELDS = [column for column in COLUMNS if column != "CurrentLap"] + ["WorldPosition_x", "WorldPosition_y", "WorldPosition_z"] + OPTIONAL_FIELDS
+
+    # sessions ended longer ago than this are not written to anymore
+    SESSION_SETTLED = SESSION_SETTLED
 
     def __init__(self, caching=False):
         self.caching = caching
-        pass
-
-    def read_dataframe(self, file_path):
-        return pd.read_csv(file_path, compression="gzip", parse_dates=["_time"])
-
-    def save_dataframe(self, df, file_path):
-        df.to_csv(file_path, compression="gzip", index=False)
 
     def process_dataframe(self, df):
         df = df.sort_values(by="_time")
         df = df.replace(np.nan, None)
 
         # only return the columns we need: "SpeedMs", "Throttle", "Brake", "DistanceRoundTrack"
-        columns = [
-            "SpeedMs",
-            "Rpms",
-            "Throttle",
-            "Brake",
-            "DistanceRoundTrack",
-            "CurrentLap",
-            "Gear",
-            "SteeringAngle",
-            "CurrentLapTime",
-            "Handbrake",
-        ]
+        columns = self.COLUMNS.copy()
 
         # check if the session contains position data
         if "WorldPosition_x" in df.columns:
             columns += ["WorldPosition_x", "WorldPosition_y", "WorldPosition_z"]
 
-        for field in ["Yaw", "Pitch", "Roll"]:
+        for field in self.OPTIONAL_FIELDS:
             if field in df.columns:
                 columns += [field]
 
         df = df[columns]
 
         analyzer = Analyzer()
-        # split the dataframe into laps based on the CurrentLap field
-        unique_laps = df["CurrentLap"].unique()
-        laps = []
-        for lap in unique_laps:
-            lap_df = df[df["CurrentLap"] == lap]
-            lap_df = analyzer.resample_channels(lap_df, columns=columns, freq=1)
-            laps.append(lap_df)
-
-        # merge the laps back into a single dataframe
-        df = pd.concat(laps)
+        # resample every lap, split on the CurrentLap field, in one call
+        df = analyzer.resample_laps(df, columns=columns, freq=1)
 
         # change CurrentLap to int
         # otherwise the session.js frontend will not be able to parse the JSON
@@ -78,19 +69,13 @@ class TelemetryLoader:
         except Lap.DoesNotExist:
             return None
 
-        influx = Influx()
+        influx = telemetry_store(cache=telemetry_cache() if self.caching else None)
 
-        measurement = "fast_laps"
-        bucket = "fast_laps"
-        lap_df = influx.telemetry_for_laps([lap], measurement=measurement, bucket=bucket)
+        # fast_laps first, then racing
+        lap_df = influx.fetch_lap(influx.lap_query(lap), LAP_SOURCES, fields=self.FIELDS)
 
-        if len(lap_df) == 0:
-            measurement = "laps_cc"
-            bucket = "racing"
-            lap_df = influx.telemetry_for_laps([lap], measurement=measurement, bucket=bucket)
-
-        if len(lap_df) > 0:
-            df = self.process_dataframe(lap_df[0])
+        if lap_df is not None:
+            df = self.process_dataframe(lap_df)
         else:
             df = pd.DataFrame()
         return df
@@ -101,49 +86,44 @@ class TelemetryLoader:
 
         # First check if session exists in database
         try:
-            Session.objects.get(id=session_id)
+            session = Session.objects.get(id=session_id)
         except Session.DoesNotExist:
             return None
 
-        file_path = f"{self.temp_dir}/session_{session_id}_df.csv.gz"
+        influx = telemetry_store(cache=False)
+        aggregate = "100ms"
+        # a session still being driven grows, only settled sessions are cached
+        cache = telemetry_cache() if self.caching and session.end < timezone.now() - self.SESSION_SETTLED else None
 
-        if self.caching and os.path.exists(file_path):
-            session_df = self.read_dataframe(file_path)
-        else:
-            influx = Influx()
-            aggregate = "100ms"
+        start, end = influx.planner.span(session.start, session.end)
 
-            # First try laps_cc bucket
-            try:
-                session_df = influx.session_df(
+        def fetch(measurement, bucket):
+            def query():
+                return influx.session_df(
                     session_id,
                     measurement=measurement,
                     bucket=bucket,
-                    start="-10y",
+                    start=start,
+                    end=end,
                     aggregate=aggregate,
+                    fields=self.FIELDS,
                     drop_tags=True,
                 )
+
+            try:
+                if cache:
+                    return cache.fetch(cache.key(bucket, measurement, session_id, fields=self.FIELDS, aggregate=aggregate, end=session.end.isoformat()), query)
+                return query()
             except Exception as e:
-                logging.debug(f"Error fetching session data from laps_cc: {e}")
-                session_df = pd.DataFrame()
-
-            # If no data found, try fast_laps bucket
-            if len(session_df) == 0:
-                try:
-                    session_df = influx.session_df(
-                        session_id,
-                        measurement="fast_laps",
-                        bucket="fast_laps",
-                        start="-10y",
-                        aggregate=aggregate,
-                        drop_tags=True,
-                    )
-                except Exception as e:
-                    logging.debug(f"Error fetching session data from fast_laps: {e}")
-                    session_df = pd.DataFrame()
-
-            if self.caching and len(session_df) > 0:
-                self.save_dataframe(session_df, file_path)
+                logging.debug(f"Error fetching session data from {bucket}: {e}")
+                return pd.DataFrame()
+
+        # First try laps_cc bucket
+        session_df = fetch(measurement, bucket)
+
+        # If no data found, try fast_laps bucket
+        if len(session_df) == 0:
+            session_df = fetch("fast_laps", "fast_laps")
 
         if len(session_df) > 0:
             df = self.process_dataframe(session_df)
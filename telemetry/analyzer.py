@@ -6,6 +6,10 @@ from scipy.interpolate import interp1d
 from scipy.signal import argrelextrema, savgol_filter
 from sklearn.cluster import KMeans
 
+from . import track_geometry
+from .lap_array import LapArray, LapSection
+from .resampler import LINEAR, NEAREST, float_column, resample_block, resample_lap, resample_laps
+
 
 class Analyzer:
     def __init__(self):
@@ -19,6 +23,10 @@ class Analyzer:
     def sector_time(self, sector_df):
         if sector_df.empty:
             return 0
+        if isinstance(sector_df, LapArray):
+            sector_df = sector_df.whole()
+        if isinstance(sector_df, LapSection):
+            return sector_df.time()
         section_time = sector_df.iloc[-1]["Time"] - sector_df.iloc[0]["Time"]
         section_time = section_time / 1_000_000_000
         return section_time
@@ -26,6 +34,10 @@ class Analyzer:
     def sector_lap_time(self, sector_df):
         if sector_df.empty:
             return 0
+        if isinstance(sector_df, LapArray):
+            sector_df = sector_df.whole()
+        if isinstance(sector_df, LapSection):
+            return sector_df.lap_time()
         end_lap_time = sector_df.iloc[-1]["CurrentLapTime"]
         start_lap_time = sector_df.iloc[0]["CurrentLapTime"]
         if end_lap_time < start_lap_time:
@@ -164,7 +176,16 @@ class Analyzer:
             sector["df"] = sector_df
         return sector_df
 
+    def section(self, lap, start, end):
+        """Return the section of a lap between start and end, without copying the samples of a ``LapArray``."""
+        if isinstance(lap, LapArray):
+            return lap.section(start, end)
+        return self.section_df(lap, start, end)
+
     def section_df(self, track_df, start, end):
+        if isinstance(track_df, LapArray):
+            return track_df.section(start, end).to_df()
+
         # Calculate the maximum DistanceRoundTrack value
         max_distance = track_df["DistanceRoundTrack"].max()
 
@@ -343,7 +364,7 @@ class Analyzer:
 
         return features
 
-    def resample_channels(self, lap_df, columns=["Brake", "SpeedMs"], freq=1, max_distance=0):
+    def resample_channels(self, lap_df, columns=["Brake", "SpeedMs"], freq=1, max_distance=0, dtype=np.float64):
         # Early return if DataFrame is empty
         if len(lap_df) == 0:
             return lap_df
@@ -353,67 +374,17 @@ class Analyzer:
             logging.error("DistanceRoundTrack column not found in DataFrame")
             return lap_df
 
-        # Make sure DistanceRoundTrack is sorted
-        lap_df = lap_df.sort_values("DistanceRoundTrack")
-
-        interpolate_columns = [
-            "Brake",
-            "SpeedMs",
-            "Throttle",
-            "Clutch",
-            "Handbrake",
-            "SpeedMs",
-            "Rpms",
-            "SteeringAngle",
-            "Yaw",
-            "Pitch",
-            "Roll",
-            "CurrentLapTime",
-            "WorldPosition_x",
-            "WorldPosition_y",
-            "WorldPosition_z",
-        ]
-        backfill_columns = ["Gear", "CurrentLap"]
-
-        # Filter columns that actually exist in the DataFrame
-        df_interpolate_columns = [col for col in columns if col in interpolate_columns and col in lap_df.columns]
-        df_backfill_columns = [col for col in columns if col in backfill_columns and col in lap_df.columns]
-
-        if max_distance == 0:
-            # get the max distance from the dataframe and round it up to the next integer
-            max_distance = int(np.ceil(lap_df["DistanceRoundTrack"].max()))
-
-        # Define the new distance range
-        new_distance = np.arange(0, max_distance, freq)
-        new_distance = new_distance.astype(float)
-
-        # Create a new DataFrame with evenly spaced Distance
-        new_df = pd.DataFrame(new_distance, columns=["DistanceRoundTrack"])
-
-        try:
-            result_df = new_df.copy()
-
-            # Handle interpolated columns
-            if df_interpolate_columns:
-                source_df = lap_df[df_interpolate_columns + ["DistanceRoundTrack"]]
-                interp_df = pd.merge_asof(result_df, source_df, on="DistanceRoundTrack", direction="nearest").interpolate("linear")
-                result_df[df_interpolate_columns] = interp_df[df_interpolate_columns]
-
-            # Handle backfill columns
-            if df_backfill_columns:
-                source_df = lap_df[df_backfill_columns + ["DistanceRoundTrack"]]
-                backfill_df = pd.merge_asof(result_df, source_df, on="DistanceRoundTrack", direction="nearest").bfill()
-                result_df[df_backfill_columns] = backfill_df[df_backfill_columns]
-
-            new_df = result_df
-
-        except Exception as e:
-            logging.error(f"Error in resample_channels: {e}")
+        lap = resample_lap(lap_df, columns, freq=freq, max_distance=max_distance, dtype=dtype)
+        if not lap:
+            logging.error("Error in resample_channels: no DistanceRoundTrack values")
             return lap_df
+        return pd.DataFrame(lap)
 
-        return new_df
+    def resample_laps(self, df, columns=["Brake", "SpeedMs"], freq=1, dtype=np.float64):
+        """Resample all laps of a session in one call, like resample_channels for every CurrentLap."""
+        return resample_laps(df, columns, freq=freq, dtype=dtype)
 
-    def resample(self, input_df, columns=["Brake", "SpeedMs"], method="nearest", freq=1):
+    def resample(self, input_df, columns=["Brake", "SpeedMs"], method="nearest", freq=1, dtype=np.float64):
         df = input_df.replace({None: np.nan}).dropna(subset=["DistanceRoundTrack"])
         if len(df) == 0:
             return input_df
@@ -438,6 +409,19 @@ class Analyzer:
 
         resampled_df = pd.DataFrame({"DistanceRoundTrack": new_distance_round_track})
 
+        if method in (LINEAR, NEAREST) and columns:
+            # sorted like interp1d sorts
+            distances = float_column(df["DistanceRoundTrack"])
+            order = np.argsort(distances, kind="mergesort")
+            distances = distances[order]
+            block = np.vstack([float_column(df[column])[order] for column in columns])
+            values = resample_block(distances, block, new_distance_round_track, kind=method, dtype=dtype)
+            for column, interpolated_values in zip(columns, values):
+                if np.issubdtype(df[column].dtype, np.integer):
+                    interpolated_values = np.round(interpolated_values).astype(int)
+                resampled_df[column] = interpolated_values
+            return resampled_df
+
         for column in columns:
             interp = interp1d(df["DistanceRoundTrack"], df[column], kind=method, bounds_error=False, fill_value="extrapolate")
             interpolated_values = interp(new_distance_round_track)
@@ -738,24 +722,12 @@ class Analyzer:
         return df[mon_inc]
 
     def make_monotonic(self, distances, points):
-        # Iterate over the tracks
-        max_distance = distances[0]
-        selected_idx = []
-        for idx in range(distances.shape[0]):
-            # If distance is higher than previous distance, select the point
-            if distances[idx] > max_distance:
-                selected_idx.append(idx)
-                max_distance = distances[idx]
-
+        # select the points with a distance higher than all distances before them
+        selected_idx = track_geometry.monotonic(distances)
         return distances[selected_idx], points[selected_idx]
 
     def track_length(self, distances):
-        length = 0
-        for lap in distances:
-            max_distance = lap.max()
-            if max_distance > length:
-                length = max_distance
-        return length
+        return track_geometry.track_length(distances)
 
     def resample_(self, distances, points, length):
         delta_distance = 2  # [meter]
@@ -772,73 +744,20 @@ class Analyzer:
     def remove_outliers(self, points):
         # Laps have some extream telemetry message.
         # These outliers need to be filled with nan values.
-        #  If yaw angle changes more than a threshold, this point is accepted as extreme
-        delta_distance = 2  # [radian]
-        threshold = 0.4  # [radian]
-        filter_window = 60  # [meter]
-
-        filter_window_index = filter_window / delta_distance
-        points = points.copy()
-
-        # If yaw angle is higher than a threshold
-        # Fill filter window with nan values
-        differences = np.diff(points, axis=0)
-        yaw_angles = np.arctan2(differences[:, 0], differences[:, 1])
-        mask = ~np.isnan(yaw_angles)
-        yaw_angles[mask] = np.unwrap(yaw_angles[mask])
-        yaw_changes = np.diff(yaw_angles)
-        for point_idx in range(points.shape[0] - 2):
-            if abs(yaw_changes[point_idx]) > threshold:
-                start = int(max(0, point_idx - filter_window_index))
-                end = int(min(points.shape[0] - 1, point_idx + filter_window_index))
-                points[start:end, :] = np.nan
-
-        return points
+        #  If yaw angle changes more than a threshold, the points in a window around it are nan
+        points = np.asarray(points)
+        if points.ndim == 2:
+            return track_geometry.remove_outliers(points[None])[0]
+        return track_geometry.remove_outliers(points)
 
     def merge_track_points(self, distances_a, points_a, length):
-        delta_distance = 2  # [meter]
-        filter_window = 60
-        # filter_order = 2
-        filter_window_index = filter_window / delta_distance
-
-        track_distances = []
-        track_points = []
-        num_samples = int(length / delta_distance)
-
-        # Iterate over sample points
-        for point_idx in range(num_samples):
-            window_distances = []
-            window_x = []
-            window_y = []
-            # Iterate over the laps
-            for lap_idx in range(len(distances_a)):
-                distances = distances_a[lap_idx].copy()
-                points = points_a[lap_idx].copy()
-                # Calculate start and end index of filter window
-                start = int(max(0, point_idx - filter_window_index))
-                end = int(min(num_samples - 1, point_idx + filter_window_index))
-                # Get points in filter window
-                window_distances.extend(distances[start:end])
-                window_x.extend(points[start:end, 0])
-                window_y.extend(points[start:end, 1])
-
-            window_distances = np.array(window_distances)
-            window_x = np.array(window_x)
-            window_y = np.array(window_y)
-            window_distances = window_distances[~np.isnan(window_x)]
-            window_y = window_y[~np.isnan(window_x)]
-            window_x = window_x[~np.isnan(window_x)]
-            # Fit a polynom to points in filter windows
-            px = np.polyfit(window_distances, window_x, 2)
-            py = np.polyfit(window_distances, window_y, 2)
-            fx = np.poly1d(px)
-            fy = np.poly1d(py)
-            # Calculate the point by using polynomial
-            p = np.array([fx(distances[point_idx]), fy(distances[point_idx])])
-            track_distances.append(distances[point_idx])
-            track_points.append(p)
-
-        return np.array(track_distances), np.array(track_points)
+        # the laps are resampled to the same distances, see resample_
+        samples = max(len(points) for points in points_a)
+        points = np.full((len(points_a), samples, 2), np.nan)
+        for lap_idx, lap_points in enumerate(points_a):
+            points[lap_idx, : len(lap_points)] = lap_points
+        distances = max(distances_a, key=len)
+        return track_geometry.merge_points(distances, points, length)
 
     def yaw_changes(self, points):
         # distances = distances.copy()
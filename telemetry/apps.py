@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class TelemetryConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "telemetry"
+
+    def ready(self):
+        from . import signals  # noqa: F401 pylint: disable=unused-import,import-outside-toplevel
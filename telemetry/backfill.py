@@ -0,0 +1,134 @@
+"""Recompute the laps and segments of archived sessions in a pool of processes.
+
+After a change to the lap or segment analysis the ``Lap`` and ``Segment`` rows
+of months of sessions have to be computed again. ``Backfill`` hands the
+sessions to ``workers`` forked processes. A worker replays the ticks of a
+session through its own ``PersisterDb``, in blocks of ticks from a
+``ReplaySource``, see ``Session.signal_batch``, or tick by tick from the
+telemetry store, and writes the rows of the session in one write-behind
+flush when it is done.
+
+Finished sessions are appended to the ``checkpoint`` file, one json line per
+session. A run started again with the same checkpoint skips them, failed
+sessions and sessions without ticks in the source, ``empty``, are tried
+again.
+"""
+
+import json
+import logging
+import multiprocessing
+import os
+import time
+from typing import Iterable, List, Optional, Set
+
+import django.db
+import pandas as pd
+
+from .replay_source import record_ticks, replay_source
+from .telemetry_store import telemetry_store
+
+# sessions one worker process handles before it is replaced, bounds leaks
+SESSIONS_PER_WORKER = 50
+
+
+class Checkpoint:
+    def __init__(self, path: Optional[str]):
+        self.path = path
+        self.done: Set[str] = set()
+        if path and os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # a line cut short by an interrupted run
+                        continue
+                    if entry.get("status") == "done":
+                        self.done.add(str(entry["session_id"]))
+
+    def mark(self, result: dict):
+        if result.get("status") == "done":
+            self.done.add(str(result["session_id"]))
+        if not self.path:
+            return
+        with open(self.path, "a") as f:
+            f.write(json.dumps(result) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def session_batches(session_id, archive="", measurement="laps_cc", bucket="racing"):
+    """Yield the ticks of a session as (topic, times, columns) blocks, single ticks for influx."""
+    store = None if archive else telemetry_store(cache=False)
+    source = replay_source(store, archive)
+    if source:
+        for topic, times_ns, columns in source.session_batches(session_id, measurement=measurement, bucket=bucket):
+            yield topic, pd.to_datetime(times_ns, unit="ns", utc=True).to_pydatetime(), columns
+        return
+    for topic, time_ns, telemetry in record_ticks(store.session(session_id=session_id, measurement=measurement, bucket=bucket)):
+        yield topic, [pd.Timestamp(time_ns, unit="ns", tz="UTC").to_pydatetime()], {name: [value] for name, value in telemetry.items()}
+
+
+def backfill_session(session_id, archive="", measurement="laps_cc", bucket="racing") -> dict:
+    """Replay a session through a ``PersisterDb``, return the result for the checkpoint."""
+    from telemetry.models import Driver
+    from telemetry.pitcrew.persister_db import PersisterDb
+
+    started = time.perf_counter()
+    ticks = 0
+    persister = None
+    try:
+        for topic, times, columns in session_batches(session_id, archive=archive, measurement=measurement, bucket=bucket):
+            if persister is None:
+                driver, created = Driver.objects.get_or_create(name=topic.split("/")[1])
+                # nothing is written before the session is complete
+                persister = PersisterDb(driver, flush_latency=float("inf"))
+            persister.notify_batch(topic, columns, times)
+            ticks += len(times)
+        if persister:
+            persister.on_stop()
+    except Exception as e:
+        logging.exception(f"Backfill: session {session_id} failed: {e}")
+        return {"session_id": str(session_id), "status": "failed", "ticks": ticks, "error": str(e)}
+    # a mistyped id or a session missing from the archive, not done
+    status = "done" if persister else "empty"
+    return {"session_id": str(session_id), "status": status, "ticks": ticks, "seconds": round(time.perf_counter() - started, 3)}
+
+
+def _run(args):
+    return backfill_session(*args)
+
+
+class Backfill:
+    def __init__(self, workers=None, checkpoint: Optional[str] = None, archive="", measurement="laps_cc", bucket="racing"):
+        self.workers = workers or os.cpu_count() or 1
+        self.checkpoint = Checkpoint(checkpoint)
+        self.archive = archive
+        self.measurement = measurement
+        self.bucket = bucket
+
+    def pending(self, session_ids: Iterable) -> List[str]:
+        return [str(session_id) for session_id in session_ids if str(session_id) not in self.checkpoint.done]
+
+    def run(self, session_ids: Iterable, progress=None) -> List[dict]:
+        """Backfill the sessions not in the checkpoint, ``progress`` is called with every result."""
+        tasks = [(session_id, self.archive, self.measurement, self.bucket) for session_id in self.pending(session_ids)]
+        results = []
+        if self.workers <= 1 or len(tasks) <= 1:
+            for result in map(_run, tasks):
+                self.finished(result, results, progress)
+            return results
+
+        # the workers are forked, they must not share the database connections of this process
+        django.db.connections.close_all()
+        context = multiprocessing.get_context("fork")
+        with context.Pool(min(self.workers, len(tasks)), maxtasksperchild=SESSIONS_PER_WORKER) as pool:
+            for result in pool.imap_unordered(_run, tasks):
+                self.finished(result, results, progress)
+        return results
+
+    def finished(self, result, results, progress):
+        self.checkpoint.mark(result)
+        results.append(result)
+        if progress:
+            progress(result)
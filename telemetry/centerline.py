@@ -0,0 +1,126 @@
+"""The centerline of a track, built once from the positions of several laps.
+
+The session map and every feature using positions worked on the raw
+``WorldPosition`` values of a lap. A ``Centerline`` is the line of a track
+every ``step`` meters, with the position, heading and curvature at every
+meter, merged from several laps with ``track_geometry.track_points``. It is
+stored per track in ``TrackCenterline``, see the ``build_centerline``
+command, and rebuilt when ``VERSION`` changes.
+
+``Centerline.match`` maps positions to distances with a KD-tree over the
+points of the line, for games whose ``DistanceRoundTrack`` is not reliable.
+"""
+
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from . import track_geometry
+
+# bumped whenever the way a centerline is built changes
+VERSION = 1
+
+# the world axes of the plot coordinates, and the sign of the y axis, per game
+GAME_AXES = {
+    "Assetto Corsa Competizione": ("WorldPosition_x", "WorldPosition_z", -1),
+    "Automobilista 2": ("WorldPosition_x", "WorldPosition_z", 1),
+}
+DEFAULT_AXES = ("WorldPosition_x", "WorldPosition_z", 1)
+
+
+def plot_coordinates(df, game) -> Tuple:
+    """Return the x and y columns of the positions in a dataframe of ``game``."""
+    x, y, sign = GAME_AXES.get(game, DEFAULT_AXES)
+    return df[x], df[y] * sign
+
+
+def lap_positions(df, game) -> Tuple[np.ndarray, np.ndarray]:
+    """Return the distances and the samples × 2 positions of a lap dataframe, without samples missing one."""
+    x, y = plot_coordinates(df, game)
+    distances = df["DistanceRoundTrack"].to_numpy(dtype=np.float64, na_value=np.nan)
+    points = np.column_stack([x.to_numpy(dtype=np.float64, na_value=np.nan), y.to_numpy(dtype=np.float64, na_value=np.nan)])
+    present = ~np.isnan(distances) & ~np.isnan(points).any(axis=1)
+    return distances[present], points[present]
+
+
+class Centerline:
+    def __init__(self, distance, x, y, heading=None, curvature=None, version=VERSION):
+        self.distance = np.asarray(distance, dtype=np.float64)
+        self.x = np.asarray(x, dtype=np.float64)
+        self.y = np.asarray(y, dtype=np.float64)
+        self.step = float(self.distance[1] - self.distance[0]) if len(self.distance) > 1 else 1.0
+        if heading is None:
+            # the direction of travel in the plot, counter clockwise from the x axis
+            heading = np.unwrap(np.arctan2(np.gradient(self.y), np.gradient(self.x)))
+        if curvature is None:
+            curvature = np.gradient(heading) / self.step
+        self.heading = np.asarray(heading, dtype=np.float64)
+        self.curvature = np.asarray(curvature, dtype=np.float64)
+        self.version = version
+        self._tree: Optional[cKDTree] = None
+
+    @classmethod
+    def build(cls, laps: List[Tuple[np.ndarray, np.ndarray]], step=1.0) -> "Centerline":
+        """Merge the (distances, positions) of laps into a centerline with a point every ``step`` meters."""
+        laps = [(distances, points) for distances, points in laps if len(distances) > 1]
+        if not laps:
+            raise ValueError("no laps with positions")
+        distances, points = track_geometry.track_points([distances for distances, points in laps], [points for distances, points in laps])
+        present = ~np.isnan(points).any(axis=1)
+        if np.count_nonzero(present) < 3:
+            raise ValueError("not enough positions for a centerline")
+        distances, points = distances[present], points[present]
+        grid = np.arange(0, distances[-1] + step, step)
+        x = np.interp(grid, distances, points[:, 0])
+        y = np.interp(grid, distances, points[:, 1])
+        return cls(grid, x, y)
+
+    def __len__(self):
+        return len(self.distance)
+
+    @property
+    def length(self) -> float:
+        return float(self.distance[-1]) if len(self.distance) else 0.0
+
+    def to_dict(self) -> Dict:
+        return {
+            "version": self.version,
+            "distance": self.distance,
+            "x": self.x,
+            "y": self.y,
+            "heading": self.heading,
+            "curvature": self.curvature,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "Centerline":
+        return cls(data["distance"], data["x"], data["y"], heading=data.get("heading"), curvature=data.get("curvature"), version=data.get("version", VERSION))
+
+    def tree(self) -> cKDTree:
+        if self._tree is None:
+            self._tree = cKDTree(np.column_stack([self.x, self.y]))
+        return self._tree
+
+    def match(self, x, y) -> Tuple[np.ndarray, np.ndarray]:
+        """Return the distance along the line and the offset to the left of it of positions.
+
+        The nearest point of the line is found in the KD-tree, the position is
+        projected onto the heading there to place it between the points.
+        """
+        x = np.atleast_1d(np.asarray(x, dtype=np.float64))
+        y = np.atleast_1d(np.asarray(y, dtype=np.float64))
+        _, nearest = self.tree().query(np.column_stack([x, y]))
+        dx = x - self.x[nearest]
+        dy = y - self.y[nearest]
+        cos = np.cos(self.heading[nearest])
+        sin = np.sin(self.heading[nearest])
+        along = np.clip(dx * cos + dy * sin, -self.step / 2, self.step / 2)
+        distance = np.clip(self.distance[nearest] + along, 0, self.length)
+        offset = dy * cos - dx * sin
+        return distance, offset
+
+    def position_at(self, distance) -> Tuple[np.ndarray, np.ndarray]:
+        """Return the x and y of the line at distances, wrapping around at the finish line."""
+        distance = np.mod(np.asarray(distance, dtype=np.float64), self.length) if self.length else np.asarray(distance, dtype=np.float64)
+        return np.interp(distance, self.distance, self.x), np.interp(distance, self.distance, self.y)
@@ -4,9 +4,11 @@ import statistics
 import numpy as np
 
 from .analyzer import Analyzer
-from .influx import Influx
+from .lap_array import LapArray, LapSection
 from .models import FastLap
 from .pitcrew.segment import Segment
+from .sector_matrix import LapStack, SectorMatrix
+from .telemetry_store import telemetry_store
 
 
 class FastLapAnalyzer:
@@ -16,11 +18,12 @@ class FastLapAnalyzer:
         self.bucket = bucket
         self.influx_client = None
         self.same_sectors = False
+        self.sector_matrix = None
         self.columns = ["Brake", "SpeedMs", "Throttle", "Gear", "CurrentLapTime", "SteeringAngle", "Time"]
 
     def influx(self):
         if not self.influx_client:
-            self.influx_client = Influx()
+            self.influx_client = telemetry_store()
         return self.influx_client
 
     def assert_can_analyze(self):
@@ -31,17 +34,14 @@ class FastLapAnalyzer:
         laps_with_telemetry = []
         lap_telemetry = []
         counter = 0
-        for lap in self.laps:
-            laps = self.influx().telemetry_for_laps([lap], measurement="fast_laps", bucket=self.bucket)
-            if len(laps) == 0:
-                logging.info("No data found for lap in fast_laps bucket, trying in default bucket")
-                laps = self.influx().telemetry_for_laps([lap])
-                if len(laps) == 0:
-                    logging.info("No data found for lap, continuing")
-                    continue
+        sources = [("fast_laps", self.bucket), ("laps_cc", "racing")]
+        for lap, lap_df in self.influx().iter_lap_telemetry(self.laps, sources=sources):
+            if lap_df is None:
+                logging.info("No data found for lap, continuing")
+                continue
             laps_with_telemetry.append(lap)
             try:
-                df = self.preprocess(laps[0])
+                df = self.preprocess(lap_df)
                 if df is not None and not df.empty:
                     lap_telemetry.append(df)
                     counter += 1
@@ -112,9 +112,13 @@ class FastLapAnalyzer:
 
         # logging.debug(f"start: {start}, end: {end}")
         for i, df in enumerate(data_frames):
-            sector = self.analyzer.section_df(df, start, end)
-            min_distance = sector["DistanceRoundTrack"].min()
-            max_distance = sector["DistanceRoundTrack"].max()
+            sector = self.analyzer.section(df, start, end)
+            if isinstance(sector, LapSection):
+                min_distance = sector.min_distance
+                max_distance = sector.max_distance
+            else:
+                min_distance = sector["DistanceRoundTrack"].min()
+                max_distance = sector["DistanceRoundTrack"].max()
             if start > end:
                 tmp = start
                 start = end
@@ -155,6 +159,9 @@ class FastLapAnalyzer:
                 fast_sector_idx = i
 
         # logging.debug(f"fast_sector_idx: {fast_sector_idx} fast_sector_time: {fast_sector_time}")
+        if isinstance(fast_sector, LapSection):
+            # the features are computed on a dataframe
+            fast_sector = fast_sector.to_df()
         return fast_sector, fast_sector_idx
 
     def analyze(self, min_laps=1, max_laps=10):
@@ -192,14 +199,22 @@ class FastLapAnalyzer:
         segments = []
         used_laps = set()
         track_length = df_max["DistanceRoundTrack"].max()
+        laps = [df if isinstance(df, LapArray) else LapArray.from_df(df) for df in lap_telemetry]
+        self.sector_matrix = SectorMatrix(LapStack(laps), sector_start_end, track_length=track_length)
+        fastest = self.sector_matrix.fastest()
+        logging.debug(f"extract_segments: theoretical best {self.sector_matrix.theoretical_best()}")
         for i in range(len(sector_start_end)):
             start = sector_start_end[i]["start"]
             end = sector_start_end[i]["end"]
             logging.debug(f"extract_segments for sector {i} start: {start} end: {end}")
-            sector, lap_index = self.fastest_sector(lap_telemetry, start, end)
-            if sector is None:
+            lap_index = int(fastest[i])
+            if lap_index < 0:
                 logging.error(f"Could not find fastest sector for {start} - {end}")
                 continue
+            sector = laps[lap_index].section(start, end).to_df()
+            if sector.empty:
+                logging.error(f"sector {i} of lap {lap_index} is empty")
+                continue
             # merge Throttle input
             # sector['Throttle'] = df_max['Throttle']
 
@@ -0,0 +1,176 @@
+"""Parse the annotated CSV of a Flux query into a dataframe, a chunk of rows at a time.
+
+``QueryApi.query_data_frame`` keeps every row of a response as python
+objects before pandas sees it, for a long session that is several times the
+size of the resulting frame. ``read_dataframe`` reads the rows of
+``QueryApi.query_csv`` as they arrive and converts them to typed numpy arrays
+every ``CHUNK_ROWS`` rows, using the ``#datatype`` annotation of the columns:
+
+* ``double`` becomes float32, but for the fields in ``FLOAT64_FIELDS``
+* ``long`` and ``unsignedLong`` become int64, float64 when values are missing
+* ``dateTime:RFC3339`` becomes datetime64[ns, UTC]
+* ``boolean`` becomes bool, object when values are missing
+* strings, mostly tags repeating on every row, share one python object per value
+
+Responses with several tables, e.g. not grouped after the pivot, are
+concatenated, columns missing in a table are filled with missing values.
+"""
+
+from typing import Dict, Iterable, List
+
+import numpy as np
+import pandas as pd
+
+CHUNK_ROWS = 8192
+
+# float32 has 7 significant digits, plenty for pedals, speeds and angles,
+# but times and distances of long sessions are kept exact
+FLOAT64_FIELDS = {
+    "CurrentLapTime",
+    "LapTimePrevious",
+    "DistanceRoundTrack",
+    "Time",
+    "_value",
+}
+
+
+class Column:
+    def __init__(self, name, datatype, rows_before=0):
+        self.name = name
+        self.datatype = datatype
+        self.chunks: List[np.ndarray] = []
+        self.pending: List[str] = []
+        self.missing = False
+        self.strings: Dict[str, str] = {}
+        if rows_before:
+            self.pad(rows_before)
+
+    def append(self, value):
+        self.pending.append(value)
+        if len(self.pending) >= CHUNK_ROWS:
+            self.flush()
+
+    def pad(self, rows):
+        """Add ``rows`` missing values, for the rows of tables without this column."""
+        self.flush()
+        self.missing = True
+        self.chunks.append(np.full(rows, None, dtype=object))
+
+    def flush(self):
+        if not self.pending:
+            return
+        values = self.pending
+        self.pending = []
+        self.chunks.append(self.convert(values))
+
+    def convert(self, values):
+        datatype = self.datatype
+        if datatype == "double":
+            dtype = np.float64 if self.name in FLOAT64_FIELDS else np.float32
+            # numpy parses "nan", an empty value is a missing one
+            return np.array([value or "nan" for value in values], dtype=np.float64).astype(dtype, copy=False)
+        if datatype in ("long", "unsignedLong"):
+            if "" in values:
+                self.missing = True
+                return np.array([value or "nan" for value in values], dtype=np.float64)
+            return np.array(values, dtype=np.int64)
+        if datatype.startswith("dateTime"):
+            # naive UTC, localized once in series()
+            times = pd.to_datetime([value or None for value in values], utc=True, format="ISO8601")
+            return times.tz_convert(None).to_numpy(dtype="datetime64[ns]")
+        if datatype == "boolean":
+            if "" in values:
+                self.missing = True
+                return np.array([None if value == "" else value == "true" for value in values], dtype=object)
+            return np.array([value == "true" for value in values], dtype=bool)
+        strings = self.strings
+        return np.array([strings.setdefault(value, value) if value != "" else None for value in values], dtype=object)
+
+    def array(self):
+        self.flush()
+        if not self.chunks:
+            return np.array([], dtype=object)
+        if self.missing and len(self.chunks) > 1:
+            return self.merge()
+        return np.concatenate(self.chunks) if len(self.chunks) > 1 else self.chunks[0]
+
+    def merge(self):
+        # missing values from padding, keep numeric columns numeric
+        numeric = [chunk.dtype for chunk in self.chunks if chunk.dtype != object]
+        if numeric and all(np.issubdtype(dtype, np.number) for dtype in numeric):
+            dtype = np.result_type(*numeric, np.float32)
+            return np.concatenate([chunk.astype(dtype) if chunk.dtype != object else np.full(len(chunk), np.nan, dtype=dtype) for chunk in self.chunks])
+        return np.concatenate([chunk.astype(object) for chunk in self.chunks])
+
+    def series(self):
+        array = self.array()
+        if self.datatype.startswith("dateTime") and len(array):
+            return pd.Series(pd.to_datetime(array, utc=True), name=self.name)
+        return pd.Series(array, name=self.name)
+
+
+def read_dataframe(rows: Iterable[List[str]]) -> pd.DataFrame:
+    """Build a dataframe from annotated CSV rows, as yielded by ``QueryApi.query_csv``."""
+    columns: Dict[str, Column] = {}
+    datatypes: List[str] = []
+    defaults: List[str] = []
+    header = None
+    table_columns: List[Column] = []
+    table_defaults: List[str] = []
+    rows_read = 0
+    table_rows = 0
+
+    def end_table():
+        # columns of earlier tables missing in this one
+        if table_rows:
+            in_table = {id(column) for column in table_columns}
+            for column in columns.values():
+                if id(column) not in in_table:
+                    column.pad(table_rows)
+
+    for row in rows:
+        if not row or (len(row) == 1 and not row[0]):
+            # an empty line ends a table
+            end_table()
+            rows_read += table_rows
+            table_rows = 0
+            header = None
+            continue
+        first = row[0]
+        if first.startswith("#"):
+            if first == "#datatype":
+                if header is not None:
+                    end_table()
+                    rows_read += table_rows
+                    table_rows = 0
+                    header = None
+                datatypes = row
+            elif first == "#default":
+                defaults = row
+            continue
+        if header is None:
+            header = row
+            table_columns = []
+            table_defaults = [defaults[index] if index < len(defaults) else "" for index in range(len(header))]
+            for index, name in enumerate(header):
+                if index == 0 and name == "":
+                    table_columns.append(None)
+                    continue
+                column = columns.get(name)
+                if column is None:
+                    datatype = datatypes[index] if index < len(datatypes) else "string"
+                    column = Column(name, datatype, rows_before=rows_read)
+                    columns[name] = column
+                table_columns.append(column)
+            continue
+        if header[1:3] == ["error", "reference"]:
+            raise Exception(f"Flux query failed: {row[1]}")
+        for column, value, default in zip(table_columns, row, table_defaults):
+            if column is not None:
+                column.append(value or default)
+        table_rows += 1
+
+    end_table()
+    if not columns:
+        return pd.DataFrame()
+    return pd.DataFrame({name: column.series() for name, column in columns.items()})
@@ -1,6 +1,5 @@
 import csv
 import logging
-import sys
 import warnings
 from datetime import datetime, timedelta
 
@@ -11,24 +10,47 @@ from dateutil import parser
 from influxdb_client.client.influxdb_client_async import InfluxDBClientAsync
 from influxdb_client.client.warnings import MissingPivotFunction
 
+from . import flux_csv
+from .telemetry_cache import telemetry_cache
+from .telemetry_store import (  # noqa: F401
+    LAP_SOURCES,
+    RANGE_MARGIN,
+    WIDE_RANGE,
+    RangePlanner,
+    TelemetryStore,
+    TelemetryStoreError,
+    flux_time,
+)
 from .utils import get_influxdb2_config
 
 warnings.simplefilter("ignore", MissingPivotFunction)
 
 
-class Influx:
-    def __init__(self):
+def field_filter(fields):
+    """Return a Flux filter keeping only the ``fields``, pushed down to the storage engine."""
+    fields = sorted(set(fields))
+    return "|> filter(fn: (r) => " + " or ".join(f'r["_field"] == "{field}"' for field in fields) + ")\n"
+
+
+class Influx(TelemetryStore):
+
+    def __init__(self, cache=True):
+        self.cache = telemetry_cache() if cache is True else cache
         # configure influxdb client
         (self.org, self.token, self.url) = get_influxdb2_config()
 
         self.influx = influxdb_client.InfluxDBClient(
-            url=self.url, token=self.token, org=self.org, timeout=(10_000, 600_000)
+            url=self.url,
+            token=self.token,
+            org=self.org,
+            timeout=(10_000, 600_000),
+            # parallel lap queries, one connection per worker
+            connection_pool_maxsize=self.LAP_WORKERS,
         )
         if self.influx.ping():
             logging.debug(f"Influx: Connected to {self.url}")
         else:
-            logging.error(f"Influx: Connection to {self.url} failed")
-            sys.exit(1)
+            raise TelemetryStoreError(f"Influx: Connection to {self.url} failed")
 
         self.query_api = self.influx.query_api()
 
@@ -91,36 +113,6 @@ class Influx:
                             data.append(df)
         return data
 
-    def telemetry_for_laps(self, laps=[], measurement="laps_cc", bucket="racing"):
-        data = []
-        for lap in laps:
-            game = lap.session.game.name
-            session = lap.session.session_id
-            track = lap.track.name
-            lap_number = lap.number
-
-            logging.info(f"Fetching telemetry for {game} - {track} - {lap.car}")
-            logging.info(f"  track.id {lap.track.id} car.id {lap.car.id}")
-            logging.info(f"  session {session} lap.id {lap.id} number {lap_number}")
-            logging.info(f"  length {lap.length} time {lap.time} valid {lap.valid}")
-            logging.info(f"  start {lap.start} end {lap.end}")
-
-            try:
-                df = self.session_df(
-                    session,
-                    lap_number=lap_number,
-                    start=lap.start,
-                    end=lap.end,
-                    measurement=measurement,
-                    bucket=bucket,
-                )
-                if len(df) > 100:
-                    data.append(df)
-            except Exception as e:
-                logging.error(e)
-
-        return data
-
     def session(
         self,
         session_id=None,
@@ -130,8 +122,11 @@ class Influx:
         end=None,
         measurement="laps_cc",
         bucket="racing",
+        fields=[],
     ):
         lap_filter = []
+        # only the fields asked for leave the server
+        projection = field_filter(fields) if fields else ""
 
         if start and end and session_id:
             # subtract one hour from start and add one hour to end
@@ -140,22 +135,26 @@ class Influx:
             start = start.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
             end = end.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
         if lap:
-            start = lap.start.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
-            end = lap.end.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+            start, end = self.planner.lap(lap)
             session_id = lap.session.session_id
+            # the margin reaches into the laps before and after
+            lap_numbers = [lap.number]
 
         logging.debug(f"session_id: {session_id}, start: {start}, end: {end}, lap_numbers: {lap_numbers}")
 
         if lap_numbers and session_id:
             for lap_number in lap_numbers:
                 lap_filter.append(f'r["CurrentLap"] == "{lap_number}"')
+            if not (start and end):
+                start, end = self.planner.laps(session_id, lap_numbers)
 
             query = f"""
                 from(bucket: "{bucket}")
-                |> range(start: -10y, stop: now())
+                |> range(start: {start}, stop: {end})
                 |> filter(fn: (r) => r["_measurement"] == "{measurement}")
                 |> filter(fn: (r) => r["SessionId"] == "{session_id}")
                 |> filter(fn: (r) => {' or '.join(lap_filter)})
+                {projection}
                 |> pivot(rowKey: ["_time"], columnKey: ["_field"], valueColumn: "_value")
                 |> group(columns: [])
                 |> sort(columns: ["_time"])
@@ -166,16 +165,19 @@ class Influx:
                 |> range(start: {start}, stop: {end})
                 |> filter(fn: (r) => r["_measurement"] == "{measurement}")
                 |> filter(fn: (r) => r["SessionId"] == "{session_id}")
+                {projection}
                 |> pivot(rowKey: ["_time"], columnKey: ["_field"], valueColumn: "_value")
                 |> group(columns: [])
                 |> sort(columns: ["_time"])
             """
         else:
+            start, end = self.planner.session(session_id)
             query = f"""
                 from(bucket: "{bucket}")
-                |> range(start: -10y, stop: now())
+                |> range(start: {start}, stop: {end})
                 |> filter(fn: (r) => r["_measurement"] == "{measurement}")
                 |> filter(fn: (r) => r["SessionId"] == "{session_id}")
+                {projection}
                 |> pivot(rowKey: ["_time"], columnKey: ["_field"], valueColumn: "_value")
                 |> group(columns: [])
                 |> sort(columns: ["_time"])
@@ -249,14 +251,16 @@ class Influx:
             yield record["_value"]
 
     def session_ids(self, measurement="fast_laps", bucket="racing"):
+        # no session is older than the oldest one in Postgres
+        start, stop = self.planner.all_sessions()
         query = f"""
             import "influxdata/influxdb/schema"
             schema.tagValues(
                 bucket: "{bucket}",
                 tag: "SessionId",
                 predicate: (r) => r["_measurement"] == "{measurement}",
-                start: -10y,
-                stop: now()
+                start: {start},
+                stop: {stop}
             )
         """
         records = self.query_api.query_stream(query=query)
@@ -291,14 +295,8 @@ class Influx:
         """
 
         if fields:
-            query += f"""
-            |> filter(fn: (r) => r["_field"] == "{fields[0]}")
-            """
-            for field in fields[1:]:
-                query += f"""
-                or r["_field"] == "{field}"
-                """
-            query += ")\n"
+            # the neutral rows are dropped below
+            query += field_filter(list(fields) + ["Gear"])
 
         if aggregate:
             # downsample to 1Hz
@@ -325,24 +323,24 @@ class Influx:
             |> drop(columns: ["_start", "_stop", "_measurement", "host", "topic", "user"])
             """
 
-        df = self.query_api.query_data_frame(query=query)
+        # parsed while it streams in, see flux_csv
+        df = flux_csv.read_dataframe(self.query_api.query_csv(query=query))
         if df.empty:
             raise Exception(f"No data found for {session_id} lap {lap_number}")
 
-        game = df["GameName"].iloc[0]
-        if game == "Assetto Corsa Competizione":
-            # flip y axis
-            df["x"] = df["WorldPosition_x"]
-            df["y"] = df["WorldPosition_z"] * -1
-        if game == "Automobilista 2":
-            df["x"] = df["WorldPosition_x"]
-            df["y"] = df["WorldPosition_z"]
-
-        df["id"] = df["SessionId"].astype(str) + "-" + df["CurrentLap"].astype(str)
+        return self.finish_session_df(df)
 
-        df = df[df["Gear"] != 0]
-
-        return df
+    def raw_session_df(self, session_id, start="-10y", end="now()", measurement="laps_cc", bucket="racing"):
+        """Return every tick of a session as stored, e.g. to archive it in a LocalStore."""
+        query = f"""
+        from(bucket: "{bucket}")
+        |> range(start: {flux_time(start)}, stop: {flux_time(end)})
+        |> filter(fn: (r) => r["_measurement"] == "{measurement}")
+        |> filter(fn: (r) => r["SessionId"] == "{session_id}")
+        |> pivot(rowKey: ["_time"], columnKey: ["_field"], valueColumn: "_value")
+        |> sort(columns: ["_time"], desc: false)
+        """
+        return flux_csv.read_dataframe(self.query_api.query_csv(query=query))
 
     # https://community.influxdata.com/t/how-to-copy-data-between-measurements/22582/14
     def copy_session(
@@ -353,14 +351,14 @@ class Influx:
         from_bucket="racing",
         to_bucket="fast_laps",
     ):
-        if isinstance(start, datetime):
-            start = start.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
-        if isinstance(end, datetime):
-            end = end.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+        if isinstance(start, datetime) and isinstance(end, datetime):
+            start, end = self.planner.span(start, end)
+        else:
+            start, end = self.planner.session(session_id)
 
         query = f"""
             from(bucket: "{from_bucket}")
-            |> range(start: -10y, stop: now())
+            |> range(start: {start}, stop: {end})
             |> filter(fn: (r) => r._measurement == "laps_cc")
             |> filter(fn: (r) => r["SessionId"] == "{session_id}")
             |> set(key: "_measurement", value: "fast_laps")
@@ -0,0 +1,158 @@
+"""The resampled channels of a lap as numpy arrays indexed by distance.
+
+``Analyzer.section_df`` filters the whole lap dataframe with two boolean
+masks and concatenates the parts of a sector wrapping around the finish line,
+for every lap and every sector. ``LapArray`` holds the channels of a lap
+resampled by distance, see ``FastLapAnalyzer.preprocess``, as contiguous
+float64 arrays sorted by ``DistanceRoundTrack`` together with the elapsed
+seconds at every sample. A ``LapSection`` is two ``searchsorted`` lookups and
+one or two slices of these arrays, a sector wrapping around the finish line
+has two, and its time is read from the elapsed seconds at its ends.
+
+A section is turned into a dataframe with ``to_df`` only where the features
+need one, for the fastest sector.
+"""
+
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+DISTANCE = "DistanceRoundTrack"
+
+
+class LapSection:
+    """The samples of a lap between two distances, ``parts`` are (first, stop) index ranges."""
+
+    def __init__(self, lap: "LapArray", parts: List[Tuple[int, int]]):
+        self.lap = lap
+        self.parts = [(first, stop) for first, stop in parts if stop > first]
+
+    def __len__(self):
+        return sum(stop - first for first, stop in self.parts)
+
+    @property
+    def empty(self):
+        return not self.parts
+
+    def views(self, name) -> List[np.ndarray]:
+        """Return the slices of a channel in section order, views into the lap arrays."""
+        column = self.lap.column(name)
+        return [column[first:stop] for first, stop in self.parts]
+
+    def column(self, name) -> np.ndarray:
+        views = self.views(name)
+        if len(views) == 1:
+            return views[0]
+        if not views:
+            return np.empty(0)
+        return np.concatenate(views)
+
+    def first(self, name) -> float:
+        first, stop = self.parts[0]
+        return float(self.lap.column(name)[first])
+
+    def last(self, name) -> float:
+        first, stop = self.parts[-1]
+        return float(self.lap.column(name)[stop - 1])
+
+    @property
+    def min_distance(self) -> float:
+        # the part after the finish line has the smaller distances
+        return float(min((self.lap.distance[first] for first, stop in self.parts), default=np.nan))
+
+    @property
+    def max_distance(self) -> float:
+        return float(max((self.lap.distance[stop - 1] for first, stop in self.parts), default=np.nan))
+
+    def time(self) -> float:
+        """Return the seconds spent in the section, the parts of a wrapped section added up."""
+        elapsed = self.lap.elapsed
+        return float(sum(elapsed[stop - 1] - elapsed[first] for first, stop in self.parts))
+
+    def lap_time(self) -> float:
+        """Return the difference of ``CurrentLapTime`` at the ends, like ``Analyzer.sector_lap_time``."""
+        end_lap_time = self.last("CurrentLapTime")
+        start_lap_time = self.first("CurrentLapTime")
+        if end_lap_time < start_lap_time:
+            start_lap_time = 0
+        return end_lap_time - start_lap_time
+
+    def to_df(self) -> pd.DataFrame:
+        names = self.lap.names()
+        return pd.DataFrame({name: self.column(name) for name in names})
+
+
+class LapArray:
+    def __init__(self, distance: np.ndarray, channels: Dict[str, np.ndarray], elapsed: Optional[np.ndarray] = None):
+        self.distance = np.ascontiguousarray(distance, dtype=np.float64)
+        self.channels = {name: np.ascontiguousarray(values, dtype=np.float64) for name, values in channels.items() if name != DISTANCE}
+        self.elapsed = self.elapsed_seconds() if elapsed is None else np.ascontiguousarray(elapsed, dtype=np.float64)
+
+    @classmethod
+    def from_df(cls, df: pd.DataFrame, columns=None) -> "LapArray":
+        """Build a lap of a dataframe resampled by distance, samples without a distance are dropped."""
+        distance = df[DISTANCE].to_numpy(dtype=np.float64, na_value=np.nan)
+        keep = ~np.isnan(distance)
+        order = np.flatnonzero(keep)
+        if len(order) and np.any(np.diff(distance[order]) < 0):
+            order = order[np.argsort(distance[order], kind="stable")]
+        columns = [name for name in (columns or df.columns) if name != DISTANCE and name in df.columns]
+        channels = {}
+        for name in columns:
+            values = df[name]
+            if not pd.api.types.is_numeric_dtype(values) or pd.api.types.is_bool_dtype(values):
+                continue
+            channels[name] = values.to_numpy(dtype=np.float64, na_value=np.nan)[order]
+        return cls(distance[order], channels)
+
+    def elapsed_seconds(self) -> np.ndarray:
+        """Return the seconds since the first sample, of ``Time`` in ns or of ``CurrentLapTime``."""
+        if not len(self.distance):
+            return np.zeros(0)
+        if "Time" in self.channels:
+            time = self.channels["Time"]
+            return (time - time[0]) / 1_000_000_000
+        if "CurrentLapTime" in self.channels:
+            lap_time = self.channels["CurrentLapTime"]
+            return lap_time - lap_time[0]
+        if "SpeedMs" in self.channels:
+            # the time to drive from sample to sample at the speed of the samples
+            speed = np.maximum(self.channels["SpeedMs"], 0.1)
+            elapsed = np.zeros(len(self.distance))
+            elapsed[1:] = np.cumsum(np.diff(self.distance) / speed[:-1])
+            return elapsed
+        return np.zeros(len(self.distance))
+
+    def __len__(self):
+        return len(self.distance)
+
+    @property
+    def empty(self):
+        return not len(self.distance)
+
+    def names(self) -> List[str]:
+        return [DISTANCE] + list(self.channels)
+
+    def column(self, name) -> np.ndarray:
+        if name == DISTANCE:
+            return self.distance
+        return self.channels[name]
+
+    def section(self, start, end) -> LapSection:
+        """Return the samples with ``start <= distance <= end``, wrapping around the finish line if ``end < start``."""
+        distance = self.distance
+        if end < start:
+            first = int(np.searchsorted(distance, start, side="left"))
+            zero = int(np.searchsorted(distance, 0, side="left"))
+            stop = int(np.searchsorted(distance, end, side="right"))
+            return LapSection(self, [(first, len(distance)), (zero, stop)])
+        first = int(np.searchsorted(distance, start, side="left"))
+        stop = int(np.searchsorted(distance, end, side="right"))
+        return LapSection(self, [(first, stop)])
+
+    def whole(self) -> LapSection:
+        return LapSection(self, [(0, len(self.distance))])
+
+    def to_df(self) -> pd.DataFrame:
+        return self.whole().to_df()
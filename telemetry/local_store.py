@@ -0,0 +1,332 @@
+"""A telemetry store in column files on local disk.
+
+Sessions are partitioned by lap, every column of a lap is a ``.npy`` file::
+
+    <directory>/<bucket>/<measurement>/<session_id>/manifest.json
+    <directory>/<bucket>/<measurement>/<session_id>/lap-<number>/<column>.npy
+
+The manifest lists the laps of a session with their rows, time span and
+columns. Reads only open the laps overlapping the query, the lap number and
+time range are matched against the manifest, and only the files of the
+columns asked for. Numbers and times are memory-mapped, nothing is parsed.
+
+* numbers and booleans keep their dtype
+* times are int64 nanoseconds since the epoch, UTC
+* strings, mostly tags, are int32 codes into a list of values kept in the
+  manifest, -1 is missing
+* other python objects are kept as json strings
+
+Laps and manifests are written to temporary files and renamed into place,
+writers of a session serialize on a lock file.
+"""
+
+import fcntl
+import json
+import os
+import re
+import shutil
+import tempfile
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from .telemetry_store import TelemetryStore, records
+
+MANIFEST = "manifest.json"
+# the columns of a CrewChief session which are not fields, always read like in influx
+TAGS = {"result", "table", "_start", "_stop", "_measurement", "host", "topic", "user", "CarModel", "CurrentLap", "GameName", "SessionId", "SessionTypeName", "TrackCode"}
+# the tags Influx.session_df drops with drop_tags
+DROPPED_TAGS = ["_start", "_stop", "_measurement", "host", "topic", "user"]
+DURATION_UNITS = {"y": "365D", "mo": "30D", "w": "7D", "d": "1D", "h": "1h", "m": "1min", "s": "1s", "ms": "1ms"}
+
+
+def time_ns(value, now=None) -> Optional[int]:
+    """Return a Flux time as nanoseconds since the epoch, None for an open end.
+
+    ``value`` is a datetime, an RFC3339 string, ``now()`` or a duration
+    relative to now like ``-10y`` or ``-1d``.
+    """
+    if value is None or value == "":
+        return None
+    if isinstance(value, str):
+        value = value.strip()
+        if value == "now()":
+            return pd.Timestamp(now or pd.Timestamp.now(tz="UTC")).value
+        match = re.fullmatch(r"-(\d+)(y|mo|w|d|h|m|s|ms)", value)
+        if match:
+            now = pd.Timestamp(now or pd.Timestamp.now(tz="UTC"))
+            return (now - int(match.group(1)) * pd.Timedelta(DURATION_UNITS[match.group(2)])).value
+    timestamp = pd.Timestamp(value)
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.tz_localize("UTC")
+    return timestamp.value
+
+
+class LocalStore(TelemetryStore):
+    def __init__(self, directory):
+        self.directory = directory
+
+    def session_path(self, session_id, measurement="laps_cc", bucket="racing"):
+        return os.path.join(self.directory, bucket, measurement, str(session_id))
+
+    # writing
+
+    @contextmanager
+    def locked(self, session_path):
+        os.makedirs(session_path, exist_ok=True)
+        with open(os.path.join(session_path, ".lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def manifest(self, session_path) -> Optional[dict]:
+        try:
+            with open(os.path.join(session_path, MANIFEST)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def write_manifest(self, session_path, manifest):
+        fd, tmp_path = tempfile.mkstemp(dir=session_path, prefix=".tmp-", suffix=".json")
+        with os.fdopen(fd, "w") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, os.path.join(session_path, MANIFEST))
+
+    def write_session_df(self, df, session_id, measurement="laps_cc", bucket="racing"):
+        """Store a session dataframe as returned by ``Influx.session_df``, one partition per lap."""
+        if "CurrentLap" not in df.columns:
+            self.write_lap(df, session_id, None, measurement=measurement, bucket=bucket)
+            return
+        for lap, lap_df in df.groupby(df["CurrentLap"].astype(str), sort=False):
+            self.write_lap(lap_df, session_id, lap, measurement=measurement, bucket=bucket)
+
+    def write_lap(self, df, session_id, lap, measurement="laps_cc", bucket="racing", append=False):
+        """Store the ticks of a lap, replacing a lap stored before or appending to it."""
+        lap = "none" if lap is None else str(lap)
+        session_path = self.session_path(session_id, measurement=measurement, bucket=bucket)
+        with self.locked(session_path):
+            if append:
+                entry = (self.manifest(session_path) or {"laps": {}})["laps"].get(lap)
+                if entry:
+                    df = pd.concat([self.read_lap(session_path, entry), df], ignore_index=True)
+            if "_time" in df.columns:
+                df = df.sort_values("_time")
+            tmp_path = tempfile.mkdtemp(dir=session_path, prefix=f".tmp-lap-{lap}-")
+            try:
+                entry = self.write_columns(tmp_path, df)
+            except Exception:
+                shutil.rmtree(tmp_path, ignore_errors=True)
+                raise
+            entry["path"] = f"lap-{lap}"
+            lap_path = os.path.join(session_path, entry["path"])
+            if os.path.exists(lap_path):
+                old_path = tempfile.mkdtemp(dir=session_path, prefix=".old-")
+                os.replace(lap_path, os.path.join(old_path, "lap"))
+                os.replace(tmp_path, lap_path)
+                shutil.rmtree(old_path, ignore_errors=True)
+            else:
+                os.replace(tmp_path, lap_path)
+
+            manifest = self.manifest(session_path) or {"session_id": str(session_id), "laps": {}}
+            manifest["laps"][lap] = entry
+            self.write_manifest(session_path, manifest)
+
+    def write_columns(self, path, df) -> dict:
+        columns: Dict[str, str] = {}
+        strings: Dict[str, List[str]] = {}
+        for name in df.columns:
+            kind, array, values = self.encode(df[name])
+            np.save(os.path.join(path, f"{name}.npy"), array, allow_pickle=False)
+            columns[name] = kind
+            if values is not None:
+                strings[name] = values
+        entry = {"rows": len(df), "columns": columns, "strings": strings, "start": None, "end": None}
+        if "_time" in df.columns and len(df):
+            times = np.load(os.path.join(path, "_time.npy"))
+            entry["start"], entry["end"] = int(times[0]), int(times[-1])
+        return entry
+
+    def encode(self, series):
+        dtype = series.dtype
+        if pd.api.types.is_datetime64_any_dtype(dtype):
+            return "datetime", pd.DatetimeIndex(series).as_unit("ns").asi8, None
+        if isinstance(dtype, np.dtype) and dtype.kind in "biuf":
+            return "number", series.to_numpy(), None
+        if pd.api.types.is_numeric_dtype(dtype) and not pd.api.types.is_bool_dtype(dtype):
+            # nullable extension types, missing values become nan
+            return "number", series.to_numpy(dtype=np.float64, na_value=np.nan), None
+        non_null = series.dropna()
+        if len(non_null) and not all(isinstance(value, str) for value in non_null):
+            # mixed python objects, e.g. booleans with gaps
+            series = series.map(lambda value: None if value is None or value != value else json.dumps(value))
+            kind = "json"
+        else:
+            kind = "string"
+        codes, values = pd.factorize(series, use_na_sentinel=True)
+        return kind, codes.astype(np.int32), [str(value) for value in values]
+
+    # reading
+
+    def laps(self, manifest, lap_numbers=None, start=None, end=None):
+        """Return the manifest entries of the laps overlapping the query, in time order."""
+        selected = []
+        wanted = None if not lap_numbers else {str(number) for number in lap_numbers}
+        for lap, entry in manifest["laps"].items():
+            if wanted is not None and lap not in wanted:
+                continue
+            if entry["start"] is not None:
+                if start is not None and entry["end"] < start:
+                    continue
+                if end is not None and entry["start"] > end:
+                    continue
+            selected.append(entry)
+        selected.sort(key=lambda entry: entry["start"] if entry["start"] is not None else 0)
+        return selected
+
+    def lap_columns(self, session_path, entry, columns=None) -> Dict[str, np.ndarray]:
+        """Return the columns of a lap as arrays, numbers and times (int64 ns) memory-mapped."""
+        data = {}
+        for name, kind in entry["columns"].items():
+            if columns is not None and name not in columns:
+                continue
+            array = np.load(os.path.join(session_path, entry["path"], f"{name}.npy"), mmap_mode="r", allow_pickle=False)
+            if kind in ("string", "json"):
+                values = entry["strings"].get(name, [])
+                if kind == "json":
+                    values = [json.loads(value) for value in values]
+                lookup = np.array(values + [None], dtype=object)
+                # -1, missing, picks the trailing None
+                array = lookup[np.asarray(array)]
+            data[name] = array
+        return data
+
+    def read_lap(self, session_path, entry, columns=None) -> pd.DataFrame:
+        data = self.lap_columns(session_path, entry, columns=columns)
+        for name, kind in entry["columns"].items():
+            if kind == "datetime" and name in data:
+                data[name] = pd.to_datetime(np.asarray(data[name]), unit="ns", utc=True)
+        return pd.DataFrame(data)
+
+    def read(self, session_id, measurement="laps_cc", bucket="racing", lap_numbers=None, start=None, end=None, columns=None) -> pd.DataFrame:
+        """Return the ticks of a session in time order, only the laps and columns asked for."""
+        session_path = self.session_path(session_id, measurement=measurement, bucket=bucket)
+        manifest = self.manifest(session_path)
+        if manifest is None:
+            return pd.DataFrame()
+        start, end = time_ns(start), time_ns(end)
+        frames = [self.read_lap(session_path, entry, columns=columns) for entry in self.laps(manifest, lap_numbers, start, end)]
+        frames = [frame for frame in frames if len(frame)]
+        if not frames:
+            return pd.DataFrame()
+        df = pd.concat(frames, ignore_index=True)
+        if "_time" in df.columns and (start is not None or end is not None):
+            times = pd.DatetimeIndex(df["_time"]).as_unit("ns").asi8
+            keep = np.ones(len(df), dtype=bool)
+            if start is not None:
+                keep &= times >= start
+            if end is not None:
+                keep &= times < end
+            df = df[keep]
+        return df
+
+    def tags(self, session_id, measurement="laps_cc", bucket="racing"):
+        """Return the tags and string columns of a session, they are always read like the tags of influx."""
+        manifest = self.manifest(self.session_path(session_id, measurement=measurement, bucket=bucket)) or {"laps": {}}
+        names = set(TAGS)
+        for entry in manifest["laps"].values():
+            names.update(name for name, kind in entry["columns"].items() if kind == "string")
+        return names
+
+    def aggregate(self, df, every):
+        """Keep the last value of every column per window, like aggregateWindow(fn: last)."""
+        window = pd.Timedelta(every).value
+        times = pd.DatetimeIndex(df["_time"]).as_unit("ns").asi8
+        # windows are stamped with their stop, like in influx
+        stops = (times // window + 1) * window
+        group = ["CurrentLap", "_window"] if "CurrentLap" in df.columns else ["_window"]
+        df = df.assign(_window=stops).groupby(group, sort=False, dropna=False).last().reset_index()
+        df["_time"] = pd.to_datetime(df.pop("_window"), unit="ns", utc=True)
+        return df
+
+    def session_df(
+        self,
+        session_id,
+        lap_number=None,
+        start="-1d",
+        end="now()",
+        measurement="laps_cc",
+        bucket="racing",
+        aggregate="",
+        fields=[],
+        drop_tags=False,
+    ):
+        columns = None
+        if fields:
+            columns = set(fields) | {"Gear", "_time"} | self.tags(session_id, measurement=measurement, bucket=bucket)
+        df = self.read(
+            session_id,
+            measurement=measurement,
+            bucket=bucket,
+            lap_numbers=[lap_number] if lap_number else None,
+            start=start,
+            end=end,
+            columns=columns,
+        )
+        if df.empty:
+            raise Exception(f"No data found for {session_id} lap {lap_number}")
+        if drop_tags:
+            df = df.drop(columns=DROPPED_TAGS, errors="ignore")
+        if aggregate:
+            df = self.aggregate(df, aggregate)
+        return self.finish_session_df(df)
+
+    def session(
+        self,
+        session_id=None,
+        lap=None,
+        lap_numbers=[],
+        start=None,
+        end=None,
+        measurement="laps_cc",
+        bucket="racing",
+        fields=[],
+    ):
+        if lap:
+            # the partition of the lap has all of it
+            session_id = lap.session.session_id
+            lap_numbers = [lap.number]
+            start, end = None, None
+        columns = None
+        if fields:
+            columns = set(fields) | {"_time"} | self.tags(session_id, measurement=measurement, bucket=bucket)
+        df = self.read(session_id, measurement=measurement, bucket=bucket, lap_numbers=lap_numbers, start=start, end=end, columns=columns)
+        yield from records(df)
+
+    def session_ids(self, measurement="fast_laps", bucket="racing"):
+        path = os.path.join(self.directory, bucket, measurement)
+        try:
+            names = os.listdir(path)
+        except FileNotFoundError:
+            return set()
+        return {name for name in names if os.path.exists(os.path.join(path, name, MANIFEST))}
+
+    def copy_session(self, session_id, start="-1d", end="now()", from_bucket="racing", to_bucket="fast_laps"):
+        source = self.session_path(session_id, measurement="laps_cc", bucket=from_bucket)
+        target = self.session_path(session_id, measurement="fast_laps", bucket=to_bucket)
+        with self.locked(source):
+            manifest = self.manifest(source)
+            if manifest is None:
+                return
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            tmp_path = tempfile.mkdtemp(dir=os.path.dirname(target), prefix=".tmp-")
+            for entry in manifest["laps"].values():
+                shutil.copytree(os.path.join(source, entry["path"]), os.path.join(tmp_path, entry["path"]))
+                if "_measurement" in entry["strings"]:
+                    entry["strings"]["_measurement"] = ["fast_laps" for value in entry["strings"]["_measurement"]]
+            self.write_manifest(tmp_path, manifest)
+        shutil.rmtree(target, ignore_errors=True)
+        os.replace(tmp_path, target)
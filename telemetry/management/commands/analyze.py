@@ -5,10 +5,10 @@ from loguru import logger
 
 from racing_telemetry import Telemetry
 from telemetry.fast_lap_analyzer import FastLapAnalyzer
-from telemetry.influx import Influx
 from telemetry.models import Driver, FastLap
 from telemetry.pitcrew.persister_db import PersisterDb
 from telemetry.racing_stats import RacingStats
+from telemetry.telemetry_store import telemetry_store
 
 
 class Command(BaseCommand):
@@ -77,7 +77,7 @@ class Command(BaseCommand):
     def handle_default(self, *args, **options):
         min_laps = 1
         max_laps = 10
-        influx = Influx()
+        influx = telemetry_store()
         racing_stats = RacingStats()
         influx_fast_sessions = set()
         from_bucket = options["from_bucket"]
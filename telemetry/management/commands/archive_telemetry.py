@@ -0,0 +1,39 @@
+import os
+
+from django.core.management.base import BaseCommand
+from rich.console import Console
+
+from telemetry.influx import Influx
+from telemetry.local_store import LocalStore
+from telemetry.models import Session
+
+
+class Command(BaseCommand):
+    help = "Copy session telemetry from influx into a local store, see telemetry/local_store.py"
+
+    def add_arguments(self, parser):
+        parser.add_argument("-s", "--session-ids", nargs="+", type=str, required=True, help="sessions to archive")
+        parser.add_argument("-d", "--directory", type=str, default=os.environ.get("B4MAD_RACING_TELEMETRY_STORE", ""), help="directory of the local store")
+        parser.add_argument("--bucket", type=str, default="racing")
+        parser.add_argument("--measurement", type=str, default="laps_cc")
+
+    def handle(self, *args, **options):
+        console = Console()
+        directory = options["directory"]
+        if not directory or directory == "influx":
+            console.print("[red] no directory given, set --directory or B4MAD_RACING_TELEMETRY_STORE")
+            return
+        store = LocalStore(directory)
+        influx = Influx(cache=False)
+        bucket = options["bucket"]
+        measurement = options["measurement"]
+
+        for session_id in options["session_ids"]:
+            session = Session.objects.filter(session_id=session_id).order_by("start").first()
+            start, end = influx.planner.span(session.start, session.end) if session else influx.planner.session(session_id)
+            df = influx.raw_session_df(session_id, start=start, end=end, measurement=measurement, bucket=bucket)
+            if df.empty:
+                console.print(f"[yellow] {session_id}: no telemetry in {bucket}/{measurement}")
+                continue
+            store.write_session_df(df, session_id, measurement=measurement, bucket=bucket)
+            console.print(f"[green] {session_id}: {len(df)} ticks archived")
@@ -0,0 +1,74 @@
+import json
+import os
+import timeit
+
+import numpy as np
+import pandas as pd
+from django.core.management.base import BaseCommand
+from rich.console import Console
+from rich.table import Table
+
+from telemetry.models import Session
+from telemetry.pitcrew.active_drivers import ActiveDrivers
+from telemetry.pitcrew.telemetry_decoder import (
+    JsonDecoder,
+    ProjectingDecoder,
+    ScanningDecoder,
+)
+
+DEFAULT_SESSION_FILE = os.path.join(os.path.dirname(__file__), "..", "..", "tests", "data", "session_1694266648_df.csv.gz")
+
+
+class Command(BaseCommand):
+    help = "Compare the MQTT telemetry decoders on recorded session payloads"
+
+    def add_arguments(self, parser):
+        parser.add_argument("-f", "--file", default=DEFAULT_SESSION_FILE, help="gzipped session csv to build payloads from")
+        parser.add_argument("-n", "--number", type=int, default=3, help="passes over all payloads per decoder")
+
+    def payloads(self, file_path):
+        df = pd.read_csv(file_path, compression="gzip", parse_dates=["_time"])
+        df = df.replace(np.nan, None)
+        # the same fields the replay command publishes
+        drop = ["result", "table", "_start", "_stop", "_time", "_measurement", "topic", "host", "CarModel", "GameName", "SessionId", "SessionTypeName", "TrackCode", "user"]
+        payloads = []
+        for record in df.to_dict("records"):
+            _time = int(record["_time"].timestamp() * 1000.0)
+            values = {key: value for key, value in record.items() if key not in drop}
+            payloads.append(json.dumps({"time": _time, "telemetry": values}).encode("utf-8"))
+        return payloads
+
+    def handle(self, *args, **options):
+        console = Console()
+        payloads = self.payloads(options["file"])
+        number = options["number"]
+
+        decoders = [
+            ("json (current)", JsonDecoder()),
+            ("projecting, ActiveDrivers", ProjectingDecoder(ActiveDrivers.telemetry_fields)),
+            ("scanning, ActiveDrivers", ScanningDecoder(ActiveDrivers.telemetry_fields)),
+            ("projecting, Session", ProjectingDecoder(Session.TELEMETRY_FIELDS)),
+            ("scanning, Session", ScanningDecoder(Session.TELEMETRY_FIELDS)),
+        ]
+
+        table = Table(title=f"{len(payloads)} payloads, {number} passes")
+        table.add_column("decoder")
+        table.add_column("fields", justify="right")
+        table.add_column("µs / payload", justify="right")
+        table.add_column("speedup", justify="right")
+
+        baseline = None
+        for name, decoder in decoders:
+            decode = decoder.decode
+
+            def run():
+                for payload in payloads:
+                    decode(payload)
+
+            seconds = min(timeit.repeat(run, number=1, repeat=number))
+            per_payload = seconds / len(payloads) * 1_000_000
+            baseline = baseline or per_payload
+            fields = len(getattr(decoder, "fields", ())) or "all"
+            table.add_row(name, str(fields), f"{per_payload:.2f}", f"{baseline / per_payload:.2f}x")
+
+        console.print(table)
@@ -0,0 +1,70 @@
+import os
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rich.console import Console
+from rich.table import Table
+
+STAGES = {
+    "on_message": "Mqtt.on_message, end to end",
+    "decode": "payload decoding",
+    "firehose": "ActiveDrivers.notify",
+    "start": "coach / persister startup",
+    "coach": "CoachCopilotsNoHistory.notify, incl. persister",
+    "persister": "PersisterDb.notify",
+    "flush": "on_stop flush",
+}
+
+
+class Command(BaseCommand):
+    help = "Benchmark the pitcrew ingestion pipeline with synthetic telemetry, no broker needed"
+
+    def add_arguments(self, parser):
+        parser.add_argument("-n", "--drivers", type=int, default=10, help="number of simulated drivers")
+        parser.add_argument("-s", "--seconds", type=int, default=10, help="simulated seconds of telemetry per driver")
+        parser.add_argument("--hz", type=int, default=60, help="ticks per second and driver")
+        parser.add_argument("-f", "--files", nargs="*", default=None, help="gzipped session csv files to replay, default: telemetry/tests/data")
+        parser.add_argument("--no-coach", action="store_true", help="only run the firehose and a persister per driver")
+        parser.add_argument("--keep", action="store_true", help="keep the sessions and laps written, they are rolled back by default")
+        parser.add_argument("--no-metrics", action="store_true", help="turn off the prometheus metrics, to measure their overhead")
+
+    def handle(self, *args, **options):
+        # the fake client never connects, but the mqtt module wants a host
+        os.environ.setdefault("MOSQUITTO_MQTT_SERVICE_HOST", "localhost")
+        from telemetry.pitcrew import metrics
+        from telemetry.pitcrew.load_generator import LoadGenerator, PipelineBenchmark
+
+        metrics.enabled = not options["no_metrics"]
+
+        console = Console()
+        generator = LoadGenerator(drivers=options["drivers"], seconds=options["seconds"], hz=options["hz"], files=options["files"])
+        console.print(f"{generator.drivers} drivers, {generator.seconds}s at {generator.hz}Hz: {generator.ticks()} ticks from {len(generator.sessions)} sessions, metrics {'on' if metrics.enabled else 'off'}")
+
+        with transaction.atomic():
+            benchmark = PipelineBenchmark(generator, coach=not options["no_coach"])
+            results = benchmark.run()
+            if not options["keep"]:
+                transaction.set_rollback(True)
+
+        table = Table(title="latency per stage (ms)")
+        table.add_column("stage")
+        table.add_column("count", justify="right")
+        for column in ["p50", "p90", "p99", "max", "total"]:
+            table.add_column(column, justify="right")
+        for stage, description in STAGES.items():
+            stats = results["stages"].get(stage)
+            if not stats:
+                continue
+            table.add_row(
+                description,
+                str(stats["count"]),
+                *[f"{stats[column]:.3f}" for column in ["p50", "p90", "p99", "max"]],
+                f"{stats['total']:.0f}",
+            )
+        console.print(table)
+
+        console.print(f"ticks/s: {results['ticks_per_second']:.0f} ({results['ticks']} ticks in {results['seconds']:.1f}s)")
+        console.print(f"drivers at {generator.hz}Hz one process keeps up with: {results['driver_capacity']:.1f}")
+        console.print(f"db queries/tick: {results['queries_per_tick']:.3f} ({results['queries']} queries)")
+        console.print(f"db queries per simulated second: {results['queries_per_simulated_second']:.1f}, write-behind flushes follow the simulated clock")
+        console.print(f"messages published: {results['published']}")
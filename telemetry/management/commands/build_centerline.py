@@ -0,0 +1,60 @@
+from django.core.management.base import BaseCommand
+from rich.console import Console
+
+from telemetry.centerline import VERSION, lap_positions
+from telemetry.models import Lap, Track, TrackCenterline
+from telemetry.telemetry_store import LAP_SOURCES, telemetry_store
+
+
+class Command(BaseCommand):
+    help = "Build the centerline of tracks from the positions of their fastest valid laps, see telemetry/centerline.py"
+
+    def add_arguments(self, parser):
+        parser.add_argument("-t", "--track-ids", nargs="*", type=int, default=[], help="tracks to build, all tracks with laps if not given")
+        parser.add_argument("-g", "--game", type=str, default="", help="only tracks of this game")
+        parser.add_argument("-l", "--laps", type=int, default=10, help="the number of laps to merge")
+        parser.add_argument("--min-length", type=float, default=0.95, help="merge only laps at least this share of the track length long")
+        parser.add_argument("--step", type=float, default=1.0, help="meters between the points of the centerline")
+        parser.add_argument("--force", action="store_true", help="build centerlines of the current version again")
+
+    def laps(self, track, count, min_length=0.95):
+        """Return the ``count`` fastest valid laps of a track completed over ``min_length`` of its length."""
+        # short, aborted and unfinished laps are the fastest, they must not bend the line
+        laps = Lap.objects.filter(track=track, valid=True, completed=True, time__gt=0, length__gte=track.length * min_length)
+        return list(laps.select_related("session", "session__game", "track", "car").order_by("time")[:count])
+
+    def handle(self, *args, **options):
+        console = Console()
+        tracks = Track.objects.all()
+        if options["track_ids"]:
+            tracks = tracks.filter(id__in=options["track_ids"])
+        if options["game"]:
+            tracks = tracks.filter(game__name=options["game"])
+
+        store = telemetry_store()
+        for track in tracks.select_related("game"):
+            if not options["force"] and TrackCenterline.objects.filter(track=track, version=VERSION).exists():
+                console.print(f"[yellow] {track.game} - {track}: centerline v{VERSION} exists")
+                continue
+            laps = self.laps(track, options["laps"], options["min_length"])
+            if not laps:
+                console.print(f"[yellow] {track.game} - {track}: no completed laps of {track.length}m")
+                continue
+
+            positions = []
+            for lap, df in store.iter_lap_telemetry(laps, sources=LAP_SOURCES):
+                if df is None or "WorldPosition_x" not in df.columns or "WorldPosition_z" not in df.columns:
+                    continue
+                distances, points = lap_positions(df, track.game.name)
+                if len(distances) > 1:
+                    positions.append((distances, points))
+            if not positions:
+                console.print(f"[yellow] {track.game} - {track}: no laps with positions")
+                continue
+
+            try:
+                stored = TrackCenterline.build(track, positions, step=options["step"])
+            except ValueError as e:
+                console.print(f"[red] {track.game} - {track}: {e}")
+                continue
+            console.print(f"[green] {track.game} - {track}: {stored}")
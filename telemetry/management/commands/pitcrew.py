@@ -1,13 +1,17 @@
 import os
+import signal
 import sys
 import threading
 
 from django.core.management.base import BaseCommand
-from flask import Flask
+from flask import Flask, Response
 from flask_healthz import healthz
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 
 from telemetry.models import Coach, Driver, FastLap
+from telemetry.pitcrew import metrics
 from telemetry.pitcrew.crew import Crew
+from telemetry.pitcrew.dimension_cache import dimension_cache
 from telemetry.pitcrew.kube_crew import KubeCrew
 
 
@@ -21,6 +25,24 @@ class Command(BaseCommand):
         parser.add_argument("-s", "--session-saver", action="store_true")
         parser.add_argument("-n", "--no-save", action="store_true")
         parser.add_argument("-d", "--delete-driver-fastlaps", action="store_true")
+        parser.add_argument(
+            "--coach-runtime",
+            choices=["kube", "asyncio"],
+            default=os.getenv("B4MAD_RACING_COACH_RUNTIME", "kube"),
+            help="run the coaches in a deployment per driver (kube) or all in this process (asyncio)",
+        )
+        parser.add_argument(
+            "--shards",
+            type=int,
+            default=int(os.getenv("B4MAD_RACING_FIREHOSE_SHARDS", 0)),
+            help="spread the firehose over this many worker processes, partitioned by driver",
+        )
+        parser.add_argument(
+            "--archive",
+            type=str,
+            default=os.getenv("B4MAD_RACING_TICK_ARCHIVE", ""),
+            help="archive the raw ticks per lap in this directory, see telemetry/pitcrew/tick_archive.py",
+        )
 
     def handle(self, *args, **options):
         if options["delete_driver_fastlaps"]:
@@ -28,7 +50,12 @@ class Command(BaseCommand):
             FastLap.objects.filter(driver__isnull=False).delete()
             return
 
-        crew = Crew(save=(not options["no_save"]), replay=options["replay"])
+        # load games, cars, tracks and session types once, so new sessions need no lookups
+        dimension_cache.warm_up()
+        # the pitcrew stages are served on /metrics of this process only
+        metrics.register()
+
+        crew = Crew(save=(not options["no_save"]), replay=options["replay"], coach_runtime=(options["coach_runtime"] == "asyncio"), shards=options["shards"], archive=options["archive"])
 
         # Check if the B4MAD_RACING_COACH environment variable is set
         env_coach = os.getenv("B4MAD_RACING_COACH")
@@ -50,7 +77,9 @@ class Command(BaseCommand):
             # Start the coach for the specified driver
             driver, created = Driver.objects.get_or_create(name=coach_name)
             coach, created = Coach.objects.get_or_create(driver=driver)
-            crew.coach_watcher.start_coach_no_history(driver.name, coach, debug=True)
+            mqtt = crew.coach_watcher.start_coach_no_history(driver.name, coach, debug=True)
+            # a deleted coach deployment gets SIGTERM, stopping the client writes the pending laps
+            signal.signal(signal.SIGTERM, lambda signum, frame: mqtt.stop())
             # if driver.name == "durandom":
             # else:
             #     crew.coach_watcher.start_coach(driver.name, coach, debug=True)
@@ -63,6 +92,10 @@ class Command(BaseCommand):
         #     t.name = "session_saver"
         #     t.start()
         else:
+            # the shard processes must be forked before the flask thread exists
+            if crew.sharded_firehose:
+                crew.sharded_firehose.start()
+
             # Start the coach watcher, which will start the coach for each driver
             if not crew.replay and not options["no_save"]:
 
@@ -70,6 +103,11 @@ class Command(BaseCommand):
                     app = Flask(__name__)
                     app.register_blueprint(healthz, url_prefix="/healthz")
                     app.config["HEALTHZ"] = {"live": crew.live, "ready": crew.ready}
+
+                    @app.route("/metrics")
+                    def metrics():
+                        return Response(generate_latest(), mimetype=CONTENT_TYPE_LATEST)
+
                     app.run(host="0.0.0.0", port=8080, debug=False, use_reloader=False)
 
                 flask_thread = threading.Thread(target=start_flask)
@@ -12,8 +12,9 @@ from rich.console import Console
 from rich.progress import Progress, TextColumn
 from rich.table import Column
 
-from telemetry.influx import Influx
 from telemetry.models import Lap
+from telemetry.replay_source import clock, record_ticks, replay_source
+from telemetry.telemetry_store import telemetry_store
 # from telemetry.pitcrew.firehose import Firehose
 # from telemetry.pitcrew.session_saver import SessionSaver
 
@@ -67,6 +68,18 @@ class Command(BaseCommand):
             default=0.001,
             help="seconds to sleep between messages",
         )
+        parser.add_argument(
+            "--speed",
+            type=float,
+            default=None,
+            help="replay in real time times this factor, 0 is as fast as possible, overrides --wait",
+        )
+        parser.add_argument(
+            "--archive",
+            type=str,
+            default="",
+            help="replay from the local telemetry store in this directory, see telemetry/replay_source.py",
+        )
         parser.add_argument("--live", action="store_true")
         parser.add_argument("--firehose", action="store_true")
         parser.add_argument("--start", type=str, default=None)
@@ -79,7 +92,7 @@ class Command(BaseCommand):
         parser.add_argument("--keep-session-id", action="store_true")
 
     def handle(self, *args, **options):
-        influx = Influx()
+        influx = telemetry_store()
         self.live = options["live"]
         self.console = Console()
         text_column = TextColumn(
@@ -96,6 +109,8 @@ class Command(BaseCommand):
         self.session_save_thread = None
         bucket = options["bucket"]
         measurement = options["measurement"]
+        # archived sessions are replayed from their column files
+        source = replay_source(influx, options["archive"])
 
         if options["firehose"]:
             self.firehose = Firehose()
@@ -117,14 +132,26 @@ class Command(BaseCommand):
 
         if options["session_ids"]:
             for session_id in options["session_ids"]:
-                session = influx.session(
-                    session_id=session_id,
-                    lap_numbers=options["lap_numbers"],
-                    start=options["start"],
-                    end=options["end"],
-                    bucket=bucket,
-                    measurement=measurement,
-                )
+                if source:
+                    ticks = source.session(
+                        session_id,
+                        lap_numbers=options["lap_numbers"],
+                        start=options["start"],
+                        end=options["end"],
+                        bucket=bucket,
+                        measurement=measurement,
+                    )
+                else:
+                    ticks = record_ticks(
+                        influx.session(
+                            session_id=session_id,
+                            lap_numbers=options["lap_numbers"],
+                            start=options["start"],
+                            end=options["end"],
+                            bucket=bucket,
+                            measurement=measurement,
+                        )
+                    )
                 if options["new_session_id"]:
                     new_session_id = options["new_session_id"]
                 else:
@@ -134,31 +161,37 @@ class Command(BaseCommand):
         elif options["lap_ids"]:
             for lap_id in options["lap_ids"]:
                 lap = Lap.objects.get(id=lap_id)
-                session = influx.session(
-                    lap=lap,
-                    bucket=bucket,
-                    measurement=measurement,
-                )
+                if source:
+                    ticks = source.session(lap.session.session_id, lap_numbers=[lap.number], bucket=bucket, measurement=measurement)
+                else:
+                    ticks = record_ticks(influx.session(lap=lap, bucket=bucket, measurement=measurement))
                 if options["new_session_id"]:
                     new_session_id = options["new_session_id"]
                 else:
                     new_session_id = int(time.time())
                 msg = f"[green] Replaying lap_id {lap_id} as new session {new_session_id}"
                 self.progress.console.print(msg)
+        elif source:
+            ticks = source.stream(start=options["start"], end=options["end"], bucket=bucket, measurement=measurement)
+            new_session_id = None
+            msg = f"[green] Replaying from start {options['start']} to end {options['end']}"
+            self.progress.console.print(msg)
         else:
-            session = influx.raw_stream(
-                start=options["start"],
-                end=options["end"],
-                bucket=bucket,
-                measurement=measurement,
-                delta=options["delta"],
+            ticks = record_ticks(
+                influx.raw_stream(
+                    start=options["start"],
+                    end=options["end"],
+                    bucket=bucket,
+                    measurement=measurement,
+                    delta=options["delta"],
+                )
             )
             new_session_id = None
             msg = f"[green] Replaying from start {options['start']} to end {options['end']}"
             self.progress.console.print(msg)
 
         with self.progress:
-            self.replay(session, wait=options["wait"], new_session_id=new_session_id)
+            self.replay(ticks, clock(options["speed"], options["wait"]), new_session_id=new_session_id)
 
         if self.session_save_thread:
             self.session_saver.stop()
@@ -175,9 +208,8 @@ class Command(BaseCommand):
         payload_string = json.dumps(payload)
         self.mqttc.publish(topic, payload=str(payload_string), qos=0, retain=False)
 
-    def replay(self, session, wait=0.001, new_session_id=None):
-        # epoch = datetime.datetime.utcfromtimestamp(0)
-
+    def replay(self, ticks, clock, new_session_id=None):
+        """Publish (topic, time_ns, telemetry) ticks, paced by the clock."""
         prev_payload = {"telemetry": {}}
         monitor_fields = [
             "LapTimePrevious",
@@ -190,39 +222,10 @@ class Command(BaseCommand):
         for field in monitor_fields:
             monitor_fields_in_payload[field] = True
         line_count = 0
-        for record in session:
-            topic = record["topic"]
-            _time = record["_time"]
-            values = record.values.copy()
-            for key in [
-                "result",
-                "table",
-                "_start",
-                "_stop",
-                "_time",
-                "_measurement",
-                "topic",
-                "host",
-            ]:
-                del values[key]
-
-            for key in [
-                "CarModel",
-                "GameName",
-                "SessionId",
-                "SessionTypeName",
-                "TrackCode",
-                "user",
-            ]:
-                del values[key]
-
-            # publish to mqtt
-            # convert _time to seconds
-
-            # _time = (_time - epoch).total_seconds() * 1000.0
-            _time = int(_time.timestamp() * 1000.0)
+        for topic, time_ns, values in ticks:
+            clock.wait(time_ns)
             payload = {
-                "time": _time,
+                "time": time_ns // 1_000_000,
                 "telemetry": values,
             }
             (
@@ -277,4 +280,3 @@ class Command(BaseCommand):
                         self.progress.console.print(msg)
             self.observer(topic, payload)
             prev_payload = payload
-            time.sleep(wait)
@@ -1,4 +1,5 @@
 import logging
+import os
 import time
 
 from django.core.management.base import BaseCommand
@@ -6,8 +7,10 @@ from rich.console import Console
 from rich.progress import Progress, TextColumn
 from rich.table import Column
 
-from telemetry.influx import Influx
+from telemetry.backfill import Backfill
 from telemetry.models import Lap
+from telemetry.replay_source import clock, record_ticks, replay_source
+from telemetry.telemetry_store import telemetry_store
 
 
 class Command(BaseCommand):
@@ -54,26 +57,52 @@ class Command(BaseCommand):
             default=0.001,
             help="seconds to sleep between messages",
         )
+        parser.add_argument(
+            "--speed",
+            type=float,
+            default=None,
+            help="replay in real time times this factor, 0 is as fast as possible, overrides --wait",
+        )
+        parser.add_argument(
+            "--archive",
+            type=str,
+            default="",
+            help="replay from the local telemetry store in this directory, see telemetry/replay_source.py",
+        )
+        parser.add_argument("--backfill", action="store_true", help="recompute the laps and segments of the sessions in a process pool, see telemetry/backfill.py")
+        parser.add_argument("--workers", type=int, default=os.cpu_count(), help="processes of the backfill")
+        parser.add_argument("--checkpoint", type=str, default=None, help="file of the finished sessions, a backfill resumes from it")
         parser.add_argument("--live", action="store_true")
         parser.add_argument("--start", type=str, default=None)
         parser.add_argument("--end", type=str, default=None)
 
     def handle(self, *args, **options):
-        influx = Influx()
+        influx = telemetry_store()
         self.live = options["live"]
         self.console = Console()
         text_column = TextColumn("{task.fields[meters]}", table_column=Column(ratio=1))
         # bar_column = BarColumn(bar_width=None, table_column=Column(ratio=2))
         self.progress = Progress(text_column, expand=True)
         self.task = self.progress.add_task("Replaying", total=100, meters=0, topic="")
+        # archived sessions are replayed from their column files
+        source = replay_source(influx, options["archive"])
+        if options["backfill"]:
+            self.backfill(influx, source, options)
+            return
+        replay_clock = clock(options["speed"], options["wait"])
         if options["session_ids"]:
             for session_id in options["session_ids"]:
-                session = influx.session(
-                    session_id=session_id,
-                    lap_numbers=options["lap_numbers"],
-                    start=options["start"],
-                    end=options["end"],
-                )
+                if source:
+                    ticks = source.session(session_id, lap_numbers=options["lap_numbers"], start=options["start"], end=options["end"])
+                else:
+                    ticks = record_ticks(
+                        influx.session(
+                            session_id=session_id,
+                            lap_numbers=options["lap_numbers"],
+                            start=options["start"],
+                            end=options["end"],
+                        )
+                    )
                 if options["new_session_id"]:
                     new_session_id = options["new_session_id"]
                 else:
@@ -82,21 +111,51 @@ class Command(BaseCommand):
                 self.progress.console.print(msg)
 
                 with self.progress:
-                    self.replay(session, wait=options["wait"], new_session_id=new_session_id)
+                    self.replay(ticks, replay_clock, new_session_id=new_session_id)
         elif options["lap_ids"]:
             for lap_id in options["lap_ids"]:
                 lap = Lap.objects.get(id=lap_id)
-                session = influx.session(lap=lap)
+                if source:
+                    ticks = source.session(lap.session.session_id, lap_numbers=[lap.number])
+                else:
+                    ticks = record_ticks(influx.session(lap=lap))
                 if options["new_session_id"]:
                     new_session_id = options["new_session_id"]
                 else:
                     new_session_id = int(time.time())
                 logging.info(f"Replaying lap_id {lap_id} as new session {new_session_id}")
-                self.replay(session, wait=options["wait"], new_session_id=new_session_id)
+                self.replay(ticks, replay_clock, new_session_id=new_session_id)
+        elif source:
+            self.replay(source.stream(start=options["start"], end=options["end"]), replay_clock, new_session_id=int(time.time()))
         else:
-            self.replay(session, wait=options["wait"], new_session_id=new_session_id)
+            self.console.print("[red] give --session-ids or --lap-ids, or --archive to replay a time range")
+
+    def backfill(self, influx, source, options):
+        session_ids = options["session_ids"]
+        if not session_ids:
+            store = source.store if source else influx
+            session_ids = sorted(store.session_ids(measurement="laps_cc", bucket="racing"))
+        backfill = Backfill(workers=options["workers"], checkpoint=options["checkpoint"], archive=options["archive"])
+        pending = backfill.pending(session_ids)
+        self.console.print(f"[green] Backfilling {len(pending)} of {len(session_ids)} sessions with {backfill.workers} workers")
+        started = time.perf_counter()
+
+        def progress(result):
+            if result["status"] == "done":
+                self.console.print(f"{result['session_id']}: {result['ticks']} ticks in {result['seconds']}s")
+            elif result["status"] == "empty":
+                self.console.print(f"[yellow]{result['session_id']}: no ticks")
+            else:
+                self.console.print(f"[red]{result['session_id']}: {result['error']}")
+
+        results = backfill.run(pending, progress=progress)
+        ticks = sum(result["ticks"] for result in results)
+        seconds = time.perf_counter() - started
+        failed = sum(1 for result in results if result["status"] == "failed")
+        empty = sum(1 for result in results if result["status"] == "empty")
+        self.console.print(f"[green] {len(results)} sessions, {ticks} ticks in {seconds:.1f}s, {ticks / max(seconds, 1e-9):.0f} ticks/s, {failed} failed, {empty} without ticks")
 
-    def replay(self, session, wait=0.001, new_session_id=None):
+    def replay(self, ticks, clock, new_session_id=None):
         prev_payload = {"telemetry": {}}
         monitor_fields = [
             "LapTimePrevious",
@@ -106,39 +165,10 @@ class Command(BaseCommand):
             # "CurrentLapTime",
         ]
         line_count = 0
-        for record in session:
-            topic = record["topic"]
-            _time = record["_time"]
-            values = record.values.copy()
-            for key in [
-                "result",
-                "table",
-                "_start",
-                "_stop",
-                "_time",
-                "_measurement",
-                "topic",
-                "host",
-            ]:
-                del values[key]
-
-            for key in [
-                "CarModel",
-                "GameName",
-                "SessionId",
-                "SessionTypeName",
-                "TrackCode",
-                "user",
-            ]:
-                del values[key]
-
-            # publish to mqtt
-            # convert _time to seconds
-
-            # _time = (_time - epoch).total_seconds() * 1000.0
-            _time = int(_time.timestamp() * 1000.0)
+        for topic, time_ns, values in ticks:
+            clock.wait(time_ns)
             payload = {
-                "time": _time,
+                "time": time_ns // 1_000_000,
                 "telemetry": values,
             }
             (
@@ -174,4 +204,3 @@ class Command(BaseCommand):
 
             # mqttc.publish(topic, payload=str(payload_string), qos=0, retain=False)
             prev_payload = payload
-            time.sleep(wait)
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:39
+
+import django.db.models.deletion
+import django.utils.timezone
+import model_utils.fields
+import picklefield.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("telemetry", "0034_lap_official_time"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TrackCenterline",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("created", model_utils.fields.AutoCreatedField(default=django.utils.timezone.now, editable=False, verbose_name="created")),
+                ("modified", model_utils.fields.AutoLastModifiedField(default=django.utils.timezone.now, editable=False, verbose_name="modified")),
+                ("version", models.IntegerField(default=1)),
+                ("laps", models.IntegerField(default=0)),
+                ("length", models.FloatField(default=0)),
+                ("data", picklefield.fields.PickledObjectField(editable=False, null=True)),
+                ("track", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="centerlines", to="telemetry.track")),
+            ],
+            options={
+                "ordering": ["track", "-version"],
+                "unique_together": {("track", "version")},
+            },
+        ),
+    ]
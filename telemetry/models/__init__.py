@@ -8,7 +8,7 @@ from .landmark import Landmark
 from .lap import Lap  # noqa F401
 from .segment import ReferenceSegment, Segment  # noqa F401
 from .session import Session  # noqa F401
-from .track import Track  # noqa F401
+from .track import Track, TrackCenterline  # noqa F401
 
 
 class Driver(ExportModelOperationsMixin("driver"), TimeStampedModel):
@@ -2,7 +2,7 @@ from django.db import models
 from loguru import logger
 from model_utils.models import TimeStampedModel
 
-from racing_telemetry.analysis import Streaming as StreamingAnalysis
+from telemetry.segment_features import SegmentFeatures
 
 
 class Segment(TimeStampedModel):
@@ -39,6 +39,9 @@ class Segment(TimeStampedModel):
     coasting_time = models.PositiveIntegerField(null=True, help_text="Time spent coasting in this segment", verbose_name="Coasting Time in centiseconds")
     launch_wheel_slip_time = models.PositiveIntegerField(null=True, help_text="Duration of wheel slip during launch in centiseconds", verbose_name="Launch Wheel Slip Duration in centiseconds")
 
+    # the telemetry fields read by the streaming analysis
+    TELEMETRY_FIELDS = ("CurrentLapTime", "WorldPosition_x", "WorldPosition_y", "Throttle", "Brake", "SpeedMs", "DistanceRoundTrack")
+
     def __str__(self):
         return f"Segment for Lap {self.lap.number} - Landmark: {self.landmark.name}"
 
@@ -48,27 +51,26 @@ class Segment(TimeStampedModel):
         return ", ".join([f"{field.name}: {getattr(self, field.name)}" for field in self._meta.fields if getattr(self, field.name) is not None and field.name not in excluded_fields])
 
     def prepare_for_analysis(self):
-        self.streaming_analysis = StreamingAnalysis(
-            coasting_time=True,
-            braking_point=True,
-            lift_off_point=True,
-            apex=True,
-            launch_wheel_slip_time=True,
-        )
+        # the ticks of the segment, the features are computed from them on demand
+        self.analysis = SegmentFeatures()
 
     def analyze(self, telemetry, distance):
-        self.streaming_analysis.notify(telemetry)
+        self.analysis.append(telemetry)
+
+    def analyze_batch(self, values, indices):
+        """Analyze the ticks at ``indices`` of the (list, floats) columns of ``Session.signal_batch``."""
+        self.analysis.extend({name: values[name][1][indices] for name in self.TELEMETRY_FIELDS if name in values})
 
     def finalize_analysis(self):
-        features = self.streaming_analysis.get_features()
-        self.streaming_analysis.calculate_apex()
+        features = self.analysis.get_features()
+        apex = self.analysis.apex()
         self.coasting_time = int(features["coasting_time"] * 100)
         if features["braking_point"] > 0:
             self.braking_point = int(features["braking_point"] * 100)
         if features["lift_off_point"] > 0:
             self.lift_off_point = int(features["lift_off_point"] * 100)
-        if features["apex"] > 0:
-            self.apex = int(features["apex"] * 100)
+        if apex > 0:
+            self.apex = int(apex * 100)
         if features["launch_wheel_slip_time"] > 0:
             self.launch_wheel_slip_time = int(features["launch_wheel_slip_time"] * 100)
 
@@ -3,6 +3,7 @@ from __future__ import annotations
 from typing import Optional
 
 import django.utils.timezone
+import numpy as np
 from dirtyfields import DirtyFieldsMixin
 from django.db import models
 from django_prometheus.models import ExportModelOperationsMixin
@@ -15,6 +16,27 @@ from .segment import Segment
 from .track import Track
 
 
+def batch_values(column):
+    """Return the values of a column as a list, missing values None, and as floats, missing values nan."""
+    array = np.asarray(column)
+    if array.dtype.kind in "biuf":
+        floats = array.astype(np.float64)
+        values = array.tolist()
+        if array.dtype.kind == "f":
+            missing = np.isnan(floats)
+            if missing.any():
+                values = [None if gap else value for value, gap in zip(values, missing.tolist())]
+        return values, floats
+    values = [None if value is None or value != value else value for value in array.tolist()]
+    floats = np.full(len(values), np.nan)
+    for index, value in enumerate(values):
+        try:
+            floats[index] = float(value)
+        except (TypeError, ValueError):
+            pass
+    return values, floats
+
+
 class Session(ExportModelOperationsMixin("session"), DirtyFieldsMixin, TimeStampedModel):
     session_id = models.CharField(max_length=200)
     start = models.DateTimeField(default=django.utils.timezone.now)
@@ -34,13 +56,20 @@ class Session(ExportModelOperationsMixin("session"), DirtyFieldsMixin, TimeStamp
             "game",
         )
 
+    write_behind = None
+
+    # the telemetry fields read by signal, including the segment analysis
+    TELEMETRY_FIELDS = ("CurrentLap", "LapTimePrevious", "CurrentLapIsValid", "PreviousLapWasValid") + Segment.TELEMETRY_FIELDS
+
     def __str__(self):
         return self.session_id
 
     def analyze(self, telemetry, now) -> None:
         raise Exception("Call 'prepare_for_analysis' first")
 
-    def prepare_for_analysis(self):
+    def prepare_for_analysis(self, write_behind=None):
+        # when set, dirty rows are handed to the write-behind instead of being saved right away
+        self.write_behind = write_behind
         self.current_lap_time = -1
         self.distance_round_track = 1_000_000_000
         self.current_lap: Optional[Lap] = None
@@ -57,13 +86,21 @@ class Session(ExportModelOperationsMixin("session"), DirtyFieldsMixin, TimeStamp
             self.analyze = self.analyze_other
 
     def save_analysis(self):
-        self.save_dirty_fields()
+        self.save_instance(self)
         if self.current_lap:
-            self.current_lap.save_dirty_fields()
+            self.save_instance(self.current_lap)
         if self.current_segment:
             self.current_segment.finalize_analysis()
             logger.debug(f"Saving segment: {self.current_segment.features_str()}")
-            self.current_segment.save()
+            self.save_instance(self.current_segment)
+
+    def save_instance(self, instance):
+        if self.write_behind is not None:
+            self.write_behind.add(instance)
+        elif isinstance(instance, DirtyFieldsMixin):
+            instance.save_dirty_fields()
+        else:
+            instance.save()
 
     def signal(self, telemetry, now=None):
         now = now or django.utils.timezone.now()
@@ -72,6 +109,97 @@ class Session(ExportModelOperationsMixin("session"), DirtyFieldsMixin, TimeStamp
         self.analyze_segment(telemetry, now)
         # FIXME: also save analysis on crossing the finish line
 
+    def signal_batch(self, columns, times):
+        """Signal a block of ticks, with the same result as calling ``signal`` for every tick.
+
+        ``columns`` maps the telemetry fields to the values of the ticks, missing
+        values are None or nan, ``times`` are the datetimes of the ticks.
+
+        Ticks which change something, the first tick, invalid ticks, finish
+        line crossings, lap number and LapTimePrevious changes and landmark
+        transitions, go through ``signal``. The runs of ticks between them only
+        extend the current lap and feed the current segment, that is done for
+        the whole run at once.
+        """
+        rows = len(times)
+        if not rows:
+            return
+        values = {name: batch_values(columns[name]) for name in self.TELEMETRY_FIELDS if name in columns}
+
+        def tick(index):
+            return {name: column[0][index] for name, column in values.items()}
+
+        required = ("DistanceRoundTrack", "CurrentLap", "CurrentLapTime", "LapTimePrevious", "CurrentLapIsValid", "PreviousLapWasValid")
+        if self.analyze != self.analyze_other or not all(name in values for name in required):
+            for index in range(rows):
+                self.signal(tick(index), times[index])
+            return
+
+        distance = values["DistanceRoundTrack"][1]
+        current_lap = values["CurrentLap"][1]
+        lap_time_previous = values["LapTimePrevious"][1]
+        valid = ~(np.isnan(distance) | np.isnan(current_lap) | np.isnan(values["CurrentLapTime"][1]) | np.isnan(values["CurrentLapIsValid"][1]))
+
+        event = ~valid
+        event[0] = True
+        event[1:] |= ~valid[:-1]
+        event[1:] |= (distance[1:] < distance[:-1]) & (distance[1:] < 100)
+        event[1:] |= current_lap[1:] != current_lap[:-1]
+        event[1:] |= ~((lap_time_previous[1:] == lap_time_previous[:-1]) | (np.isnan(lap_time_previous[1:]) & np.isnan(lap_time_previous[:-1])))
+        events = np.flatnonzero(event)
+
+        index = 0
+        while index < rows:
+            if event[index]:
+                self.signal(tick(index), times[index])
+                index += 1
+                continue
+            next_event = np.searchsorted(events, index)
+            end = events[next_event] if next_event < len(events) else rows
+            stop = self.signal_run(values, times, index, end)
+            index = stop
+            if stop < end:
+                # a landmark transition
+                self.signal(tick(stop), times[stop])
+                index += 1
+
+    def signal_run(self, values, times, start, end) -> int:
+        """Signal the valid ticks start to end, which cross no line, return where a new landmark starts."""
+        distances = values["DistanceRoundTrack"][1][start:end]
+        stop = end
+        inside = None
+        if self.current_lap and self.track:
+            landmark = self.current_landmark
+            if landmark:
+                inside = (landmark.start <= distances) & (distances <= landmark.end)
+            else:
+                inside = np.zeros(len(distances), dtype=bool)
+            outside = np.flatnonzero(~inside)
+            if len(outside):
+                found = np.flatnonzero(self.track.landmark_index().numbers(distances[outside]) >= 0)
+                if len(found):
+                    stop = start + int(outside[found[0]])
+        if stop == start:
+            return stop
+
+        last = stop - 1
+        distance = values["DistanceRoundTrack"][0]
+        if self.current_lap:
+            longest = start + int(np.argmax(distances[: stop - start]))
+            if distance[longest] > self.current_lap.length:
+                self.current_lap.length = distance[longest]
+            self.current_lap.valid = values["CurrentLapIsValid"][0][last]
+            self.current_lap.time = values["CurrentLapTime"][0][last]
+        self.end = times[last]
+        self.telemetry_valid = True
+        self.previous_distance = distance[last]
+        self.previous_lap_time = values["CurrentLapTime"][0][last]
+        self.previous_lap_time_previous = values["LapTimePrevious"][0][last]
+
+        if inside is not None and self.current_segment:
+            self.current_segment.analyze_batch(values, start + np.flatnonzero(inside[: stop - start]))
+        return stop
+
     def analyze_segment(self, telemetry, now):
         if not self.current_lap or not self.track:
             return
@@ -111,7 +239,7 @@ class Session(ExportModelOperationsMixin("session"), DirtyFieldsMixin, TimeStamp
         self.previous_lap = self.current_lap
         if self.previous_lap:
             self.previous_lap.end = now
-            self.previous_lap.save_dirty_fields()
+            self.save_instance(self.previous_lap)
         self.current_lap = lap
 
         logger.debug(f"new lap: {number}")
@@ -168,7 +296,7 @@ class Session(ExportModelOperationsMixin("session"), DirtyFieldsMixin, TimeStamp
         if self.counter_time_not_updated > 10 and self.counter_distance_updated > 10:
             self.current_lap.completed = True
             self.current_lap.official_time = lap_time
-            self.current_lap.save_dirty_fields()
+            self.save_instance(self.current_lap)
 
         self.previous_tick_time = lap_time
         self.previous_tick_distance = distance
@@ -223,7 +351,7 @@ class Session(ExportModelOperationsMixin("session"), DirtyFieldsMixin, TimeStamp
                 self.previous_lap.official_time = lap_time_previous
                 self.previous_lap.completed = True
                 logger.debug(f"lap {self.previous_lap.number} time {lap_time_previous} valid {previous_lap_was_valid}")
-                self.previous_lap.save_dirty_fields()
+                self.save_instance(self.previous_lap)
 
         self.previous_distance = distance
         self.previous_lap_time = lap_time
@@ -1,8 +1,69 @@
+from bisect import bisect_left, bisect_right
+from typing import TYPE_CHECKING, List, Optional
+
+import numpy as np
 from django.db import models
 from model_utils.models import TimeStampedModel
+from picklefield.fields import PickledObjectField
 
 from .landmark import Landmark
 
+if TYPE_CHECKING:
+    # imported when used, it needs scipy
+    from telemetry.centerline import Centerline
+
+
+class LandmarkIndex:
+    """Interval index over the segment landmarks of a track.
+
+    Landmarks are kept sorted by start. A prefix maximum over the ends allows
+    finding the first landmark (in start order) containing a distance with two
+    binary searches, which gives the same result as a linear scan.
+    """
+
+    def __init__(self, landmarks: List[Landmark]):
+        self.landmarks = [landmark for landmark in landmarks if landmark.start is not None and landmark.end is not None]
+        self.landmarks.sort(key=lambda landmark: landmark.start)
+        self.starts = [landmark.start for landmark in self.landmarks]
+        self.max_ends = []
+        max_end = None
+        for i, landmark in enumerate(self.landmarks):
+            landmark.number = i
+            if max_end is None or landmark.end > max_end:
+                max_end = landmark.end
+            self.max_ends.append(max_end)
+
+    def __len__(self):
+        return len(self.landmarks)
+
+    def get(self, distance) -> Optional[Landmark]:
+        # landmarks with start <= distance are at positions [0, candidates)
+        candidates = bisect_right(self.starts, distance)
+        if candidates == 0:
+            return None
+        # the first landmark whose end reaches the distance
+        i = bisect_left(self.max_ends, distance, 0, candidates)
+        if i < candidates:
+            return self.landmarks[i]
+        return None
+
+    def numbers(self, distances) -> np.ndarray:
+        """Return the number of the landmark ``get`` finds for every distance, -1 for none."""
+        distances = np.asarray(distances)
+        candidates = np.searchsorted(self.starts, distances, side="right")
+        # max_ends is sorted, a search bounded by candidates finds the same position
+        numbers = np.searchsorted(self.max_ends, distances, side="left")
+        return np.where(numbers < candidates, numbers, -1)
+
+    def next(self, distance) -> Optional[Landmark]:
+        """Return the first landmark starting after distance, wrapping around at the finish line."""
+        if not self.landmarks:
+            return None
+        i = bisect_right(self.starts, distance)
+        if i == len(self.landmarks):
+            return self.landmarks[0]
+        return self.landmarks[i]
+
 
 class Track(TimeStampedModel):
     class Meta:
@@ -18,14 +79,65 @@ class Track(TimeStampedModel):
     def __str__(self):
         return self.name
 
-    def get_landmark(self, distance=0):
-        if not hasattr(self, "_landmarks_cache"):
-            self._landmarks_cache = list(self.landmarks.filter(kind=Landmark.KIND_SEGMENT).order_by("start"))
-            # set number for each landmark
-            for i, landmark in enumerate(self._landmarks_cache):
-                landmark.number = i
+    def landmark_index(self) -> LandmarkIndex:
+        """Return the index over the segment landmarks, loaded once per instance.
 
-        for landmark in self._landmarks_cache:
-            if landmark.start <= distance <= landmark.end:
-                return landmark
-        return None
+        The pitcrew loads the track row for every new session, see
+        DimensionCache.track, so edited landmarks apply from the next session on.
+        """
+        if not hasattr(self, "_landmark_index"):
+            self._landmark_index = LandmarkIndex(list(self.landmarks.filter(kind=Landmark.KIND_SEGMENT)))
+        return self._landmark_index
+
+    def get_landmark(self, distance=0) -> Optional[Landmark]:
+        return self.landmark_index().get(distance)
+
+    def get_next_landmark(self, distance=0) -> Optional[Landmark]:
+        return self.landmark_index().next(distance)
+
+    def centerline(self) -> Optional["Centerline"]:
+        """Return the centerline of the current version, None if it was not built yet."""
+        from telemetry.centerline import VERSION
+
+        if not hasattr(self, "_centerline"):
+            stored = self.centerlines.filter(version=VERSION).first()
+            self._centerline = stored.centerline() if stored else None
+        return self._centerline
+
+
+class TrackCenterline(TimeStampedModel):
+    """The centerline of a track, see telemetry/centerline.py and the build_centerline command."""
+
+    class Meta:
+        ordering = ["track", "-version"]
+        unique_together = ("track", "version")
+
+    track = models.ForeignKey(Track, on_delete=models.CASCADE, related_name="centerlines")
+    # the centerline.VERSION it was built with
+    version = models.IntegerField(default=1)
+    # the number of laps the centerline was merged from
+    laps = models.IntegerField(default=0)
+    length = models.FloatField(default=0)
+    data = PickledObjectField(null=True)
+
+    def __str__(self):
+        return f"{self.track} v{self.version}: {self.length}m from {self.laps} laps"
+
+    def centerline(self) -> "Centerline":
+        from telemetry.centerline import Centerline
+
+        return Centerline.from_dict(self.data)
+
+    @classmethod
+    def build(cls, track: Track, laps, step=1.0) -> "TrackCenterline":
+        """Merge the (distances, positions) of laps into the centerline of the track, replacing one of the same version."""
+        from telemetry.centerline import VERSION, Centerline
+
+        centerline = Centerline.build(laps, step=step)
+        stored, created = cls.objects.update_or_create(
+            track=track,
+            version=VERSION,
+            defaults={"laps": len(laps), "length": centerline.length, "data": centerline.to_dict()},
+        )
+        vars(track).pop("_centerline", None)
+        return stored
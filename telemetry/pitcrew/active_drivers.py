@@ -3,17 +3,27 @@ from typing import Dict
 
 import django.utils.timezone
 
-from telemetry.models import Driver
+from . import metrics
+from .dimension_cache import dimension_cache
 
 
 class ActiveDrivers:
-    def __init__(self, debug=False, inactive_timeout_seconds=600):
+    # the only telemetry field read, see Mqtt.decoder
+    telemetry_fields = ("CarClass",)
+
+    def __init__(self, debug=False, inactive_timeout_seconds=600, archive=None):
         self.debug = debug
         self.inactive_timeout_seconds = inactive_timeout_seconds
         self.topics: Dict[str, dict] = {}  # Maps topic to metadata including driver and last_seen
+        # the TickArchive of the raw ticks, it needs every field decoded
+        self.archive = archive
+        if archive:
+            self.telemetry_fields = None
 
     def notify(self, topic, payload, now=None):
         now = now or django.utils.timezone.now()
+        if self.archive:
+            self.archive.notify(topic, payload, now)
 
         if topic not in self.topics:
             try:
@@ -31,7 +41,7 @@ class ActiveDrivers:
                 return
 
             try:
-                db_driver, created = Driver.objects.get_or_create(name=driver_name)
+                db_driver = dimension_cache.driver(driver_name)
                 self.topics[topic] = {"driver": db_driver, "last_seen": now, "session_id": session_id, "game": game, "track": track, "car": car, "car_class": payload.get("CarClass", ""), "session_type": session_type}
                 logging.debug(f"New topic: {topic}")
             except Exception as e:
@@ -51,14 +61,18 @@ class ActiveDrivers:
             now (datetime): The current datetime
         """
         delete_topics = []
-        for topic, metadata in self.topics.items():
+        for topic, metadata in list(self.topics.items()):
             if (now - metadata["last_seen"]).seconds > self.inactive_timeout_seconds:
                 delete_topics.append(topic)
 
         for topic in delete_topics:
             del self.topics[topic]
+            metrics.forget_topic(topic)
+            if self.archive:
+                self.archive.close(topic)
             logging.debug(f"{topic}\n\t deleting inactive topic")
 
     def drivers(self):
         """Return set of all active drivers"""
-        return {metadata["driver"] for metadata in self.topics.values()}
+        # called from the coach watcher thread while notify adds topics
+        return {metadata["driver"] for metadata in list(self.topics.values())}
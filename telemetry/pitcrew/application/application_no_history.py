@@ -1,5 +1,6 @@
 import datetime
 from collections import deque
+from typing import Iterable, Optional
 
 from telemetry.pitcrew.logging_mixin import LoggingMixin
 
@@ -28,6 +29,13 @@ class ApplicationNoHistory(LoggingMixin):
     def get_segment_at(self, distance):
         return self.distance_to_segment.get(distance, None)
 
+    def trigger_distances(self) -> Optional[Iterable[int]]:
+        """Return the distances in meters this app wants to be notified at.
+
+        None notifies the app for every meter, see CopilotDispatcher.
+        """
+        return None
+
     def notify(self, distance: int, telemetry: dict, now: datetime.datetime):
         self.telemetry = telemetry
         self.distance = distance
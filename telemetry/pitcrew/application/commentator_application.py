@@ -19,6 +19,10 @@ class CommentatorApplication(ApplicationNoHistory):
             message = ResponseTts("Let's go!", immediate=True)
             self.send_response(message)
 
+    def trigger_distances(self):
+        # all messages are sent on start, nothing to do while driving
+        return []
+
     def notify(self, distance, telemetry, now):
         # self.log_debug(f"notify: {distance} {telemetry}")
         pass
@@ -1,15 +1,17 @@
 from telemetry.models import Car, Driver, Game, SessionType, Track
 
+from ..dimension_cache import dimension_cache
+
 
 class Session:
     def __init__(self, filter={}):
         if filter:
             self.id = filter["SessionId"]
-            self.game = Game.objects.get_or_create(name=filter["GameName"])[0]
-            self.track = self.game.tracks.get_or_create(name=filter["TrackCode"])[0]
-            self.car = self.game.cars.get_or_create(name=filter["CarModel"])[0]
-            self.session_type = SessionType.objects.get_or_create(type=filter["SessionType"])[0]
-            self.driver = Driver.objects.get_or_create(name=filter["Driver"])[0]
+            self.game = dimension_cache.game(filter["GameName"])
+            self.track = dimension_cache.track(self.game, filter["TrackCode"])
+            self.car = dimension_cache.car(self.game, filter["CarModel"])
+            self.session_type = dimension_cache.session_type(filter["SessionType"])
+            self.driver = dimension_cache.driver(filter["Driver"])
         else:
             self.id = ""
             self.track = Track()
@@ -1,4 +1,5 @@
 import json
+import time
 
 import django.utils.timezone
 
@@ -6,17 +7,19 @@ from b4mad_racing_website.models import CopilotInstance
 from telemetry.models import Coach
 from telemetry.pitcrew.logging_mixin import LoggingMixin
 
+from . import metrics
 from .application.commentator_application import CommentatorApplication
 from .application.session import Session
+from .copilot_dispatcher import CopilotDispatcher
 from .persister_db import PersisterDb
 
 
 class CoachCopilotsNoHistory(LoggingMixin):
-    def __init__(self, coach_model: Coach, debug=False):
+    def __init__(self, coach_model: Coach, debug=False, flush_interval=None):
         self.coach_model = coach_model
         self.response_topic = f"coach/{coach_model.driver.name}"
         driver = coach_model.driver
-        self.persister = PersisterDb(driver, debug=debug)
+        self.persister = PersisterDb(driver, debug=debug, flush_interval=flush_interval)
         self.init_variables()
 
     def init_variables(self):
@@ -28,6 +31,7 @@ class CoachCopilotsNoHistory(LoggingMixin):
         self._crashed = False
         self.telemetry = {}
         self.apps = []
+        self.dispatcher = CopilotDispatcher(self.track_length)
         self.driver_name = self.coach_model.driver.name
 
     def filter_from_topic(self, topic):
@@ -63,6 +67,7 @@ class CoachCopilotsNoHistory(LoggingMixin):
         if self._new_session_starting:
             self.session = Session(self.filter)
             self.track_length = self.session.track_length()
+            self.dispatcher = CopilotDispatcher(self.track_length)
             self.init_apps()
             self._new_session_starting = False
         return True
@@ -88,6 +93,7 @@ class CoachCopilotsNoHistory(LoggingMixin):
         if copilot.ready:
             self.log_debug(f"adding copilot: {copilot}")
             self.apps.append(copilot)
+            self.dispatcher.register(copilot)
         else:
             self.log_debug(f"copilot {copilot} not ready")
 
@@ -162,15 +168,9 @@ class CoachCopilotsNoHistory(LoggingMixin):
         stop = self.distance_add(self.distance, stop_delta)
 
         # self.log_debug(f"start at {distance} to {stop} - delta: {delta} - speed: {telemetry['SpeedMs']} m/s {telemetry['SpeedMs'] * 3.6} km/h")
-        while distance != stop:
-            # self.log_debug(f"d: {distance} ({self.distance})")
-            if distance % 100 == 0:
-                self.log_debug(f"distance: {distance} ({self.distance})")
-
-            # notify all registered apps
-            for app in self.apps:
-                app.notify(distance, telemetry, now)
-
-            distance = self.distance_add(distance, 1)
+        # notify the registered apps for the meters ahead
+        start = time.perf_counter()
+        self.dispatcher.dispatch(distance, stop, telemetry, now, log=self.log_debug)
+        metrics.COPILOTS.observe(time.perf_counter() - start)
 
         self.previous_delta = delta
@@ -0,0 +1,224 @@
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, Optional
+
+import django.utils.timezone
+
+from telemetry.models import Coach, Driver
+
+from . import metrics
+from .active_drivers import ActiveDrivers
+from .coach_copilots_no_history import CoachCopilotsNoHistory
+from .ingest_queue import IngestQueue
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class CoachRuntime:
+    """Run the coaches of all drivers in one process on a single event loop.
+
+    The runtime is the observer of one Mqtt client subscribed to
+    ``crewchief/#``. Messages are routed by the driver in the topic to a
+    per-driver queue, drained by one asyncio task per driver. A coach is
+    started on the first message of its driver, so there is no startup delay.
+
+    The coaches use the Django ORM, which must not run on the event loop.
+    The messages queued for a driver are handed to ``executor_workers`` threads
+    in one batch, so the coach of a driver never sees its messages out of
+    order and hundreds of coaches share a small thread pool.
+    """
+
+    def __init__(
+        self,
+        firehose: Optional[ActiveDrivers] = None,
+        replay=False,
+        debug=False,
+        queue_size=600,
+        executor_workers=8,
+        coach_factory: Optional[Callable] = None,
+        publish: Optional[Callable] = None,
+    ):
+        self.firehose = firehose
+        self.replay = replay
+        self.debug = debug
+        self.queue_size = queue_size
+        # replays can be slowed down, live telemetry must not stall the network thread
+        self.policy = IngestQueue.POLICY_BLOCK if replay else IngestQueue.POLICY_DROP_OLDEST
+        self.coach_factory = coach_factory or self.create_coach
+        # set to the publish method of the Mqtt client once it exists
+        self.publish = publish
+        self.loop = asyncio.new_event_loop()
+        self.executor = ThreadPoolExecutor(max_workers=executor_workers, thread_name_prefix="coach")
+        self.queues: Dict[str, asyncio.Queue] = {}
+        self.tasks: Dict[str, asyncio.Task] = {}
+        self.dropped = 0
+        self.processed = 0
+        self.ready = False
+        self._stop_event = threading.Event()
+        metrics.collector.register_queue("coach_runtime", self)
+
+    def create_coach(self, driver_name):
+        driver, created = Driver.objects.get_or_create(name=driver_name)
+        coach_model, created = Coach.objects.get_or_create(driver=driver)
+        return CoachCopilotsNoHistory(coach_model, debug=self.debug, flush_interval=1.0)
+
+    def driver_name(self, topic) -> Optional[str]:
+        frags = topic.split("/", 2)
+        if len(frags) < 3 or not frags[1]:
+            return None
+        return frags[1]
+
+    def notify(self, topic, payload, now=None):
+        """Called from the ingest queue of the Mqtt client, never runs coach code."""
+        now = now or django.utils.timezone.now()
+        if self.firehose:
+            self.firehose.notify(topic, payload, now)
+
+        if self.stopped():
+            return
+        driver_name = self.driver_name(topic)
+        if driver_name is None:
+            return
+
+        item = (topic, payload, now)
+        if self.policy == IngestQueue.POLICY_BLOCK:
+            future = asyncio.run_coroutine_threadsafe(self.put_wait(driver_name, item), self.loop)
+            future.result()
+        else:
+            self.loop.call_soon_threadsafe(self.put_nowait, driver_name, item)
+
+    def queue_for(self, driver_name) -> asyncio.Queue:
+        queue = self.queues.get(driver_name)
+        if queue is None:
+            queue = asyncio.Queue(maxsize=self.queue_size)
+            self.queues[driver_name] = queue
+            self.tasks[driver_name] = self.loop.create_task(self.coach_task(driver_name, queue), name=f"coach-{driver_name}")
+            _LOGGER.info(f"starting coach for {driver_name}")
+        return queue
+
+    def put_nowait(self, driver_name, item):
+        queue = self.queue_for(driver_name)
+        if queue.full():
+            queue.get_nowait()
+            self.dropped += 1
+        queue.put_nowait(item)
+
+    async def put_wait(self, driver_name, item):
+        await self.queue_for(driver_name).put(item)
+
+    async def coach_task(self, driver_name, queue: asyncio.Queue):
+        try:
+            coach = await self.loop.run_in_executor(self.executor, self.coach_factory, driver_name)
+        except Exception as e:
+            _LOGGER.exception(f"Error creating coach for {driver_name}: {e}")
+            return
+
+        try:
+            while True:
+                items = [await queue.get()]
+                while not queue.empty():
+                    items.append(queue.get_nowait())
+                stop = items[-1] is None
+                if stop:
+                    items.pop()
+                if items:
+                    handled = await self.loop.run_in_executor(self.executor, self.handle, coach, items)
+                    # counted on the loop, the executor threads share nothing
+                    self.processed += handled
+                if stop:
+                    break
+        finally:
+            await self.loop.run_in_executor(self.executor, self.stop_coach, driver_name, coach)
+
+    def handle(self, coach, items) -> int:
+        """Notify a coach of a batch of messages, runs in the executor. Returns the number handled."""
+        handled = 0
+        for topic, payload, now in items:
+            try:
+                response = coach.notify(topic, payload, now)
+            except Exception as e:
+                _LOGGER.exception(f"Error handling message for {topic}: {e}")
+                continue
+            handled += 1
+            if response:
+                self.respond(response)
+        return handled
+
+    def respond(self, response):
+        (r_topic, r_payload) = response
+        payloads = r_payload
+        if not isinstance(r_payload, list):
+            payloads = [r_payload]
+        for r_payload in payloads:
+            if self.publish:
+                self.publish(r_topic, r_payload)
+
+    def stop_coach(self, driver_name, coach):
+        _LOGGER.info(f"stopping coach for {driver_name}")
+        if hasattr(coach, "on_stop") and callable(getattr(coach, "on_stop")):
+            try:
+                coach.on_stop()
+            except Exception as e:
+                _LOGGER.exception(f"Error stopping coach for {driver_name}: {e}")
+
+    def retire(self, driver_name):
+        """Stop the coach of a driver after it handled the queued messages."""
+        queue = self.queues.pop(driver_name, None)
+        self.tasks.pop(driver_name, None)
+        if queue is not None:
+            # the sentinel must not be dropped, wait for room
+            self.loop.create_task(queue.put(None))
+
+    def sync(self, drivers: Iterable):
+        """Stop the coaches of drivers which are no longer active."""
+        active = {getattr(driver, "name", driver) for driver in drivers}
+
+        def _sync():
+            for driver_name in list(self.queues):
+                if driver_name not in active:
+                    self.retire(driver_name)
+
+        self.loop.call_soon_threadsafe(_sync)
+
+    def drivers(self):
+        return set(self.queues)
+
+    def stats(self):
+        return {
+            "coaches": len(self.tasks),
+            "depth": sum(queue.qsize() for queue in list(self.queues.values())),
+            "dropped": self.dropped,
+            "processed": self.processed,
+        }
+
+    def stopped(self):
+        return self._stop_event.is_set()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def on_stop(self):
+        # called by Mqtt.run when the client disconnected
+        self.stop()
+
+    async def main(self):
+        self.ready = True
+        while not self.stopped():
+            await asyncio.sleep(0.1)
+
+        for driver_name in list(self.queues):
+            self.retire(driver_name)
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def run(self):
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.loop.run_until_complete(self.main())
+        finally:
+            self.ready = False
+            self.executor.shutdown(wait=True)
+            self.loop.close()
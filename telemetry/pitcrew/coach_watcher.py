@@ -1,6 +1,7 @@
 import logging
 import threading
 import time
+from typing import Optional
 
 from .active_drivers import ActiveDrivers
 
@@ -8,6 +9,8 @@ from .active_drivers import ActiveDrivers
 # from .coach_app import CoachApp
 # from .coach_copilots import CoachCopilots
 from .coach_copilots_no_history import CoachCopilotsNoHistory
+from .coach_runtime import CoachRuntime
+from .ingest_queue import IngestQueue
 
 # from .history import History
 from .kube_crew import KubeCrew
@@ -15,14 +18,16 @@ from .mqtt import Mqtt
 
 
 class CoachWatcher:
-    def __init__(self, firehose: ActiveDrivers, replay=False):
+    def __init__(self, firehose: ActiveDrivers, replay=False, coach_runtime: Optional[CoachRuntime] = None):
         self.firehose = firehose
         self.sleep_time = 10
         self.active_coaches = {}
         self.replay = replay
         self.ready = False
         self._stop_event = threading.Event()
-        self.kube_crew = KubeCrew()
+        # with a coach runtime all coaches run in this process, otherwise in a deployment per driver
+        self.coach_runtime = coach_runtime
+        self.kube_crew = None if coach_runtime else KubeCrew()
 
     def stop(self):
         self._stop_event.set()
@@ -45,6 +50,10 @@ class CoachWatcher:
             # sleep longer than save_sessions, to make sure all DB objects are initialized
             time.sleep(self.sleep_time)
             drivers = self.drivers()
+            if self.coach_runtime:
+                # coaches start on the first message of a driver, only inactive ones are stopped here
+                self.coach_runtime.sync(drivers)
+                continue
             self.kube_crew.drivers.clear()
             for driver in drivers:
                 self.kube_crew.drivers.add(driver.name)
@@ -87,10 +96,11 @@ class CoachWatcher:
     #     h.start()
 
     def start_coach_no_history(self, driver_name, coach_model, debug=False):
-        coach = CoachCopilotsNoHistory(coach_model, debug=debug)
+        coach = CoachCopilotsNoHistory(coach_model, debug=debug, flush_interval=1.0)
 
         topic = f"crewchief/{driver_name}/#"
-        mqtt = Mqtt(coach, topic, replay=self.replay, debug=debug)
+        queue_policy = IngestQueue.POLICY_BLOCK if self.replay else IngestQueue.POLICY_DROP_OLDEST
+        mqtt = Mqtt(coach, topic, replay=self.replay, debug=debug, queue_size=600, queue_policy=queue_policy)
 
         def mqtt_thread():
             logging.info(f"MQTT thread starting for {driver_name}")
@@ -103,6 +113,7 @@ class CoachWatcher:
         threads = list()
         threads.append(c)
         c.start()
+        return mqtt
 
     def run(self):
         try:
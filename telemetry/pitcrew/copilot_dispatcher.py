@@ -0,0 +1,77 @@
+import bisect
+from typing import Dict, List
+
+
+class CopilotDispatcher:
+    """Notify copilot apps for the distances inside the look-ahead window of a tick.
+
+    Apps declare where they want to be notified with ``trigger_distances``:
+
+    * ``None``: every meter of the window, the way all apps used to be notified
+    * an iterable of whole meters: only when one of them is inside the window
+
+    Triggers are kept in a sorted index, so a tick costs a bisect per window
+    instead of one call per app and meter. Apps notified at the same distance
+    are called in the order they were registered.
+    """
+
+    def __init__(self, track_length):
+        self.track_length = track_length
+        self.every_meter: List = []
+        self.distances: List = []  # sorted trigger distances
+        self.apps_at: Dict[float, List] = {}
+        self.order: Dict[int, int] = {}  # id(app) -> registration order
+
+    def register(self, app):
+        self.order[id(app)] = len(self.order)
+        trigger_distances = app.trigger_distances()
+        if trigger_distances is None:
+            self.every_meter.append(app)
+            return
+
+        for distance in {int(distance) % self.track_length for distance in trigger_distances}:
+            apps = self.apps_at.get(distance)
+            if apps is None:
+                apps = []
+                self.apps_at[distance] = apps
+                bisect.insort(self.distances, distance)
+            apps.append(app)
+
+    def distance_add(self, distance, meters):
+        return (distance + meters) % self.track_length
+
+    def triggers_between(self, start, stop):
+        """Return the trigger distances in [start, stop), wrapping around the finish line."""
+        if start == stop:
+            return []
+        distances = self.distances
+        if start < stop:
+            return distances[bisect.bisect_left(distances, start) : bisect.bisect_left(distances, stop)]
+        return distances[bisect.bisect_left(distances, start) :] + distances[: bisect.bisect_left(distances, stop)]
+
+    def dispatch(self, start, stop, telemetry, now, log=None):
+        """Notify the apps for every meter from start up to, not including, stop."""
+        if self.every_meter:
+            self.dispatch_every_meter(start, stop, telemetry, now, log)
+            return
+
+        for distance in self.triggers_between(start, stop):
+            for app in self.apps_at[distance]:
+                app.notify(distance, telemetry, now)
+
+    def dispatch_every_meter(self, start, stop, telemetry, now, log=None):
+        # the brute force path, triggered apps still only see their distances
+        order = self.order
+        distance = start
+        while distance != stop:
+            if log and distance % 100 == 0:
+                log(f"distance: {distance}")
+
+            apps = self.every_meter
+            triggered = self.apps_at.get(distance)
+            if triggered:
+                apps = sorted(apps + triggered, key=lambda app: order[id(app)])
+            for app in apps:
+                app.notify(distance, telemetry, now)
+
+            distance = self.distance_add(distance, 1)
@@ -3,18 +3,24 @@ import os
 import signal
 import threading
 import time
+from typing import Optional
 
 from flask_healthz import HealthError
 
 from .active_drivers import ActiveDrivers
+from .coach_runtime import CoachRuntime
 from .coach_watcher import CoachWatcher
+from .ingest_queue import IngestQueue
 from .mqtt import Mqtt
+from .sharded_firehose import ShardedFirehose
+from .telemetry_decoder import RawDecoder
+from .tick_archive import TickArchive, tick_archive
 
 # from .session_saver import SessionSaver
 
 
 class Crew:
-    def __init__(self, debug=False, replay=False, save=True):
+    def __init__(self, debug=False, replay=False, save=True, coach_runtime=False, shards=0, archive=""):
         self._ready = False
         self._live = False
         self.debug = debug
@@ -23,10 +29,34 @@ class Crew:
 
         topic = "crewchief/#"
 
-        self.firehose = ActiveDrivers(debug=debug)
-        self.mqtt = Mqtt(self.firehose, topic, replay=replay)
-
-        self.coach_watcher = CoachWatcher(self.firehose, replay=replay)
+        self.coach_runtime = None
+        self.sharded_firehose = None
+        # the raw tick archive, every shard opens its own
+        self.archive: Optional[TickArchive] = None
+        if shards:
+            # the shard processes run the firehose and the coaches, this process only forwards payloads
+            self.firehose = self.sharded_firehose = ShardedFirehose(shards, coach_runtime=coach_runtime, replay=replay, debug=debug, archive=archive)
+            self.mqtt = Mqtt(self.firehose, topic, replay=replay, decoder=RawDecoder())
+            self.firehose.publish = self.mqtt.mqttc.publish
+        elif coach_runtime:
+            self.archive = tick_archive(archive)
+            self.firehose = ActiveDrivers(debug=debug, archive=self.archive)
+            # all coaches share this process and the MQTT connection of the firehose
+            self.coach_runtime = CoachRuntime(self.firehose, replay=replay, debug=debug)
+            # the firehose uses the ORM, it is notified from the ingest queue, not the network thread
+            queue_policy = IngestQueue.POLICY_BLOCK if replay else IngestQueue.POLICY_DROP_OLDEST
+            self.mqtt = Mqtt(self.coach_runtime, topic, replay=replay, queue_size=600, queue_policy=queue_policy)
+            self.coach_runtime.publish = self.mqtt.mqttc.publish
+        else:
+            self.archive = tick_archive(archive)
+            self.firehose = ActiveDrivers(debug=debug, archive=self.archive)
+            # replays can be slowed down, live telemetry must not stall the network thread
+            queue_policy = IngestQueue.POLICY_BLOCK if replay else IngestQueue.POLICY_DROP_OLDEST
+            self.mqtt = Mqtt(self.firehose, topic, replay=replay, queue_size=600, queue_policy=queue_policy)
+
+        # the sharded firehose stops the inactive coaches of its shards like a coach runtime
+        coach_watcher_runtime = self.sharded_firehose if shards and coach_runtime else self.coach_runtime
+        self.coach_watcher = CoachWatcher(self.firehose, replay=replay, coach_runtime=coach_watcher_runtime)
         # self.coach_watcher.sleep_time = 3
 
         # self.session_saver = SessionSaver(self.firehose, save=save)
@@ -63,6 +93,15 @@ class Crew:
 
         threads = []
 
+        if self.sharded_firehose and not self.sharded_firehose.started():
+            # fork the shards before any other thread of the crew is started
+            self.sharded_firehose.start()
+
+        if self.coach_runtime:
+            t = threading.Thread(target=self.coach_runtime.run)
+            t.name = "coach_runtime"
+            threads.append(t)
+
         t = threading.Thread(target=self.mqtt.run)
         t.name = "mqtt"
         threads.append(t)
@@ -81,7 +120,8 @@ class Crew:
 
         logging.debug("waiting for threads to be ready...")
         while True:
-            if self.mqtt.ready and self.coach_watcher.ready:  # and self.session_saver.ready:
+            runtime_ready = self.coach_runtime.ready if self.coach_runtime else True
+            if self.mqtt.ready and self.coach_watcher.ready and runtime_ready:  # and self.session_saver.ready:
                 break
             time.sleep(1)
 
@@ -99,7 +139,13 @@ class Crew:
 
         self.mqtt.stop()
         self.coach_watcher.stop()
+        if self.coach_runtime:
+            self.coach_runtime.stop()
+        if self.sharded_firehose:
+            self.sharded_firehose.stop()
         # self.session_saver.stop()
+        if self.archive:
+            self.archive.stop()
 
         for t in threads:
             logging.debug(f"joining Thread {t}")
@@ -0,0 +1,210 @@
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, Optional
+
+from loguru import logger
+
+from telemetry.models import Car, CarClass, Driver, Game, SessionType, Track
+
+
+class LRUCache:
+    """A bounded mapping that evicts the least recently used entry."""
+
+    def __init__(self, maxsize=4096):
+        self.maxsize = maxsize
+        self.data: OrderedDict = OrderedDict()
+
+    def __len__(self):
+        return len(self.data)
+
+    def __contains__(self, key):
+        return key in self.data
+
+    def get(self, key, default=None):
+        try:
+            self.data.move_to_end(key)
+        except KeyError:
+            return default
+        return self.data[key]
+
+    def put(self, key, value):
+        self.data[key] = value
+        self.data.move_to_end(key)
+        while len(self.data) > self.maxsize:
+            self.data.popitem(last=False)
+
+    def pop(self, key):
+        return self.data.pop(key, None)
+
+    def clear(self):
+        self.data.clear()
+
+
+class DimensionCache:
+    """In-process cache for the small dimension tables of the telemetry app.
+
+    Lookups that miss run the usual get_or_create query, concurrent misses for
+    the same key wait for the first query instead of issuing their own. The
+    first miss for a game loads all cars, car classes and tracks of that game.
+
+    Tracks are edited in the web app while the pitcrew runs, their length
+    and landmarks change. Only their primary key is cached, every lookup
+    loads the row again.
+    """
+
+    TABLES = ["game", "car_class", "car", "track", "session_type", "driver"]
+
+    def __init__(self, maxsize=4096):
+        self.maxsize = maxsize
+        self.lock = threading.Lock()
+        self.tables: Dict[str, LRUCache] = {table: LRUCache(maxsize) for table in self.TABLES}
+        self.in_flight: Dict[tuple, threading.Event] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def clear(self):
+        with self.lock:
+            for table in self.tables.values():
+                table.clear()
+
+    def _get(self, table: str, key: Hashable, load: Callable):
+        cache = self.tables[table]
+        while True:
+            with self.lock:
+                value = cache.get(key)
+                if value is not None:
+                    self.hits += 1
+                    return value
+                event = self.in_flight.get((table, key))
+                if event is None:
+                    event = threading.Event()
+                    self.in_flight[(table, key)] = event
+                    self.misses += 1
+                    break
+            # somebody else is loading this key, wait and look again
+            event.wait()
+
+        try:
+            value = load()
+            with self.lock:
+                cache.put(key, value)
+            return value
+        finally:
+            with self.lock:
+                del self.in_flight[(table, key)]
+            event.set()
+
+    def _put(self, table: str, key: Hashable, value):
+        with self.lock:
+            self.tables[table].put(key, value)
+
+    def forget(self, instance):
+        """Drop a deleted or updated row from the cache."""
+
+        def cached(value):
+            if isinstance(instance, Track) and value == instance.pk:
+                return True
+            return value is instance or (type(value) is type(instance) and value.pk == instance.pk)
+
+        with self.lock:
+            for table in self.tables.values():
+                for key in [key for key, value in table.data.items() if cached(value)]:
+                    table.pop(key)
+
+    def game(self, name: str, create=True) -> Game:
+        def load():
+            if create:
+                game = Game.objects.get_or_create(name=name)[0]
+            else:
+                game = Game.objects.get(name=name)
+            self.warm_up_game(game)
+            return game
+
+        return self._get("game", name, load)
+
+    def car_class(self, game: Game, name: str) -> CarClass:
+        def load():
+            car_class, created = CarClass.objects.get_or_create(name=name, game=game)
+            if created:
+                logger.debug(f"Created new car class: {car_class}")
+            return car_class
+
+        return self._get("car_class", (game.pk, name), load)
+
+    def car(self, game: Game, name: str, car_class: Optional[CarClass] = None) -> Car:
+        def load():
+            if car_class:
+                car, created = game.cars.get_or_create(name=name, car_class=car_class)
+            else:
+                car, created = game.cars.get_or_create(name=name)
+            if created:
+                logger.debug(f"Created new car: {car}")
+            return car
+
+        return self._get("car", (game.pk, name, car_class.pk if car_class else None), load)
+
+    def track(self, game: Game, name: str, defaults=None) -> Track:
+        loaded = []
+
+        def load():
+            track, created = game.tracks.get_or_create(name=name, defaults=defaults)
+            if created:
+                logger.debug(f"Created new track: {track}")
+            loaded.append(track)
+            return track.pk
+
+        key = (game.pk, name)
+        pk = self._get("track", key, load)
+        if loaded:
+            return loaded[0]
+        try:
+            return Track.objects.get(pk=pk)
+        except Track.DoesNotExist:
+            # deleted by another process
+            with self.lock:
+                self.tables["track"].pop(key)
+            return self.track(game, name, defaults=defaults)
+
+    def session_type(self, type: str) -> SessionType:
+        return self._get("session_type", type, lambda: SessionType.objects.get_or_create(type=type)[0])
+
+    def driver(self, name: str, create=True) -> Driver:
+        def load():
+            if create:
+                return Driver.objects.get_or_create(name=name)[0]
+            return Driver.objects.get(name=name)
+
+        return self._get("driver", name, load)
+
+    def warm_up_game(self, game: Game):
+        """Load all cars, car classes and tracks of a game."""
+        car_classes = list(game.car_classes.all())
+        cars = list(game.cars.all())
+        tracks = list(game.tracks.all())
+        car_names: Dict[str, list] = {}
+        for car_class in car_classes:
+            self._put("car_class", (game.pk, car_class.name), car_class)
+        for car in cars:
+            self._put("car", (game.pk, car.name, car.car_class_id), car)
+            car_names.setdefault(car.name, []).append(car)
+        for name, cars_with_name in car_names.items():
+            # a lookup without car class only resolves if the name is unique
+            if len(cars_with_name) == 1:
+                self._put("car", (game.pk, name, None), cars_with_name[0])
+        for track in tracks:
+            self._put("track", (game.pk, track.name), track.pk)
+        logger.debug(f"Warmed up {game}: {len(car_classes)} car classes, {len(cars)} cars, {len(tracks)} tracks")
+
+    def warm_up(self, game_name=None):
+        """Load the dimension tables of one or all games."""
+        games = Game.objects.all()
+        if game_name:
+            games = games.filter(name=game_name)
+        for game in games:
+            self._put("game", game.name, game)
+            self.warm_up_game(game)
+        for session_type in SessionType.objects.all():
+            self._put("session_type", session_type.type, session_type)
+
+
+dimension_cache = DimensionCache()
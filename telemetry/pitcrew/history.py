@@ -7,7 +7,9 @@ from scipy.interpolate import interp1d
 
 from telemetry.analyzer import Analyzer
 from telemetry.fast_lap_analyzer import FastLapAnalyzer
-from telemetry.models import Coach, Driver, FastLap, Game
+from telemetry.lap_array import LapArray
+from telemetry.models import Coach, FastLap
+from telemetry.pitcrew.dimension_cache import dimension_cache
 from telemetry.pitcrew.logging_mixin import LoggingMixin
 from telemetry.pitcrew.segment import Segment
 from telemetry.racing_stats import RacingStats
@@ -75,21 +77,11 @@ class History(LoggingMixin):
         self.telemetry = []
 
         try:
-            self.driver = Driver.objects.get(name=self.filter["Driver"])
-            self.game = Game.objects.get(name=self.filter["GameName"])
-
-            # Get or create car
-            self.car, car_created = self.game.cars.get_or_create(name=self.filter["CarModel"])
-            if car_created:
-                self.log_debug(f"Created new car: {self.car.name}")
-
-            # Get or create track
-            self.track, track_created = self.game.tracks.get_or_create(name=self.filter["TrackCode"])
-            if track_created:
-                self.log_debug(f"Created new track: {self.track.name}")
-                # Set a default track length if it's a new track
-                self.track.length = 10  # Default length in meters
-                self.track.save()
+            self.driver = dimension_cache.driver(self.filter["Driver"], create=False)
+            self.game = dimension_cache.game(self.filter["GameName"], create=False)
+            self.car = dimension_cache.car(self.game, self.filter["CarModel"])
+            # Set a default track length if it's a new track
+            self.track = dimension_cache.track(self.game, self.filter["TrackCode"], defaults={"length": 10})
 
             self.track_length = self.track.length
         except Exception as e:
@@ -238,14 +230,19 @@ class History(LoggingMixin):
             # lap_number = telemetry[0].get("CurrentLap")
             # self.log_debug(f"   lap: {lap_number}")
 
-            df = pd.DataFrame.from_records(telemetry)
-            df = self.fast_lap_analyzer.preprocess(df)
+            if isinstance(telemetry, LapArray):
+                lap = telemetry
+                df = lap.to_df()
+            else:
+                df = pd.DataFrame.from_records(telemetry)
+                df = self.fast_lap_analyzer.preprocess(df)
+                lap = LapArray.from_df(df)
 
             brake_features = self.fast_lap_analyzer.brake_features(df)
             throttle_features = self.fast_lap_analyzer.throttle_features(df)
             gear_features = self.fast_lap_analyzer.gear_features(df)
-            sector_time = self.analyzer.sector_time(df)
-            sector_lap_time = self.analyzer.sector_lap_time(df)
+            sector_time = self.analyzer.sector_time(lap)
+            sector_lap_time = self.analyzer.sector_lap_time(lap)
             other_features = {
                 "sector_time": sector_time,
                 "sector_lap_time": sector_lap_time,
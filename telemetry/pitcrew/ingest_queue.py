@@ -0,0 +1,172 @@
+import logging
+import threading
+import zlib
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional
+
+import django.utils.timezone
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class IngestWorker:
+    """A worker thread draining the per-topic queues of its partition."""
+
+    def __init__(self, ingest_queue: "IngestQueue", number: int):
+        self.ingest_queue = ingest_queue
+        self.number = number
+        self.queues: Dict[str, Deque] = {}
+        # topics with pending items, in the order they became ready
+        self.ready: Deque[str] = deque()
+        self.condition = threading.Condition()
+        # counted per worker, dropped under the condition, processed by the worker thread only
+        self.dropped = 0
+        self.processed = 0
+        self.thread = threading.Thread(target=self.run, name=f"ingest-{number}", daemon=True)
+
+    def put(self, topic, item):
+        ingest_queue = self.ingest_queue
+        with self.condition:
+            queue = self.queues.get(topic)
+            if queue and ingest_queue.policy == IngestQueue.POLICY_COALESCE:
+                # only the latest message of a topic waits
+                self.dropped += len(queue)
+                queue.clear()
+            elif queue is not None and len(queue) >= ingest_queue.maxsize:
+                if ingest_queue.policy == IngestQueue.POLICY_BLOCK:
+                    while len(self.queues.get(topic, ())) >= ingest_queue.maxsize and not ingest_queue.stopped():
+                        self.condition.wait()
+                else:
+                    queue.popleft()
+                    self.dropped += 1
+
+            # a topic has a queue exactly as long as it is in self.ready
+            queue = self.queues.get(topic)
+            if queue is None:
+                queue = deque()
+                self.queues[topic] = queue
+                self.ready.append(topic)
+            queue.append(item)
+            self.condition.notify_all()
+
+    def take(self):
+        """Wait for the next item, round robin over the ready topics."""
+        with self.condition:
+            while not self.ready:
+                if self.ingest_queue.stopped():
+                    return None
+                self.condition.wait()
+            topic = self.ready.popleft()
+            queue = self.queues[topic]
+            item = queue.popleft()
+            if queue:
+                self.ready.append(topic)
+            else:
+                del self.queues[topic]
+            # wake up producers waiting for space
+            self.condition.notify_all()
+            return topic, item
+
+    def depths(self):
+        with self.condition:
+            return {topic: len(queue) for topic, queue in self.queues.items()}
+
+    def stop(self):
+        with self.condition:
+            self.condition.notify_all()
+
+    def run(self):
+        handler = self.ingest_queue.handler
+        while True:
+            entry = self.take()
+            if entry is None:
+                break
+            topic, (payload, now) = entry
+            try:
+                handler(topic, payload, now)
+            except Exception as e:
+                _LOGGER.exception(f"Error handling message for {topic}: {e}")
+            self.processed += 1
+
+
+class IngestQueue:
+    """Bounded per-topic queues between the MQTT network thread and the observers.
+
+    ``put`` never runs observer code. Every topic is assigned to one worker by
+    a hash of its name, or by ``partition(topic)`` when given, so messages of
+    a topic are handled in order. When the
+    queue of a topic is full, the overflow policy decides what happens:
+
+    * ``drop_oldest``: the oldest queued message of the topic is dropped
+    * ``coalesce``: only the latest message of a topic is kept, on every ``put``
+    * ``block``: ``put`` waits until the worker made room
+    """
+
+    POLICY_DROP_OLDEST = "drop_oldest"
+    POLICY_COALESCE = "coalesce"
+    POLICY_BLOCK = "block"
+    POLICIES = [POLICY_DROP_OLDEST, POLICY_COALESCE, POLICY_BLOCK]
+
+    def __init__(self, handler: Callable, workers=1, maxsize=600, policy=POLICY_DROP_OLDEST, partition: Optional[Callable] = None):
+        if policy not in self.POLICIES:
+            raise ValueError(f"unknown overflow policy {policy}")
+        self.handler = handler
+        self.partition = partition
+        self.maxsize = maxsize
+        self.policy = policy
+        self._stop_event = threading.Event()
+        self.workers: List[IngestWorker] = [IngestWorker(self, number) for number in range(workers)]
+
+    @property
+    def dropped(self) -> int:
+        return sum(worker.dropped for worker in self.workers)
+
+    @property
+    def processed(self) -> int:
+        return sum(worker.processed for worker in self.workers)
+
+    def worker_for(self, topic) -> IngestWorker:
+        if self.partition:
+            return self.workers[self.partition(topic) % len(self.workers)]
+        return self.workers[zlib.crc32(topic.encode("utf-8")) % len(self.workers)]
+
+    def put(self, topic, payload, now=None):
+        now = now or django.utils.timezone.now()
+        self.worker_for(topic).put(topic, (payload, now))
+
+    def start(self):
+        for worker in self.workers:
+            worker.thread.start()
+
+    def stopped(self):
+        return self._stop_event.is_set()
+
+    def stop(self, timeout=None):
+        """Stop the workers after they handled the messages already queued."""
+        for worker in self.workers:
+            # queued items are taken before a worker checks for stop
+            while worker.depths() and worker.thread.is_alive():
+                worker.thread.join(0.01)
+        self._stop_event.set()
+        for worker in self.workers:
+            worker.stop()
+            if worker.thread.is_alive():
+                worker.thread.join(timeout)
+
+    def depth(self):
+        return sum(self.depths().values())
+
+    def depths(self) -> Dict[str, int]:
+        depths = {}
+        for worker in self.workers:
+            depths.update(worker.depths())
+        return depths
+
+    def stats(self):
+        depths = self.depths()
+        return {
+            "depth": sum(depths.values()),
+            "topics": depths,
+            "dropped": self.dropped,
+            "processed": self.processed,
+        }
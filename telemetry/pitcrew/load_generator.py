@@ -0,0 +1,267 @@
+import glob
+import json
+import os
+import time
+from collections import defaultdict
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from django.db import connection
+
+from telemetry.models import Coach, Driver, Game
+
+from .active_drivers import ActiveDrivers
+from .coach_copilots_no_history import CoachCopilotsNoHistory
+from .dimension_cache import dimension_cache
+from .mqtt import Mqtt
+from .persister_db import PersisterDb
+from .telemetry_decoder import decoder_for
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "tests", "data")
+
+# columns of the recorded sessions which are not part of a CrewChief payload, see the replay command
+NON_PAYLOAD_COLUMNS = [
+    "result",
+    "table",
+    "_start",
+    "_stop",
+    "_time",
+    "_measurement",
+    "topic",
+    "host",
+    "id",
+    "CarModel",
+    "GameName",
+    "SessionId",
+    "SessionTypeName",
+    "TrackCode",
+    "user",
+]
+
+
+class FakeMessage:
+    """Quacks like a paho MQTTMessage as far as Mqtt.on_message is concerned."""
+
+    __slots__ = ("topic", "payload", "qos")
+
+    def __init__(self, topic: str, payload: bytes):
+        self.topic = topic
+        self.payload = payload
+        self.qos = 0
+
+
+class FakeClient:
+    """Stands in for the paho client of Mqtt, nothing is sent anywhere."""
+
+    def __init__(self):
+        self.published = 0
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        self.published += 1
+
+    def disconnect(self):
+        pass
+
+
+class LoadGenerator:
+    """Synthesize CrewChief telemetry of ``drivers`` drivers from recorded sessions.
+
+    Every driver replays one of the recorded sessions, starting at a different
+    row and looping at its end, under its own topic. ``messages`` yields one
+    message per driver for each tick of ``hz`` ticks per second.
+    """
+
+    def __init__(self, drivers=10, seconds=60, hz=60, files: Optional[List[str]] = None):
+        self.drivers = drivers
+        self.seconds = seconds
+        self.hz = hz
+        files = files or sorted(glob.glob(os.path.join(DATA_DIR, "session_*_df.csv.gz")))
+        self.sessions = [self.load(file_path) for file_path in files]
+        self.sessions = [session for session in self.sessions if session[1]]
+        if not self.sessions:
+            raise ValueError("no recorded sessions with telemetry found")
+
+    def load(self, file_path) -> Tuple[str, List[bytes]]:
+        df = pd.read_csv(file_path, compression="gzip", low_memory=False)
+        df = df.sort_values(by="_time")
+        df = df.replace(np.nan, None)
+        topic = df["topic"].iloc[0]
+        telemetry = df.drop(columns=[column for column in NON_PAYLOAD_COLUMNS if column in df.columns])
+        # encoded once, the benchmark is about the pitcrew, not about json.dumps
+        payloads = [json.dumps({"telemetry": values}).encode("utf-8") for values in telemetry.to_dict("records")]
+        return topic, payloads
+
+    def topic(self, number, session_topic):
+        frags = session_topic.split("/")
+        frags[1] = f"loadgen-{number}"
+        return "/".join(frags)
+
+    def driver_streams(self):
+        streams = []
+        for number in range(self.drivers):
+            session_topic, payloads = self.sessions[number % len(self.sessions)]
+            offset = (number * 997) % len(payloads)
+            streams.append((self.topic(number, session_topic), payloads, offset))
+        return streams
+
+    def ticks(self):
+        return self.seconds * self.hz * self.drivers
+
+    def messages(self) -> Iterator[FakeMessage]:
+        streams = self.driver_streams()
+        for tick in range(self.seconds * self.hz):
+            for topic, payloads, offset in streams:
+                yield FakeMessage(topic, payloads[(offset + tick) % len(payloads)])
+
+
+class SimulatedClock:
+    """The seconds of telemetry generated so far, ticks run much faster than real time."""
+
+    def __init__(self):
+        self.seconds = 0.0
+
+    def __call__(self) -> float:
+        return self.seconds
+
+
+class StageTimer:
+    """Collect the durations of the pipeline stages in nanoseconds."""
+
+    def __init__(self):
+        self.samples: Dict[str, List[int]] = defaultdict(list)
+
+    def wrap(self, stage, function):
+        samples = self.samples[stage]
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter_ns()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                samples.append(time.perf_counter_ns() - start)
+
+        return timed
+
+    def stats(self) -> Dict[str, dict]:
+        stats = {}
+        for stage, samples in self.samples.items():
+            if not samples:
+                continue
+            values = np.array(samples) / 1_000_000  # ms
+            p50, p90, p99 = np.percentile(values, [50, 90, 99])
+            stats[stage] = {
+                "count": len(values),
+                "total": values.sum(),
+                "p50": p50,
+                "p90": p90,
+                "p99": p99,
+                "max": values.max(),
+            }
+        return stats
+
+
+class PipelineObserver:
+    """The observer of the benchmarked Mqtt: the firehose plus one coach per driver.
+
+    Coaches are ``CoachCopilotsNoHistory``, which persist through their own
+    ``PersisterDb``. Without ``coach`` only a ``PersisterDb`` per driver is run.
+    """
+
+    def __init__(self, timer: StageTimer, coach=True, clock: Optional[SimulatedClock] = None):
+        self.timer = timer
+        self.coach = coach
+        self.clock = clock
+        self.firehose = ActiveDrivers()
+        self.firehose_notify = timer.wrap("firehose", self.firehose.notify)
+        self.observers: Dict[str, object] = {}
+        self.start = timer.wrap("start", self.create_observer)
+
+    def create_observer(self, driver_name):
+        driver, created = Driver.objects.get_or_create(name=driver_name)
+        if not self.coach:
+            persister = PersisterDb(driver)
+            self.simulate(persister)
+            persister.notify = self.timer.wrap("persister", persister.notify)
+            return persister
+        coach_model, created = Coach.objects.get_or_create(driver=driver, defaults={"enabled": True})
+        coach = CoachCopilotsNoHistory(coach_model)
+        self.simulate(coach.persister)
+        coach.persister.notify = self.timer.wrap("persister", coach.persister.notify)
+        coach.notify = self.timer.wrap("coach", coach.notify)
+        return coach
+
+    def simulate(self, persister: PersisterDb):
+        # flushed every flush_latency seconds of telemetry, like a live driver
+        if self.clock:
+            persister.write_behind.clock = self.clock
+
+    def notify(self, topic, payload, now=None):
+        self.firehose_notify(topic, payload, now)
+        driver_name = topic.split("/")[1]
+        observer = self.observers.get(driver_name)
+        if observer is None:
+            observer = self.start(driver_name)
+            self.observers[driver_name] = observer
+        return observer.notify(topic, payload, now)
+
+    def on_stop(self):
+        on_stop = self.timer.wrap("flush", lambda observer: observer.on_stop())
+        for observer in self.observers.values():
+            on_stop(observer)
+
+
+class PipelineBenchmark:
+    """Push generated telemetry through Mqtt.on_message and measure every stage.
+
+    No broker is involved, the paho client of the Mqtt is replaced by a
+    ``FakeClient`` and messages are handed to ``on_message`` directly.
+    """
+
+    def __init__(self, generator: LoadGenerator, coach=True):
+        self.generator = generator
+        # start cold, rows cached by an earlier run may have been rolled back
+        dimension_cache.clear()
+        for topic, payloads, offset in generator.driver_streams():
+            # the pitcrew only handles games that exist
+            Game.objects.get_or_create(name=topic.split("/")[3])
+        self.timer = StageTimer()
+        self.clock = SimulatedClock()
+        self.observer = PipelineObserver(self.timer, coach=coach, clock=self.clock)
+        self.mqtt = Mqtt(self.observer, "crewchief/#")
+        self.mqtt.mqttc = FakeClient()
+        decoder = decoder_for(self.observer)
+        decoder.decode = self.timer.wrap("decode", decoder.decode)
+        self.mqtt.decoder = decoder
+        self.queries = 0
+
+    def count_query(self, execute, sql, params, many, context):
+        self.queries += 1
+        return execute(sql, params, many, context)
+
+    def run(self) -> dict:
+        on_message = self.timer.wrap("on_message", self.mqtt.on_message)
+        ticks = 0
+        with connection.execute_wrapper(self.count_query):
+            start = time.perf_counter()
+            for message in self.generator.messages():
+                self.clock.seconds = ticks // self.generator.drivers / self.generator.hz
+                on_message(None, None, message)
+                ticks += 1
+            self.observer.on_stop()
+            seconds = time.perf_counter() - start
+
+        ticks_per_second = ticks / seconds if seconds else 0.0
+        return {
+            "ticks": ticks,
+            "seconds": seconds,
+            "ticks_per_second": ticks_per_second,
+            # how many drivers sending at hz this process keeps up with
+            "driver_capacity": ticks_per_second / self.generator.hz,
+            "queries": self.queries,
+            "queries_per_tick": self.queries / ticks if ticks else 0.0,
+            # per second of telemetry of all drivers, independent of how fast the ticks ran
+            "queries_per_simulated_second": self.queries / self.generator.seconds if self.generator.seconds else 0.0,
+            "published": self.mqtt.mqttc.published,
+            "stages": self.timer.stats(),
+        }
@@ -0,0 +1,228 @@
+"""Prometheus metrics of the pitcrew hot path.
+
+Stages are timed by the callers with ``time.perf_counter`` and reported with
+``observe``. A prometheus_client Histogram costs ~2us per observation, too
+much for several stages of every 60Hz tick, so stages and ticks are counted
+in plain lists and dicts and only turned into metrics when ``/metrics`` is
+scraped, see ``PitcrewCollector``. Setting ``B4MAD_RACING_PITCREW_METRICS=0``
+turns the recording off.
+
+The shard processes of the ``ShardedFirehose`` send their ``snapshot`` with
+their reports, the process serving ``/metrics`` adds them to its own counts.
+
+Importing this module registers nothing, Django imports it in the web app
+too. The pitcrew calls ``register`` before it serves ``/metrics``.
+"""
+
+import bisect
+import os
+import threading
+import time
+import weakref
+from typing import Dict, List
+
+from prometheus_client import REGISTRY
+from prometheus_client.core import (
+    CounterMetricFamily,
+    GaugeMetricFamily,
+    HistogramMetricFamily,
+)
+
+enabled = os.environ.get("B4MAD_RACING_PITCREW_METRICS", "1") not in ("0", "false", "False")
+
+# a 60Hz tick has 16ms, most stages take microseconds
+STAGE_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+ROW_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+# topics without ticks for this long are dropped from pitcrew_ticks, topics contain session ids
+TOPIC_IDLE_SECONDS = 600
+
+
+class Stage:
+    """A pipeline stage, ``observe`` the seconds it took."""
+
+    __slots__ = ("name", "buckets", "counts", "sum", "lock")
+
+    def __init__(self, name, buckets=STAGE_BUCKETS):
+        self.name = name
+        self.buckets = buckets
+        # one count per bucket plus +Inf, not cumulative
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, seconds):
+        if not enabled:
+            return
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += seconds
+
+    def snapshot(self):
+        with self.lock:
+            return list(self.counts), self.sum
+
+
+DECODE = Stage("decode")
+NOTIFY = Stage("notify")
+PERSISTER = Stage("persister")
+# Session.signal and signal_batch including the segment analysis, timed by the persister
+ANALYZE = Stage("analyze")
+SAVE_SESSIONS = Stage("save_sessions")
+COPILOTS = Stage("copilots")
+ARCHIVE = Stage("archive")
+STAGES = [DECODE, NOTIFY, PERSISTER, ANALYZE, SAVE_SESSIONS, COPILOTS, ARCHIVE]
+
+# write-behind flushes, exported as histograms of their own
+FLUSH_ROWS = Stage("pitcrew_flush_rows", buckets=ROW_BUCKETS)
+FLUSH_SECONDS = Stage("pitcrew_flush_seconds")
+FLUSHES = [FLUSH_ROWS, FLUSH_SECONDS]
+
+# topic: [ticks, monotonic time of the last tick]
+_ticks: Dict[str, List] = {}
+_ticks_lock = threading.Lock()
+_next_sweep = 0.0
+
+# the last snapshot of every shard process
+_shards: Dict[int, dict] = {}
+_shards_lock = threading.Lock()
+
+
+def tick(topic):
+    global _next_sweep
+    if not enabled:
+        return
+    now = time.monotonic()
+    with _ticks_lock:
+        entry = _ticks.get(topic)
+        if entry is None:
+            _ticks[topic] = [1, now]
+        else:
+            entry[0] += 1
+            entry[1] = now
+        sweep = now >= _next_sweep
+        if sweep:
+            _next_sweep = now + TOPIC_IDLE_SECONDS / 10
+    if sweep:
+        forget_idle_topics(now)
+
+
+def forget_idle_topics(now=None, idle=TOPIC_IDLE_SECONDS):
+    """Drop the tick counts of topics without ticks for ``idle`` seconds, in the process ticking them."""
+    now = time.monotonic() if now is None else now
+    with _ticks_lock:
+        for topic in [topic for topic, (count, last) in _ticks.items() if now - last > idle]:
+            del _ticks[topic]
+
+
+def forget_topic(topic):
+    """Drop the tick count of an inactive topic, topics contain session ids."""
+    with _ticks_lock:
+        _ticks.pop(topic, None)
+
+
+def flushed(rows, seconds):
+    FLUSH_ROWS.observe(rows)
+    FLUSH_SECONDS.observe(seconds)
+
+
+def reset():
+    """Start from zero in a forked shard process, the counts of the parent are its own."""
+    for stage in STAGES + FLUSHES:
+        with stage.lock:
+            stage.counts = [0] * len(stage.counts)
+            stage.sum = 0.0
+    with _ticks_lock:
+        _ticks.clear()
+    with _shards_lock:
+        _shards.clear()
+    collector.queues.clear()
+
+
+def snapshot() -> dict:
+    """Return the counts of this process, for the process serving ``/metrics``."""
+    return {
+        "stages": {stage.name: stage.snapshot() for stage in STAGES + FLUSHES},
+        "queues": {name: queue.stats() for name, queue in list(collector.queues.items())},
+    }
+
+
+def merge_shard(shard: int, counts: dict):
+    """Keep the latest ``snapshot`` of a shard process, its counts only grow."""
+    with _shards_lock:
+        _shards[shard] = counts
+
+
+def histogram_buckets(stage, counts):
+    buckets = []
+    cumulative = 0
+    for le, count in zip([str(le) for le in stage.buckets] + ["+Inf"], counts):
+        cumulative += count
+        buckets.append((le, cumulative))
+    return buckets
+
+
+class PitcrewCollector:
+    """Turn the stage counts, ticks and live queues into metrics when scraped."""
+
+    def __init__(self):
+        self.queues = weakref.WeakValueDictionary()
+
+    def register_queue(self, name, queue):
+        """``queue`` needs a ``stats()`` with ``depth`` and ``dropped``."""
+        self.queues[name] = queue
+
+    def stage_counts(self, stage, shards):
+        counts, total = stage.snapshot()
+        for number, shard in shards:
+            shard_counts, shard_total = shard["stages"].get(stage.name, ((0,) * len(counts), 0.0))
+            counts = [count + shard_count for count, shard_count in zip(counts, shard_counts)]
+            total += shard_total
+        return histogram_buckets(stage, counts), total
+
+    def collect(self):
+        with _shards_lock:
+            shards = sorted(_shards.items())
+
+        stages = HistogramMetricFamily("pitcrew_stage_seconds", "Time spent in a stage of the pitcrew telemetry pipeline", labels=["stage"])
+        for stage in STAGES:
+            stages.add_metric([stage.name], *self.stage_counts(stage, shards))
+        yield stages
+
+        for stage, documentation in [(FLUSH_ROWS, "Rows written per write-behind flush"), (FLUSH_SECONDS, "Time spent per write-behind flush")]:
+            family = HistogramMetricFamily(stage.name, documentation)
+            family.add_metric([], *self.stage_counts(stage, shards))
+            yield family
+
+        ticks = CounterMetricFamily("pitcrew_ticks", "Telemetry messages received per topic", labels=["topic"])
+        with _ticks_lock:
+            topics = [(topic, count) for topic, (count, last) in _ticks.items()]
+        for topic, count in topics:
+            ticks.add_metric([topic], count)
+        yield ticks
+
+        queues = [(name, queue.stats()) for name, queue in list(self.queues.items())]
+        for number, shard in shards:
+            queues += [(f"shard-{number}/{name}", stats) for name, stats in shard["queues"].items()]
+        depth = GaugeMetricFamily("pitcrew_queue_depth", "Messages waiting in a pitcrew queue", labels=["queue"])
+        dropped = CounterMetricFamily("pitcrew_queue_dropped", "Messages dropped by a full pitcrew queue", labels=["queue"])
+        for name, stats in queues:
+            depth.add_metric([name], stats["depth"])
+            dropped.add_metric([name], stats["dropped"])
+        yield depth
+        yield dropped
+
+
+collector = PitcrewCollector()
+_registered = False
+_registered_lock = threading.Lock()
+
+
+def register(registry=REGISTRY):
+    """Export the pitcrew metrics from the registry, once."""
+    global _registered
+    with _registered_lock:
+        if not _registered:
+            registry.register(collector)
+            _registered = True
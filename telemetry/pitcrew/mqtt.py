@@ -1,13 +1,17 @@
 #!/usr/bin/env python3
 
-import json
 import logging
 import threading
+import time
 
 import paho.mqtt.client as mqtt
 
 from telemetry.utils import get_mqtt_config
 
+from . import metrics
+from .ingest_queue import IngestQueue
+from .telemetry_decoder import decoder_for
+
 _LOGGER = logging.getLogger(__name__)
 
 (
@@ -19,7 +23,7 @@ _LOGGER = logging.getLogger(__name__)
 
 
 class Mqtt:
-    def __init__(self, observer, topic, replay: bool = False, debug=False):
+    def __init__(self, observer, topic, replay: bool = False, debug=False, queue_size=0, queue_workers=1, queue_policy=IngestQueue.POLICY_DROP_OLDEST, decoder=None):
         mqttc = mqtt.Client()
         mqttc.on_message = self.on_message
         mqttc.on_connect = self.on_connect
@@ -34,6 +38,13 @@ class Mqtt:
         self._stop_event = threading.Event()
         self.ready = False
         self.debug = debug
+        # only the telemetry fields the observer declared are decoded
+        self.decoder = decoder or decoder_for(observer)
+        # with a queue, observers are notified from worker threads instead of the network thread
+        self.ingest_queue = None
+        if queue_size:
+            self.ingest_queue = IngestQueue(self.dispatch, workers=queue_workers, maxsize=queue_size, policy=queue_policy)
+            metrics.collector.register_queue(topic, self.ingest_queue)
 
     # def __del__(self):
     #     # disconnect from broker
@@ -43,6 +54,8 @@ class Mqtt:
 
     def stop(self):
         self._stop_event.set()
+        # loop_forever returns right away instead of on the next message, run() then stops the observer
+        self.mqttc.disconnect()
 
     def stopped(self):
         return self._stop_event.is_set()
@@ -71,13 +84,27 @@ class Mqtt:
             # remove replay/ prefix from session
             topic = topic[7:]
 
+        start = time.perf_counter()
         try:
-            payload = json.loads(msg.payload.decode("utf-8")).get("telemetry")
+            payload = self.decoder.decode(msg.payload)
         except Exception as e:
             logging.error("Error decoding payload: %s", e)
             return
+        metrics.DECODE.observe(time.perf_counter() - start)
+        metrics.tick(topic)
 
-        response = self.observer.notify(topic, payload)
+        if self.ingest_queue:
+            self.ingest_queue.put(topic, payload)
+        else:
+            self.dispatch(topic, payload)
+
+    def dispatch(self, topic, payload, now=None):
+        start = time.perf_counter()
+        if now:
+            response = self.observer.notify(topic, payload, now)
+        else:
+            response = self.observer.notify(topic, payload)
+        metrics.NOTIFY.observe(time.perf_counter() - start)
         if response:
             (r_topic, r_payload) = response
             payloads = r_payload
@@ -87,7 +114,7 @@ class Mqtt:
             for r_payload in payloads:
                 meters = payload.get("DistanceRoundTrack", 0)
                 logging.debug("r-->: %s: %s : %s", meters, r_topic, r_payload)
-                mqttc.publish(r_topic, r_payload)
+                self.mqttc.publish(r_topic, r_payload)
 
     def on_connect(self, mqttc, obj, flags, rc):
         _LOGGER.debug("on_connect rc: %s", str(rc))
@@ -119,9 +146,13 @@ class Mqtt:
         if self.replay:
             self.topic = f"replay/{self.topic}"
 
+        if self.ingest_queue:
+            self.ingest_queue.start()
         self.mqttc.loop_forever()
         # check if observer has a on_stop method
         logging.debug("MQTT client stopped")
+        if self.ingest_queue:
+            self.ingest_queue.stop()
 
         if hasattr(self.observer, "on_stop") and callable(getattr(self.observer, "on_stop")):
             logging.debug("calling observer.on_stop")
@@ -1,15 +1,27 @@
+import time
 from typing import Dict, Optional
 
 import django.utils.timezone
 from loguru import logger
 
-from telemetry.models import CarClass, Driver, Game, Session, SessionType
+from telemetry.models import Driver, Session
+
+from . import metrics
+from .dimension_cache import dimension_cache
+from .write_behind import WriteBehind
 
 
 class PersisterDb:
-    def __init__(self, driver: Driver, debug=False):
+    telemetry_fields = ("CarClass",) + Session.TELEMETRY_FIELDS
+
+    def __init__(self, driver: Driver, debug=False, flush_latency=5.0, flush_interval=None):
         self.debug = debug
         self.driver = driver
+        # laps, sessions and segments are written in batches, at most flush_latency seconds late
+        self.write_behind = WriteBehind(max_latency=flush_latency)
+        if flush_interval:
+            # live telemetry can stop at any tick, a timer writes the last changes
+            self.write_behind.start(flush_interval)
         self.sessions: Dict[str, Optional[Session]] = {}
         self.clear_ticks = 0
         self.clear_interval = 60 * 60 * 5  # ticks. telemetry is sent at 60hz, so 60*60*5 = 5 minutes
@@ -18,7 +30,43 @@ class PersisterDb:
         # self.save_interval = 60
 
     def notify(self, topic, payload, now=None):
+        start = time.perf_counter()
         now = now or django.utils.timezone.now()
+        # the timer of the write-behind must not flush a half-analyzed tick
+        with self.write_behind.lock:
+            session = self.session(topic, payload)
+            if topic not in self.sessions:
+                return
+            if session:
+                analyze = time.perf_counter()
+                session.signal(payload, now)
+                metrics.ANALYZE.observe(time.perf_counter() - analyze)
+            self.save_sessions(now)
+            self.write_behind.flush_if_due()
+        metrics.PERSISTER.observe(time.perf_counter() - start)
+
+    def notify_batch(self, topic, columns, times):
+        """Notify a block of ticks of a topic at once, see ``Session.signal_batch``.
+
+        ``columns`` maps the telemetry fields to the values of the ticks,
+        ``times`` are the datetimes of the ticks.
+        """
+        if not len(times):
+            return
+        first = {name: values[0] for name, values in columns.items()}
+        with self.write_behind.lock:
+            session = self.session(topic, first)
+            if topic not in self.sessions:
+                return
+            if session:
+                analyze = time.perf_counter()
+                session.signal_batch(columns, times)
+                metrics.ANALYZE.observe(time.perf_counter() - analyze)
+            self.save_ticks += len(times) - 1
+            self.save_sessions(times[-1])
+            self.write_behind.flush_if_due()
+
+    def session(self, topic, payload) -> Optional[Session]:
         if topic not in self.sessions:
             logger.debug(f"New session: {topic}")
             try:
@@ -33,11 +81,11 @@ class PersisterDb:
                 ) = topic.split("/")
             except ValueError:
                 # ignore invalid session
-                return
+                return None
 
             if session_type == "NewSession":
                 logger.info(f"Ignoring NewSession for {topic}")
-                return
+                return None
 
             car_class = payload.get("CarClass", "")
             session = self.get_session(
@@ -50,35 +98,23 @@ class PersisterDb:
             )
             self.sessions[topic] = session
             if session:
-                session.prepare_for_analysis()
+                session.prepare_for_analysis(write_behind=self.write_behind)
 
-        session = self.sessions[topic]
-        if session:
-            session.signal(payload, now)
-        self.save_sessions(now)
+        return self.sessions[topic]
 
     def get_session(self, session_id, game, track, car, session_type, car_class) -> Optional[Session]:
         try:
-            r_game = Game.objects.get(name=game)
+            r_game = dimension_cache.game(game, create=False)
             logger.debug(f"Car class: {car_class} / Car: {car}")
             if car_class:
-                r_car_class, car_class_created = CarClass.objects.get_or_create(name=car_class, game=r_game)
-                if car_class_created:
-                    logger.debug(f"Created new car class: {r_car_class}")
-                r_car, car_created = r_game.cars.get_or_create(name=car, car_class=r_car_class)
+                r_car_class = dimension_cache.car_class(r_game, car_class)
+                r_car = dimension_cache.car(r_game, car, car_class=r_car_class)
             else:
-                r_car, car_created = r_game.cars.get_or_create(name=car)
-
-            if car_created:
-                logger.debug(f"Created new car: {r_car}")
-
-            r_track, track_created = r_game.tracks.get_or_create(name=track)
-            if track_created:
-                logger.debug(f"Created new track: {r_track}")
-                # Set a default track length if it's a new track
-                r_track.length = 10  # Default length in meters
-                r_track.save()
-            r_session_type, _created = SessionType.objects.get_or_create(type=session_type)
+                r_car = dimension_cache.car(r_game, car)
+
+            # Set a default track length if it's a new track
+            r_track = dimension_cache.track(r_game, track, defaults={"length": 10})
+            r_session_type = dimension_cache.session_type(session_type)
             session, session_created = Session.objects.get_or_create(
                 session_id=session_id,
                 driver=self.driver,
@@ -100,7 +136,10 @@ class PersisterDb:
 
     def on_stop(self):
         logger.debug("Persister: on_stop")
-        self.save_sessions(django.utils.timezone.now(), force=True)
+        self.write_behind.stop()
+        with self.write_behind.lock:
+            self.save_sessions(django.utils.timezone.now(), force=True)
+            self.write_behind.flush()
 
     def save_sessions(self, now, force=False):
         if not force:
@@ -109,10 +148,12 @@ class PersisterDb:
                 return
             self.save_ticks = 0
 
+        start = time.perf_counter()
         for topic, session in self.sessions.items():
             if session:
                 session.save_analysis()
         self.clear_sessions(now)
+        metrics.SAVE_SESSIONS.observe(time.perf_counter() - start)
 
     def clear_sessions(self, now):
         """Clear inactive telemetry sessions.
@@ -0,0 +1,316 @@
+import logging
+import multiprocessing
+import threading
+import time
+import zlib
+from multiprocessing.connection import Connection, wait
+from typing import Callable, Dict, List, Optional, Set
+
+import django.db
+import django.utils.timezone
+
+from . import metrics
+from .active_drivers import ActiveDrivers
+from .dimension_cache import dimension_cache
+from .ingest_queue import IngestQueue
+from .telemetry_decoder import decoder_for
+from .tick_archive import tick_archive
+
+_LOGGER = logging.getLogger(__name__)
+
+
+def shard_for(topic: str, shards: int) -> int:
+    """Return the shard owning a topic.
+
+    Topics are partitioned by driver, so all sessions of a driver, and its
+    coach, live in one process. Topics without a driver go by the full topic.
+    """
+    frags = topic.split("/", 2)
+    key = frags[1] if len(frags) > 2 and frags[1] else topic
+    return zlib.crc32(key.encode("utf-8")) % shards
+
+
+class ShardWorker:
+    """Runs in a shard process: decodes the forwarded payloads and notifies the observer.
+
+    Messages from the dispatcher arrive on ``inbox``:
+
+    * ``("message", topic, payload, now)``: raw MQTT payload bytes of a topic
+    * ``("sync", driver_names)``: stop the coaches of inactive drivers
+    * ``("stop",)``
+
+    The worker sends its active drivers and the coach responses on ``outbox``:
+
+    * ``("drivers", shard, driver_names, processed)`` every ``report_interval`` seconds
+    * ``("metrics", shard, snapshot)`` with every report, see ``metrics.snapshot``
+    * ``("publish", topic, payload)``
+    """
+
+    def __init__(self, number: int, inbox: Connection, outbox: Connection, observer_factory: Callable, report_interval=5.0):
+        self.number = number
+        self.inbox = inbox
+        self.outbox = outbox
+        self.observer_factory = observer_factory
+        self.report_interval = report_interval
+        self.processed = 0
+        self._send_lock = threading.Lock()
+
+    def send(self, message):
+        # coach responses are sent from the coach runtime threads
+        with self._send_lock:
+            self.outbox.send(message)
+
+    def publish(self, topic, payload):
+        self.send(("publish", topic, payload))
+
+    def report(self, firehose: ActiveDrivers):
+        names = sorted({driver.name for driver in firehose.drivers()})
+        self.send(("drivers", self.number, names, self.processed))
+        self.send(("metrics", self.number, metrics.snapshot()))
+
+    def run(self):
+        metrics.reset()
+        firehose, observer = self.observer_factory(self)
+        decoder = decoder_for(observer)
+        runtime_thread = None
+        if observer is not firehose and hasattr(observer, "run"):
+            runtime_thread = threading.Thread(target=observer.run, name=f"coach_runtime-{self.number}")
+            runtime_thread.start()
+
+        next_report = time.monotonic()
+        while True:
+            if time.monotonic() >= next_report:
+                try:
+                    self.report(firehose)
+                except Exception as e:
+                    _LOGGER.exception(f"Error reporting drivers of shard {self.number}: {e}")
+                next_report = time.monotonic() + self.report_interval
+
+            if not self.inbox.poll(self.report_interval):
+                continue
+            try:
+                message = self.inbox.recv()
+            except EOFError:
+                break
+            kind = message[0]
+            if kind == "stop":
+                break
+            if kind == "sync":
+                if hasattr(observer, "sync"):
+                    observer.sync(message[1])
+                continue
+
+            topic, payload, now = message[1:]
+            try:
+                telemetry = decoder.decode(payload)
+            except Exception as e:
+                _LOGGER.error("Error decoding payload: %s", e)
+                continue
+            try:
+                response = observer.notify(topic, telemetry, now)
+            except Exception as e:
+                _LOGGER.exception(f"Error handling message for {topic}: {e}")
+                continue
+            self.processed += 1
+            if response:
+                (r_topic, r_payloads) = response
+                if not isinstance(r_payloads, list):
+                    r_payloads = [r_payloads]
+                for r_payload in r_payloads:
+                    self.publish(r_topic, r_payload)
+
+        if runtime_thread:
+            observer.on_stop()
+            runtime_thread.join()
+        if getattr(firehose, "archive", None):
+            firehose.archive.stop()
+        self.send(("drivers", self.number, [], self.processed))
+        self.send(("metrics", self.number, metrics.snapshot()))
+        self.outbox.close()
+
+
+def default_observer_factory(coach_runtime=False, replay=False, debug=False, archive=""):
+    def factory(worker: ShardWorker):
+        firehose = ActiveDrivers(debug=debug, archive=tick_archive(archive))
+        if not coach_runtime:
+            return firehose, firehose
+        from .coach_runtime import CoachRuntime
+
+        return firehose, CoachRuntime(firehose, replay=replay, debug=debug, publish=worker.publish)
+
+    return factory
+
+
+def run_shard(number, inbox, outbox, observer_factory, report_interval):
+    ShardWorker(number, inbox, outbox, observer_factory, report_interval=report_interval).run()
+
+
+class ShardedFirehose:
+    """Spread the ``crewchief/#`` firehose over ``shards`` worker processes.
+
+    The MQTT client of the crew stays in this process and only forwards the
+    undecoded payload bytes over a pipe to the shard owning the topic, see
+    ``shard_for``. Every shard runs its own ``ActiveDrivers`` and, with
+    ``coach_runtime``, the coaches of its drivers, so decoding, persisting and
+    coaching scale with the number of cores.
+
+    The network thread only puts the payloads into an ``IngestQueue`` with a
+    worker per shard, which writes them to the pipe of the shard. A slow shard
+    fills its own queues, overflowing by the policy of the queue, and never
+    stalls the MQTT socket of the other drivers.
+
+    An aggregator thread collects the active drivers reported by the shards
+    and publishes the coach responses, so for the ``CoachWatcher`` this looks
+    like a single ``ActiveDrivers``.
+    """
+
+    def __init__(
+        self,
+        shards: int,
+        coach_runtime=False,
+        replay=False,
+        debug=False,
+        report_interval=5.0,
+        observer_factory: Optional[Callable] = None,
+        archive="",
+        queue_size=600,
+    ):
+        self.shards = shards
+        self.report_interval = report_interval
+        self.observer_factory = observer_factory or default_observer_factory(coach_runtime=coach_runtime, replay=replay, debug=debug, archive=archive)
+        # set to the publish method of the Mqtt client once it exists
+        self.publish: Optional[Callable] = None
+        self.inboxes: List[Connection] = []
+        self.outboxes: List[Connection] = []
+        self.processes: List[multiprocessing.Process] = []
+        self._inbox_locks: List[threading.Lock] = []
+        self.shard_drivers: Dict[int, List[str]] = {}
+        self.shard_processed: Dict[int, int] = {}
+        self.forwarded = 0
+        # replays can be slowed down, live telemetry must not stall the network thread
+        queue_policy = IngestQueue.POLICY_BLOCK if replay else IngestQueue.POLICY_DROP_OLDEST
+        self.queue = IngestQueue(self.forward, workers=shards, maxsize=queue_size, policy=queue_policy, partition=lambda topic: shard_for(topic, shards))
+        metrics.collector.register_queue("firehose_shards", self.queue)
+        self.ready = False
+        self._stop_event = threading.Event()
+        self._aggregator: Optional[threading.Thread] = None
+
+    def started(self):
+        return bool(self.processes)
+
+    def start(self):
+        """Fork the shard processes, before any other thread of this process is started."""
+        # the shards are forked, they must not share the database connections of this process
+        django.db.connections.close_all()
+        context = multiprocessing.get_context("fork")
+        for number in range(self.shards):
+            inbox_reader, inbox_writer = context.Pipe(duplex=False)
+            outbox_reader, outbox_writer = context.Pipe(duplex=False)
+            process = context.Process(
+                target=run_shard,
+                args=(number, inbox_reader, outbox_writer, self.observer_factory, self.report_interval),
+                name=f"firehose-shard-{number}",
+                daemon=True,
+            )
+            process.start()
+            # the ends used by the child are closed here, so EOF is seen when it exits
+            inbox_reader.close()
+            outbox_writer.close()
+            self.inboxes.append(inbox_writer)
+            self.outboxes.append(outbox_reader)
+            self._inbox_locks.append(threading.Lock())
+            self.processes.append(process)
+
+        self.queue.start()
+        self._aggregator = threading.Thread(target=self.aggregate, name="firehose-aggregator", daemon=True)
+        self._aggregator.start()
+        self.ready = True
+
+    def send(self, shard: int, message):
+        # the MQTT thread forwards messages while the coach watcher syncs
+        with self._inbox_locks[shard]:
+            self.inboxes[shard].send(message)
+
+    def notify(self, topic, payload, now=None):
+        """Queue a raw payload for its shard, called from the MQTT network thread."""
+        now = now or django.utils.timezone.now()
+        self.queue.put(topic, payload, now)
+        self.forwarded += 1
+
+    def forward(self, topic, payload, now):
+        # runs in the queue worker of the shard
+        self.send(shard_for(topic, self.shards), ("message", topic, payload, now))
+
+    def aggregate(self):
+        outboxes = list(self.outboxes)
+        while outboxes:
+            for connection in wait(outboxes, timeout=1.0):
+                try:
+                    message = connection.recv()
+                except EOFError:
+                    outboxes.remove(connection)
+                    continue
+                kind = message[0]
+                if kind == "drivers":
+                    _, shard, names, processed = message
+                    self.shard_drivers[shard] = names
+                    self.shard_processed[shard] = processed
+                elif kind == "metrics":
+                    _, shard, counts = message
+                    metrics.merge_shard(shard, counts)
+                elif kind == "publish" and self.publish:
+                    _, r_topic, r_payload = message
+                    logging.debug("r-->: %s : %s", r_topic, r_payload)
+                    self.publish(r_topic, r_payload)
+
+    def driver_names(self) -> Set[str]:
+        names = set()
+        for shard_names in list(self.shard_drivers.values()):
+            names.update(shard_names)
+        return names
+
+    def drivers(self):
+        """Return set of all active drivers of all shards"""
+        return {dimension_cache.driver(name) for name in self.driver_names()}
+
+    def sync(self, drivers):
+        """Stop the coaches of inactive drivers in all shards."""
+        names = sorted({getattr(driver, "name", driver) for driver in drivers})
+        for shard in range(len(self.inboxes)):
+            self.send(shard, ("sync", names))
+
+    def stats(self):
+        return {
+            "shards": self.shards,
+            "forwarded": self.forwarded,
+            "queue": self.queue.stats(),
+            "processed": dict(self.shard_processed),
+            "drivers": {shard: len(names) for shard, names in self.shard_drivers.items()},
+        }
+
+    def stopped(self):
+        return self._stop_event.is_set()
+
+    def stop(self, timeout=60):
+        if self.stopped():
+            return
+        self._stop_event.set()
+        # the queued payloads are forwarded before the shards stop
+        self.queue.stop(timeout)
+        for shard in range(len(self.inboxes)):
+            try:
+                self.send(shard, ("stop",))
+            except (BrokenPipeError, OSError):
+                pass
+        for process in self.processes:
+            process.join(timeout)
+            if process.is_alive():
+                _LOGGER.error(f"{process.name} did not stop, terminating it")
+                process.terminate()
+        if self._aggregator:
+            self._aggregator.join(timeout)
+        self.ready = False
+
+    def on_stop(self):
+        # called by Mqtt.run when the client disconnected
+        self.stop()
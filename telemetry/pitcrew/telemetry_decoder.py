@@ -0,0 +1,169 @@
+import json
+import re
+from collections.abc import Mapping
+from functools import lru_cache
+from typing import Iterable, Optional, Tuple
+
+
+class TelemetryRecord(Mapping):
+    """A read-only, fixed-field telemetry tick.
+
+    Subclasses are created by ``record_type`` with one slot per field. A field
+    missing from the payload is a missing key, just like with the dict the
+    observers used to get, so ``record["Brake"]`` raises ``KeyError`` and
+    ``record.get("Brake")`` returns ``None``.
+    """
+
+    __slots__ = ()
+    fields: Tuple[str, ...] = ()
+    field_set: frozenset = frozenset()
+
+    def __getitem__(self, key):
+        if key not in self.field_set:
+            raise KeyError(key)
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __iter__(self):
+        return (field for field in self.fields if hasattr(self, field))
+
+    def __len__(self):
+        return sum(1 for field in self.fields if hasattr(self, field))
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.to_dict()})"
+
+    def to_dict(self) -> dict:
+        return dict(self.items())
+
+
+@lru_cache(maxsize=None)
+def record_type(fields: Tuple[str, ...]) -> type:
+    """Return the TelemetryRecord subclass holding exactly these fields."""
+    reserved = [field for field in fields if hasattr(TelemetryRecord, field)]
+    if reserved:
+        raise ValueError(f"telemetry fields clash with record attributes: {reserved}")
+    return type(
+        "TelemetryRecord",
+        (TelemetryRecord,),
+        {"__slots__": fields, "fields": fields, "field_set": frozenset(fields)},
+    )
+
+
+class JsonDecoder:
+    """Decode the whole telemetry of a payload into a dict."""
+
+    def decode(self, payload: bytes) -> Optional[dict]:
+        return json.loads(payload.decode("utf-8")).get("telemetry")
+
+
+class RawDecoder:
+    """Pass the payload bytes on undecoded, for observers forwarding them elsewhere."""
+
+    def decode(self, payload: bytes) -> bytes:
+        return payload
+
+
+class ProjectingDecoder:
+    """Decode the payload and keep only the declared fields in a TelemetryRecord."""
+
+    def __init__(self, fields: Iterable[str]):
+        self.fields = tuple(fields)
+        self.record_type = record_type(self.fields)
+
+    def project(self, telemetry: Mapping) -> TelemetryRecord:
+        record = self.record_type()
+        for field in self.fields:
+            value = telemetry.get(field, record)
+            if value is not record:
+                setattr(record, field, value)
+        return record
+
+    def decode(self, payload: bytes) -> Optional[TelemetryRecord]:
+        telemetry = json.loads(payload.decode("utf-8")).get("telemetry")
+        if telemetry is None:
+            return None
+        return self.project(telemetry)
+
+
+class ScanningDecoder(ProjectingDecoder):
+    """Extract the declared fields straight from the payload bytes.
+
+    CrewChief sends a flat telemetry object, so every field can be found by
+    its quoted key and parsed on its own, without parsing or decoding the rest
+    of the payload. This beats a full parse only for a handful of fields.
+
+    Keys are only looked up between the start of the telemetry object and the
+    first closing brace after it. A key beyond that brace may belong to the
+    rest of the payload, so such payloads are parsed in full instead.
+    """
+
+    CONSTANTS = {b"true": True, b"false": False, b"null": None}
+    TELEMETRY = re.compile(rb'"telemetry"\s*:\s*\{')
+
+    def __init__(self, fields: Iterable[str]):
+        super().__init__(fields)
+        self.keys = [(field, f'"{field}":'.encode("utf-8")) for field in self.fields]
+
+    def value_at(self, payload: bytes, start: int):
+        # skip whitespace between the colon and the value
+        while payload[start] in b" \t\r\n":
+            start += 1
+        if payload[start] == 0x22:  # a string, find the closing quote
+            end = start + 1
+            while True:
+                end = payload.index(b'"', end)
+                backslashes = 0
+                while payload[end - 1 - backslashes] == 0x5C:
+                    backslashes += 1
+                if backslashes % 2 == 0:
+                    return json.loads(payload[start : end + 1])
+                end += 1
+
+        end = start
+        length = len(payload)
+        while end < length and payload[end] not in b",} \t\r\n":
+            end += 1
+        token = payload[start:end]
+        if token in self.CONSTANTS:
+            return self.CONSTANTS[token]
+        return json.loads(token)
+
+    def decode(self, payload: bytes) -> Optional[TelemetryRecord]:
+        match = self.TELEMETRY.search(payload)
+        if match is None or payload.find(b'"telemetry"', match.end()) >= 0:
+            # no telemetry object, a null one or more than one candidate
+            return super().decode(payload)
+        begin = match.end()
+        # a brace inside a string ends the object early, which only costs a full parse
+        end = payload.find(b"}", begin)
+        record = self.record_type()
+        for field, key in self.keys:
+            start = payload.find(key, begin)
+            if start < 0:
+                continue
+            if start > end:
+                return super().decode(payload)
+            setattr(record, field, self.value_at(payload, start + len(key)))
+        return record
+
+
+# up to this many declared fields scanning is faster than a full parse,
+# see the benchmark_decoder management command
+SCAN_MAX_FIELDS = 2
+
+
+def decoder_for(observer):
+    """Pick a decoder for the telemetry fields an observer declared.
+
+    Observers declare the fields they read in ``telemetry_fields``. Observers
+    without a declaration, like the copilot apps, get the full dict.
+    """
+    fields = getattr(observer, "telemetry_fields", None)
+    if fields is None:
+        return JsonDecoder()
+    if len(fields) <= SCAN_MAX_FIELDS:
+        return ScanningDecoder(fields)
+    return ProjectingDecoder(fields)
@@ -0,0 +1,169 @@
+"""Archive the raw ticks the pitcrew sees in a local telemetry store.
+
+``TickArchive`` is notified with every decoded tick of the firehose. Ticks
+are appended to a column buffer per topic, plain python lists, and rolled
+into a lap of a ``LocalStore`` when ``CurrentLap`` changes, or when the topic
+was idle for ``idle_seconds``. The store keeps a manifest per session, so
+the archived laps are read like the laps in InfluxDB, without a round trip::
+
+    B4MAD_RACING_TELEMETRY_STORE=<directory of the archive>
+
+The laps are written by a single background thread, the MQTT thread only
+appends to the lists. A lap rolled while idle is appended to when the driver
+continues it.
+"""
+
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+import django.utils.timezone
+import pandas as pd
+
+from telemetry.local_store import LocalStore
+
+from . import metrics
+
+
+class TickBuffer:
+    """The ticks of a topic since the last roll, column by column."""
+
+    def __init__(self, topic, tags):
+        self.topic = topic
+        self.tags = tags
+        self.lap = None
+        self.rows = 0
+        self.times: List = []
+        self.columns: Dict[str, List] = {}
+        self.last_seen = time.monotonic()
+
+    def append(self, payload, now):
+        columns = self.columns
+        rows = self.rows
+        for name, value in payload.items():
+            column = columns.get(name)
+            if column is None:
+                # a field first seen now, missing in the earlier rows
+                column = columns[name] = [None] * rows
+            column.append(value)
+        self.rows = rows = rows + 1
+        for column in columns.values():
+            if len(column) < rows:
+                column.append(None)
+        self.times.append(now)
+        self.last_seen = time.monotonic()
+
+    def take(self) -> Optional[pd.DataFrame]:
+        """Return the buffered ticks as a dataframe and empty the buffer."""
+        if not self.rows:
+            return None
+        df = pd.DataFrame(self.columns)
+        df["_time"] = pd.to_datetime(self.times, utc=True)
+        df["_measurement"] = "laps_cc"
+        for name, value in self.tags.items():
+            df[name] = value
+        if "CurrentLap" in df.columns:
+            # a tag in influx
+            df["CurrentLap"] = df["CurrentLap"].astype(str)
+        self.rows = 0
+        self.times = []
+        self.columns = {}
+        return df
+
+
+class TickArchive:
+    def __init__(self, store: LocalStore, idle_seconds=60, measurement="laps_cc", bucket="racing"):
+        self.store = store
+        self.idle_seconds = idle_seconds
+        self.measurement = measurement
+        self.bucket = bucket
+        self.buffers: Dict[str, TickBuffer] = {}
+        self.laps_written = 0
+        self.next_idle_check = time.monotonic() + idle_seconds
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="tick_archive")
+
+    def buffer(self, topic) -> Optional[TickBuffer]:
+        buffer = self.buffers.get(topic)
+        if buffer is not None:
+            return buffer
+        try:
+            (prefix, driver, session_id, game, track, car, session_type) = topic.split("/")
+        except ValueError:
+            return None
+        tags = {
+            "topic": topic,
+            "user": driver,
+            "SessionId": session_id,
+            "GameName": game,
+            "TrackCode": track,
+            "CarModel": car,
+            "SessionTypeName": session_type,
+        }
+        buffer = self.buffers[topic] = TickBuffer(topic, tags)
+        return buffer
+
+    def notify(self, topic, payload, now=None):
+        start = time.perf_counter()
+        now = now or django.utils.timezone.now()
+        with self._lock:
+            buffer = self.buffer(topic)
+            if buffer is None:
+                return
+            lap = payload.get("CurrentLap")
+            if buffer.rows and lap != buffer.lap:
+                # the lap is complete
+                self.roll(buffer)
+            buffer.lap = lap
+            buffer.append(payload, now)
+        if buffer.last_seen >= self.next_idle_check:
+            self.flush_idle()
+        metrics.ARCHIVE.observe(time.perf_counter() - start)
+
+    def roll(self, buffer: TickBuffer):
+        df = buffer.take()
+        if df is not None:
+            self._executor.submit(self.write, df, buffer.tags["SessionId"], buffer.lap)
+
+    def write(self, df, session_id, lap):
+        try:
+            self.store.write_lap(df, session_id, lap, measurement=self.measurement, bucket=self.bucket, append=True)
+            self.laps_written += 1
+        except Exception as e:
+            logging.exception(f"TickArchive: could not write lap {lap} of session {session_id}: {e}")
+
+    def flush_idle(self):
+        """Roll and forget the topics idle for ``idle_seconds``."""
+        now = time.monotonic()
+        self.next_idle_check = now + self.idle_seconds
+        with self._lock:
+            for topic, buffer in list(self.buffers.items()):
+                if now - buffer.last_seen >= self.idle_seconds:
+                    self.roll(buffer)
+                    del self.buffers[topic]
+
+    def close(self, topic):
+        """Roll the ticks of a topic which ended."""
+        with self._lock:
+            buffer = self.buffers.pop(topic, None)
+            if buffer is not None:
+                self.roll(buffer)
+
+    def stop(self):
+        """Roll all buffers and wait for the laps to be written."""
+        with self._lock:
+            for buffer in self.buffers.values():
+                self.roll(buffer)
+            self.buffers = {}
+        self._executor.shutdown(wait=True)
+
+
+def tick_archive(directory=None) -> Optional[TickArchive]:
+    """Return the archive configured by ``B4MAD_RACING_TICK_ARCHIVE``, None if it is not set."""
+    directory = directory if directory is not None else os.environ.get("B4MAD_RACING_TICK_ARCHIVE", "")
+    if not directory:
+        return None
+    return TickArchive(LocalStore(directory))
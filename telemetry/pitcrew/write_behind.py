@@ -0,0 +1,153 @@
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+import django.utils.timezone
+from dirtyfields import DirtyFieldsMixin
+from dirtyfields.dirtyfields import reset_state
+from django.db import connection, models, transaction
+from loguru import logger
+
+from . import metrics
+
+
+class WriteBehind:
+    """Collect dirty model instances and write them in batches.
+
+    Instances are registered with ``add`` instead of being saved right away.
+    ``flush_if_due`` writes everything that is pending once the oldest pending
+    change is older than ``max_latency`` seconds, ``flush`` writes
+    unconditionally. A flush issues one ``bulk_update`` per model and set of
+    changed fields (and one ``bulk_create`` per model for new instances),
+    all in one transaction. The latency is measured with ``clock``, the load
+    generator replaces it with its simulated time.
+
+    A writer that stops sending telemetry also stops calling ``flush_if_due``.
+    ``start`` runs a timer thread calling it instead. Writers changing the
+    added instances hold ``lock``, so the timer never writes a half-updated
+    instance.
+    """
+
+    def __init__(self, max_latency=5.0, batch_size=500, clock: Callable[[], float] = time.monotonic):
+        self.max_latency = max_latency
+        self.batch_size = batch_size
+        self.clock = clock
+        self.lock = threading.RLock()
+        self.timer: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+        self.pending: Dict[Tuple[type, int], models.Model] = {}
+        self.pending_fields: Dict[Tuple[type, int], set] = {}
+        self.pending_since: Optional[float] = None
+        self.flushes = 0
+        self.rows_written = 0
+
+    def __len__(self):
+        return len(self.pending)
+
+    def add(self, instance: models.Model, fields=None):
+        if fields is None:
+            fields = self.changed_fields(instance)
+        if instance.pk is not None and not fields:
+            return
+
+        key = (type(instance), instance.pk if instance.pk is not None else id(instance))
+        with self.lock:
+            self.pending[key] = instance
+            self.pending_fields.setdefault(key, set()).update(fields)
+            if self.pending_since is None:
+                self.pending_since = self.clock()
+
+    def changed_fields(self, instance: models.Model):
+        if isinstance(instance, DirtyFieldsMixin):
+            return set(instance.get_dirty_fields(check_relationship=True).keys())
+        return {field.name for field in instance._meta.concrete_fields if not field.primary_key}
+
+    def is_due(self):
+        if self.pending_since is None:
+            return False
+        return self.clock() - self.pending_since >= self.max_latency
+
+    def flush_if_due(self):
+        with self.lock:
+            if self.is_due():
+                return self.flush()
+        return 0
+
+    def start(self, interval=1.0):
+        """Call ``flush_if_due`` every interval seconds in a thread until ``stop``."""
+        if self.timer is not None:
+            return
+        self._stop_event.clear()
+        self.timer = threading.Thread(target=self.run, args=(interval,), name="write-behind", daemon=True)
+        self.timer.start()
+
+    def stop(self):
+        if self.timer is None:
+            return
+        self._stop_event.set()
+        self.timer.join()
+        self.timer = None
+
+    def run(self, interval):
+        try:
+            while not self._stop_event.wait(interval):
+                try:
+                    self.flush_if_due()
+                except Exception as e:
+                    logger.exception(f"WriteBehind: flush failed: {e}")
+        finally:
+            # the connection of this thread
+            connection.close()
+
+    def flush(self):
+        with self.lock:
+            return self._flush()
+
+    def _flush(self):
+        if not self.pending:
+            return 0
+
+        start = time.perf_counter()
+        now = django.utils.timezone.now()
+        creates: Dict[type, list] = {}
+        updates: Dict[Tuple[type, frozenset], list] = {}
+        for key, instance in self.pending.items():
+            model = type(instance)
+            if instance.pk is None:
+                creates.setdefault(model, []).append(instance)
+                continue
+            # pick up changes made after the instance was added
+            fields = self.pending_fields[key] | self.changed_fields(instance)
+            fields.discard(model._meta.pk.name)
+            if hasattr(instance, "modified"):
+                instance.modified = now
+                fields.add("modified")
+            updates.setdefault((model, frozenset(fields)), []).append(instance)
+
+        rows = 0
+        with transaction.atomic():
+            for model, instances in creates.items():
+                model.objects.bulk_create(instances, batch_size=self.batch_size)
+                rows += len(instances)
+            for (model, fields), instances in updates.items():
+                model.objects.bulk_update(instances, list(fields), batch_size=self.batch_size)
+                rows += len(instances)
+
+        # bulk operations do not send post_save, so the dirty state is reset here
+        for model, instances in creates.items():
+            for instance in instances:
+                if isinstance(instance, DirtyFieldsMixin):
+                    reset_state(sender=model, instance=instance)
+        for (model, fields), instances in updates.items():
+            for instance in instances:
+                if isinstance(instance, DirtyFieldsMixin):
+                    reset_state(sender=model, instance=instance, update_fields=fields)
+
+        logger.debug(f"WriteBehind: flushed {rows} rows in {len(creates) + len(updates)} batches")
+        self.pending = {}
+        self.pending_fields = {}
+        self.pending_since = None
+        self.flushes += 1
+        self.rows_written += rows
+        metrics.flushed(rows, time.perf_counter() - start)
+        return rows
@@ -0,0 +1,174 @@
+"""Replay archived sessions of a ``LocalStore`` tick by tick.
+
+The replay commands used to turn every record of an influx query into a dict,
+delete the tags from it one by one and sleep a fixed time after every tick.
+``ReplaySource`` reads the memory-mapped columns of the laps, converts
+``batch_rows`` rows at a time to python values with ``tolist`` and yields
+``(topic, time_ns, telemetry)`` per tick, the telemetry dict is built once
+from the fields, without the tags.
+
+A ``Clock`` paces the ticks: ``FastClock`` replays as fast as possible,
+``RealTimeClock`` in real time times a factor and ``WaitClock`` sleeps a
+fixed time after every tick, like the replay commands always did.
+"""
+
+import heapq
+import os
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .local_store import TAGS, LocalStore, time_ns
+
+# tags are in the topic, but influx had CurrentLap as a tag in the payloads
+PAYLOAD_TAGS = TAGS - {"CurrentLap"}
+# the columns of influx records which are not telemetry
+RECORD_TAGS = frozenset(["result", "table", "_start", "_stop", "_time", "_measurement", "topic", "host", "CarModel", "GameName", "SessionId", "SessionTypeName", "TrackCode", "user"])
+
+Tick = Tuple[str, int, dict]
+Batch = Tuple[str, np.ndarray, Dict[str, np.ndarray]]
+
+
+class Clock:
+    def wait(self, tick_ns: int):
+        """Block until the tick at ``tick_ns`` is due."""
+
+
+class FastClock(Clock):
+    """As fast as possible."""
+
+
+class WaitClock(Clock):
+    def __init__(self, seconds):
+        self.seconds = seconds
+
+    def wait(self, tick_ns):
+        time.sleep(self.seconds)
+
+
+class RealTimeClock(Clock):
+    """Keep the time between ticks, divided by ``factor``.
+
+    The clock starts with the first tick, a replay falling behind catches up
+    without sleeping instead of drifting.
+    """
+
+    def __init__(self, factor=1.0):
+        self.factor = factor
+        self.first_ns: Optional[int] = None
+        self.started = 0.0
+
+    def wait(self, tick_ns):
+        if self.first_ns is None:
+            self.first_ns = tick_ns
+            self.started = time.monotonic()
+            return
+        due = self.started + (tick_ns - self.first_ns) / 1e9 / self.factor
+        delay = due - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+
+def clock(speed=None, wait=0.0) -> Clock:
+    """Return the clock of the replay options: ``speed`` 0 is as fast as possible, without ``speed`` sleep ``wait``."""
+    if speed is None:
+        return WaitClock(wait) if wait else FastClock()
+    if speed <= 0:
+        return FastClock()
+    return RealTimeClock(speed)
+
+
+def python_values(array) -> list:
+    """Return the values of a column as python objects, missing numbers are None."""
+    if array.dtype.kind == "f":
+        missing = np.isnan(array)
+        if missing.any():
+            values = np.asarray(array).astype(object)
+            values[missing] = None
+            return values.tolist()
+    return array.tolist()
+
+
+def record_ticks(records) -> Iterator[Tick]:
+    """Yield the ticks of influx records, as ``Influx.session`` and ``Influx.raw_stream`` return them."""
+    for record in records:
+        values = record.values
+        telemetry = {key: value for key, value in values.items() if key not in RECORD_TAGS}
+        yield values["topic"], pd.Timestamp(values["_time"]).value, telemetry
+
+
+class ReplaySource:
+    def __init__(self, store: LocalStore, batch_rows=4096):
+        self.store = store
+        self.batch_rows = batch_rows
+
+    def session(self, session_id, lap_numbers=None, start=None, end=None, measurement="laps_cc", bucket="racing") -> Iterator[Tick]:
+        """Yield the ticks of a session, or of its ``lap_numbers``, in time order."""
+        session_path = self.store.session_path(session_id, measurement=measurement, bucket=bucket)
+        manifest = self.store.manifest(session_path)
+        if manifest is None:
+            return
+        start, end = time_ns(start), time_ns(end)
+        for entry in self.store.laps(manifest, lap_numbers, start, end):
+            yield from self.lap(session_path, entry, start, end)
+
+    def session_batches(self, session_id, lap_numbers=None, start=None, end=None, measurement="laps_cc", bucket="racing") -> Iterator[Batch]:
+        """Yield the ticks of a session as (topic, times_ns, columns) blocks of one topic, see ``lap_batches``."""
+        session_path = self.store.session_path(session_id, measurement=measurement, bucket=bucket)
+        manifest = self.store.manifest(session_path)
+        if manifest is None:
+            return
+        start, end = time_ns(start), time_ns(end)
+        for entry in self.store.laps(manifest, lap_numbers, start, end):
+            yield from self.lap_batches(session_path, entry, start, end)
+
+    def lap_batches(self, session_path, entry, start=None, end=None) -> Iterator[Batch]:
+        """Yield up to ``batch_rows`` ticks of a lap at a time, the columns are slices of the memory-mapped arrays."""
+        columns = self.store.lap_columns(session_path, entry)
+        times = columns.pop("_time", None)
+        topics = columns.get("topic")
+        if times is None or topics is None:
+            return
+        fields = {name: array for name, array in columns.items() if name not in PAYLOAD_TAGS}
+        first, last = 0, len(times)
+        if start is not None:
+            first = int(np.searchsorted(times, start, side="left"))
+        if end is not None:
+            last = int(np.searchsorted(times, end, side="left"))
+        for offset in range(first, last, self.batch_rows):
+            stop = min(offset + self.batch_rows, last)
+            # a batch has the ticks of one topic
+            changes = (offset + 1 + np.flatnonzero(topics[offset + 1 : stop] != topics[offset : stop - 1])).tolist()
+            for begin, until in zip([offset] + changes, changes + [stop]):
+                yield topics[begin], times[begin:until], {name: array[begin:until] for name, array in fields.items()}
+
+    def lap(self, session_path, entry, start=None, end=None) -> Iterator[Tick]:
+        for topic, times, fields in self.lap_batches(session_path, entry, start, end):
+            names = list(fields)
+            values = [python_values(fields[name]) for name in names]
+            for time_ns, row in zip(times.tolist(), zip(*values)):
+                yield topic, time_ns, dict(zip(names, row))
+
+    def stream(self, start=None, end=None, measurement="laps_cc", bucket="racing") -> Iterator[Tick]:
+        """Yield the ticks of all sessions between start and end, merged in time order."""
+        start_ns, end_ns = time_ns(start), time_ns(end)
+        sessions: List[Iterator[Tick]] = []
+        for session_id in sorted(self.store.session_ids(measurement=measurement, bucket=bucket)):
+            session_path = self.store.session_path(session_id, measurement=measurement, bucket=bucket)
+            manifest = self.store.manifest(session_path)
+            if manifest and self.store.laps(manifest, start=start_ns, end=end_ns):
+                sessions.append(self.session(session_id, start=start, end=end, measurement=measurement, bucket=bucket))
+        yield from heapq.merge(*sessions, key=lambda tick: tick[1])
+
+
+def replay_source(store=None, directory="") -> Optional[ReplaySource]:
+    """Return a replay source of the archive ``directory``, or of ``store`` if it is a ``LocalStore``."""
+    if directory:
+        if not os.path.isdir(directory):
+            raise FileNotFoundError(f"no telemetry archive in {directory}")
+        return ReplaySource(LocalStore(directory))
+    if isinstance(store, LocalStore):
+        return ReplaySource(store)
+    return None
@@ -0,0 +1,187 @@
+"""Resample the channels of laps onto a grid of distances, all channels at once.
+
+``Analyzer.resample`` built a ``scipy.interpolate.interp1d`` per column and
+``Analyzer.resample_channels`` joined the grid to the lap twice with
+``merge_asof``, once to ``interpolate`` and once to ``bfill``. Both now call
+``resample_block``: the channels of a lap are a channels × samples array,
+the grid positions are found with one ``searchsorted`` and every channel is
+read with the same indices.
+
+* ``linear`` and ``nearest`` interpolate like ``interp1d`` with
+  ``fill_value="extrapolate"``, the kinds of ``Analyzer.resample``
+* ``asof`` takes the nearest sample like ``merge_asof(direction="nearest")``
+  and fills missing values linearly by position, like ``interpolate``
+
+Categorical channels like Gear and CurrentLap take the nearest sample like
+``asof`` and missing values are filled with the next one, like ``bfill``.
+
+``resample_laps`` resamples all laps of a session in one call, see
+``TelemetryLoader.process_dataframe``.
+"""
+
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+DISTANCE = "DistanceRoundTrack"
+
+LINEAR = "linear"
+NEAREST = "nearest"
+ASOF = "asof"
+
+# the channels resample_channels interpolates and fills, others are dropped
+INTERPOLATE_COLUMNS = [
+    "Brake",
+    "SpeedMs",
+    "Throttle",
+    "Clutch",
+    "Handbrake",
+    "Rpms",
+    "SteeringAngle",
+    "Yaw",
+    "Pitch",
+    "Roll",
+    "CurrentLapTime",
+    "WorldPosition_x",
+    "WorldPosition_y",
+    "WorldPosition_z",
+]
+FILL_COLUMNS = ["Gear", "CurrentLap"]
+
+
+def nearest_indices(distance: np.ndarray, grid: np.ndarray) -> np.ndarray:
+    """Return the index of the nearest sample, halfway to the left one, like ``interp1d(kind="nearest")``."""
+    bounds = distance / 2.0
+    bounds = bounds[1:] + bounds[:-1]
+    return np.searchsorted(bounds, grid, side="left").clip(0, len(distance) - 1)
+
+
+def asof_indices(distance: np.ndarray, grid: np.ndarray) -> np.ndarray:
+    """Return the index of the nearest sample, the last one of equals and the left one halfway, like ``merge_asof``."""
+    count = len(distance)
+    before = np.searchsorted(distance, grid, side="right") - 1
+    after = np.searchsorted(distance, grid, side="left")
+    safe_before = before.clip(0, count - 1)
+    safe_after = after.clip(0, count - 1)
+    take_before = (after >= count) | ((before >= 0) & (grid - distance[safe_before] <= distance[safe_after] - grid))
+    return np.where(take_before, safe_before, safe_after)
+
+
+def linear(distance: np.ndarray, block: np.ndarray, grid: np.ndarray) -> np.ndarray:
+    """Interpolate the rows of ``block`` linearly, extrapolating beyond the ends like ``interp1d``."""
+    hi = np.searchsorted(distance, grid).clip(1, len(distance) - 1)
+    lo = hi - 1
+    x_lo = distance[lo]
+    y_lo = block[:, lo]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        slope = (block[:, hi] - y_lo) / (distance[hi] - x_lo)
+    return slope * (grid - x_lo) + y_lo
+
+
+def fill_linear(values: np.ndarray) -> np.ndarray:
+    """Fill missing values of the rows linearly by position, not before the first value, like ``interpolate``."""
+    missing = np.isnan(values)
+    if not missing.any():
+        return values
+    positions = np.arange(values.shape[1])
+    for row in np.flatnonzero(missing.any(axis=1)):
+        valid = ~missing[row]
+        if not valid.any():
+            continue
+        first = np.argmax(valid)
+        filled = np.interp(positions, positions[valid], values[row, valid])
+        filled[:first] = np.nan
+        values[row] = filled
+    return values
+
+
+def backfill_indices(indices: np.ndarray, missing: np.ndarray) -> np.ndarray:
+    """Replace the indices of missing samples with the next index of a present one, like ``bfill``."""
+    if not missing[indices].any():
+        return indices
+    count = len(indices)
+    present = ~missing[indices]
+    following = np.where(present, np.arange(count), count)
+    following = np.minimum.accumulate(following[::-1])[::-1]
+    # nothing follows the last missing samples, they stay missing
+    return np.where(following < count, indices[following.clip(0, count - 1)], indices)
+
+
+def resample_block(distance: np.ndarray, block: np.ndarray, grid: np.ndarray, kind=LINEAR, dtype=np.float64) -> np.ndarray:
+    """Return the rows of the channels × samples ``block`` at ``grid``, ``distance`` sorted ascending."""
+    block = np.asarray(block, dtype=np.float64)
+    if kind == LINEAR:
+        values = linear(distance, block, grid)
+    elif kind == NEAREST:
+        values = block[:, nearest_indices(distance, grid)]
+    elif kind == ASOF:
+        values = fill_linear(block[:, asof_indices(distance, grid)])
+    else:
+        raise ValueError(f"unknown kind of resampling {kind}")
+    return values.astype(dtype, copy=False)
+
+
+def float_column(series: pd.Series) -> np.ndarray:
+    return pd.to_numeric(series, errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+
+
+class Channels:
+    """The columns of a dataframe as arrays, converted once for all of its laps."""
+
+    def __init__(self, df: pd.DataFrame, columns: List[str]):
+        self.interpolate_columns = [column for column in columns if column in INTERPOLATE_COLUMNS and column in df.columns]
+        self.fill_columns = [column for column in columns if column in FILL_COLUMNS and column in df.columns]
+        self.distance = float_column(df[DISTANCE])
+        self.block = np.vstack([float_column(df[column]) for column in self.interpolate_columns]) if self.interpolate_columns else None
+        self.fill = [df[column].to_numpy() for column in self.fill_columns]
+        self.fill_missing = [pd.isna(values) for values in self.fill]
+
+    def resample(self, rows: np.ndarray, freq=1, max_distance=0, dtype=np.float64) -> Dict[str, np.ndarray]:
+        """Return the channels of the ``rows`` of a lap on a grid of ``freq`` meters from 0 to ``max_distance``."""
+        distance = self.distance[rows]
+        present = np.flatnonzero(~np.isnan(distance))
+        if not len(present):
+            return {}
+        # quicksort, the order of sort_values, decides between samples at the same distance
+        order = rows[present[np.argsort(distance[present], kind="quicksort")]]
+        distance = self.distance[order]
+        if max_distance == 0:
+            max_distance = int(np.ceil(distance[-1]))
+        grid = np.arange(0, max_distance, freq).astype(float)
+
+        result = {DISTANCE: grid.astype(dtype, copy=False)}
+        indices = asof_indices(distance, grid)
+        if self.block is not None:
+            values = fill_linear(self.block[:, order[indices]]).astype(dtype, copy=False)
+            result.update(zip(self.interpolate_columns, values))
+        for column, values, missing in zip(self.fill_columns, self.fill, self.fill_missing):
+            result[column] = values[order[backfill_indices(indices, missing[order])]]
+        return result
+
+
+def resample_lap(lap_df: pd.DataFrame, columns: List[str], freq=1, max_distance=0, dtype=np.float64) -> Dict[str, np.ndarray]:
+    """Return the columns of a lap on a grid of ``freq`` meters, like ``Analyzer.resample_channels``."""
+    return Channels(lap_df, columns).resample(np.arange(len(lap_df)), freq=freq, max_distance=max_distance, dtype=dtype)
+
+
+def resample_laps(df: pd.DataFrame, columns: List[str], lap_column="CurrentLap", freq=1, dtype=np.float64) -> pd.DataFrame:
+    """Resample every lap of a session, the laps in the order they appear, with an index per lap."""
+    if not len(df) or DISTANCE not in df.columns:
+        return df
+    channels = Channels(df, columns)
+    codes, laps = pd.factorize(df[lap_column], sort=False)
+    rows = np.argsort(codes, kind="stable")
+    # the rows of every lap in their order in df, rows without a lap number are dropped
+    starts = np.concatenate([[0], np.cumsum(np.bincount(codes[codes >= 0], minlength=len(laps)))]) + np.count_nonzero(codes < 0)
+    resampled: List[Dict[str, np.ndarray]] = []
+    for number in range(len(laps)):
+        lap = channels.resample(rows[starts[number] : starts[number + 1]], freq=freq, dtype=dtype)
+        if lap:
+            resampled.append(lap)
+    names = [DISTANCE] + channels.interpolate_columns + channels.fill_columns
+    if not resampled:
+        return pd.DataFrame(columns=names)
+    data = {name: np.concatenate([lap[name] for lap in resampled]) for name in names}
+    index = np.concatenate([np.arange(len(lap[DISTANCE])) for lap in resampled])
+    return pd.DataFrame(data, index=index)
@@ -0,0 +1,106 @@
+"""The time of every lap in every sector, computed for all laps at once.
+
+``FastLapAnalyzer.fastest_sector`` slices every lap for every sector and
+compares the sector times one lap at a time. ``LapStack`` interpolates the
+elapsed seconds of all laps onto one grid of ``step`` meters, a laps × grid
+array, and ``SectorMatrix`` reads the time at every sector boundary of every
+lap from it in one indexing operation. The sector times are differences of
+boundary times, a sector wrapping around the finish line adds the time
+before and after the line.
+
+The coverage rules of ``fastest_sector`` are applied as masks: a lap is a
+candidate for a sector if its first sample after the start is within
+``min_threshold`` meters, 20 meters near the start line, and its last sample
+before the end within ``max_threshold`` meters. A lap covers a sector
+wrapping around the finish line only if it also starts within
+``start_threshold`` meters of the line and reaches it within
+``max_threshold`` meters of ``track_length``.
+"""
+
+from typing import List, Sequence
+
+import numpy as np
+
+from .lap_array import LapArray
+
+
+class LapStack:
+    def __init__(self, laps: Sequence[LapArray], step=1.0):
+        self.laps = list(laps)
+        self.step = step
+        count = len(self.laps)
+        self.first_distance = np.full(count, np.nan)
+        self.last_distance = np.full(count, np.nan)
+        self.last_elapsed = np.full(count, np.nan)
+        for number, lap in enumerate(self.laps):
+            if len(lap):
+                self.first_distance[number] = lap.distance[0]
+                self.last_distance[number] = lap.distance[-1]
+                self.last_elapsed[number] = lap.elapsed[-1]
+        # the longest lap, the length of the track unless every lap was cut short
+        self.track_length = np.nanmax(self.last_distance) if count and not np.all(np.isnan(self.last_distance)) else 0.0
+        self.grid = np.arange(0.0, self.track_length + step, step)
+        # the elapsed seconds of every lap on the grid, kept at the first and last sample outside a lap
+        self.elapsed = np.full((count, len(self.grid)), np.nan)
+        for number, lap in enumerate(self.laps):
+            if len(lap):
+                self.elapsed[number] = np.interp(self.grid, lap.distance, lap.elapsed)
+
+    def __len__(self):
+        return len(self.laps)
+
+    def times_at(self, distances) -> np.ndarray:
+        """Return the elapsed seconds of every lap at ``distances``, a laps × distances array."""
+        position = np.clip(np.asarray(distances, dtype=np.float64) / self.step, 0, len(self.grid) - 1)
+        below = np.floor(position).astype(int)
+        above = np.minimum(below + 1, len(self.grid) - 1)
+        fraction = position - below
+        return self.elapsed[:, below] * (1 - fraction) + self.elapsed[:, above] * fraction
+
+
+class SectorMatrix:
+    """The laps × sectors seconds, nan where a lap does not cover a sector."""
+
+    def __init__(self, stack: LapStack, sectors: List[dict], min_threshold=10, start_threshold=20, max_threshold=10, track_length=None):
+        self.stack = stack
+        self.track_length = stack.track_length if track_length is None else track_length
+        self.sectors = sectors
+        starts = np.array([sector["start"] for sector in sectors], dtype=np.float64)
+        ends = np.array([sector["end"] for sector in sectors], dtype=np.float64)
+        self.wrapped = ends < starts
+
+        start_times = stack.times_at(starts)
+        end_times = stack.times_at(ends)
+        first_times = stack.times_at([0.0])
+        last_times = stack.last_elapsed[:, None]
+        self.times = np.where(self.wrapped, (last_times - start_times) + (end_times - first_times), end_times - start_times)
+
+        first = stack.first_distance[:, None]
+        last = stack.last_distance[:, None]
+        # the distances of the first and the last sample of every lap in every sector, for a wrapped
+        # sector the first after the start before the line and the last before the end after it
+        section_first = np.maximum(starts, first)
+        section_last = np.minimum(ends, last)
+        threshold = np.where(section_first < start_threshold, start_threshold, min_threshold)
+        self.covered = (section_first <= last) & (section_last >= first) & (section_first - starts <= threshold) & (ends - section_last <= max_threshold)
+        # a wrapped sector needs the lap on both sides of the finish line
+        around_line = (self.track_length - last <= max_threshold) & (first <= start_threshold)
+        self.covered &= ~self.wrapped | around_line
+        self.times[~self.covered] = np.nan
+
+    def fastest(self) -> np.ndarray:
+        """Return the index of the fastest lap of every sector, -1 where no lap covers it."""
+        times = np.where(np.isnan(self.times), np.inf, self.times)
+        fastest = np.argmin(times, axis=0) if len(self.stack) else np.zeros(len(self.sectors), dtype=int)
+        covered = self.covered.any(axis=0) if len(self.stack) else np.zeros(len(self.sectors), dtype=bool)
+        return np.where(covered, fastest, -1)
+
+    def best_times(self) -> np.ndarray:
+        """Return the time of the fastest lap of every sector, nan where no lap covers it."""
+        times = np.where(np.isnan(self.times), np.inf, self.times)
+        best = times.min(axis=0) if len(self.stack) else np.full(len(self.sectors), np.inf)
+        return np.where(np.isinf(best), np.nan, best)
+
+    def theoretical_best(self) -> float:
+        """Return the sum of the fastest sectors, nan if a sector is not covered by any lap."""
+        return float(np.sum(self.best_times()))
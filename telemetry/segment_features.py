@@ -0,0 +1,145 @@
+"""The features of a segment, computed from column buffers in one pass.
+
+``racing_telemetry.analysis.Streaming`` computes every feature on every
+tick, a dozen python calls per tick in the ingestion loop. ``SegmentFeatures``
+only appends the ticks of a segment to preallocated float64 columns and
+computes the features with array operations when they are asked for, for
+``Segment.finalize_analysis`` or on demand. The features are the ones the
+segments configure, with the same results as ``Streaming``:
+
+* ``coasting_time``: seconds without throttle and brake
+* ``braking_point``: the distance of the first tick braking harder than 0.1
+  with a brake rate above 0.05, -1 if there is none
+* ``lift_off_point``: the distance where the throttle first drops by more
+  than 0.1 from above 0.9, -1 if there is none
+* ``launch_wheel_slip_time``: seconds of wheel slip above 10% in the first
+  5 seconds of the lap, the slip from the ground speed over the positions
+* ``apex``: the distance of the point of highest curvature
+"""
+
+from typing import Dict
+
+import numpy as np
+import pandas as pd
+from racing_telemetry.analysis import basic_stats
+
+FIELDS = ("CurrentLapTime", "WorldPosition_x", "WorldPosition_y", "Throttle", "Brake", "SpeedMs", "DistanceRoundTrack")
+
+BRAKE_PRESSURE_THRESHOLD = 0.1
+RATE_OF_CHANGE_THRESHOLD = 0.05
+THROTTLE_THRESHOLD = 0.9
+THROTTLE_DECREASE_THRESHOLD = 0.1
+WHEEL_SLIP_THRESHOLD = 0.1
+LAUNCH_SECONDS = 5
+
+
+class SegmentFeatures:
+    def __init__(self, capacity=1024):
+        self.rows = 0
+        self.columns = np.full((len(FIELDS), capacity), np.nan)
+        self.index = {name: number for number, name in enumerate(FIELDS)}
+
+    def __len__(self):
+        return self.rows
+
+    def reserve(self, rows):
+        capacity = self.columns.shape[1]
+        if rows <= capacity:
+            return
+        while capacity < rows:
+            capacity *= 2
+        columns = np.full((len(FIELDS), capacity), np.nan)
+        columns[:, : self.rows] = self.columns[:, : self.rows]
+        self.columns = columns
+
+    def append(self, telemetry: Dict):
+        row = self.rows
+        if row == self.columns.shape[1]:
+            self.reserve(row + 1)
+        columns = self.columns
+        for number, name in enumerate(FIELDS):
+            value = telemetry.get(name)
+            if value is not None:
+                columns[number, row] = value
+        self.rows = row + 1
+
+    def extend(self, columns: Dict[str, np.ndarray]):
+        """Append a block of ticks, ``columns`` maps fields to float arrays of equal length, missing values nan."""
+        rows = len(next(iter(columns.values()))) if columns else 0
+        if not rows:
+            return
+        self.reserve(self.rows + rows)
+        for name, values in columns.items():
+            number = self.index.get(name)
+            if number is not None:
+                self.columns[number, self.rows : self.rows + rows] = values
+        self.rows += rows
+
+    def column(self, name) -> np.ndarray:
+        return self.columns[self.index[name], : self.rows]
+
+    def get_features(self) -> Dict[str, float]:
+        rows = self.rows
+        features = {"coasting_time": 0.0, "braking_point": 0.0, "ground_speed": 0.0, "wheel_slip": 0.0, "launch_wheel_slip_time": 0.0, "lift_off_point": 0.0}
+        if not rows:
+            return features
+
+        lap_time = self.column("CurrentLapTime")
+        throttle = self.column("Throttle")
+        brake = self.column("Brake")
+        speed = self.column("SpeedMs")
+        distance = self.column("DistanceRoundTrack")
+        x = self.column("WorldPosition_x")
+        y = self.column("WorldPosition_y")
+
+        delta_time = np.zeros(rows)
+        delta_time[1:] = lap_time[1:] - lap_time[:-1]
+        brake_rate = np.zeros(rows)
+        brake_rate[1:] = brake[1:] - brake[:-1]
+
+        # a missing pedal counts as released
+        throttle_value = np.nan_to_num(throttle)
+        brake_value = np.nan_to_num(brake)
+        coasting = (throttle_value == 0) & (brake_value == 0)
+        # added up tick by tick, like the streaming analysis does
+        features["coasting_time"] = float(np.cumsum(np.where(coasting, delta_time, 0.0))[-1])
+
+        braking = np.flatnonzero((np.arange(rows) >= 1) & (delta_time != 0) & (brake_value > BRAKE_PRESSURE_THRESHOLD) & (brake_rate > RATE_OF_CHANGE_THRESHOLD))
+        features["braking_point"] = self.distance_at(distance, braking)
+
+        lift_off = np.flatnonzero((throttle[:-1] > THROTTLE_THRESHOLD) & ((throttle[:-1] - throttle_value[1:]) > THROTTLE_DECREASE_THRESHOLD)) + 1
+        features["lift_off_point"] = self.distance_at(distance, lift_off)
+
+        dx = np.zeros(rows)
+        dy = np.zeros(rows)
+        dx[1:] = np.nan_to_num(x[1:]) - x[:-1]
+        dy[1:] = np.nan_to_num(y[1:]) - y[:-1]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ground_speed = np.where(delta_time == 0, 0.0, np.sqrt(dx * dx + dy * dy) / delta_time)
+            speed_value = np.nan_to_num(speed)
+            wheel_slip = np.where(speed_value == 0, 0.0, np.clip((ground_speed - speed_value) / speed_value, -1.0, 1.0))
+        features["ground_speed"] = float(ground_speed[-1])
+        features["wheel_slip"] = float(wheel_slip[-1])
+
+        launch = (np.arange(rows) >= 2) & (np.nan_to_num(lap_time) < LAUNCH_SECONDS) & (np.abs(wheel_slip) > WHEEL_SLIP_THRESHOLD)
+        features["launch_wheel_slip_time"] = float(np.cumsum(np.where(launch, delta_time, 0.0))[-1])
+        return features
+
+    @staticmethod
+    def distance_at(distance, ticks) -> float:
+        if not len(ticks):
+            return -1
+        value = distance[ticks[0]]
+        return -1 if np.isnan(value) else float(value)
+
+    def apex(self) -> float:
+        """Return the distance of the apex, -1 if there is none."""
+        df = pd.DataFrame({"WorldPosition_x": self.column("WorldPosition_x"), "WorldPosition_y": self.column("WorldPosition_y")})
+        try:
+            apex = basic_stats.apex(df)
+        except ValueError:
+            # newer pandas raise on a curvature without values, short segments have none
+            apex = None
+        if not apex:
+            return -1
+        return float(self.column("DistanceRoundTrack")[apex["index"]])
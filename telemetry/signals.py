@@ -0,0 +1,35 @@
+import logging
+
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from telemetry.models import Car, CarClass, Driver, Game, SessionType, Track
+from telemetry.pitcrew.dimension_cache import dimension_cache
+
+logger = logging.getLogger(__name__)
+
+
+@receiver(post_delete, sender=Game, dispatch_uid="game_deleted_receiver")
+@receiver(post_delete, sender=CarClass, dispatch_uid="car_class_deleted_receiver")
+@receiver(post_delete, sender=Car, dispatch_uid="car_deleted_receiver")
+@receiver(post_delete, sender=Track, dispatch_uid="track_deleted_receiver")
+@receiver(post_delete, sender=SessionType, dispatch_uid="session_type_deleted_receiver")
+@receiver(post_delete, sender=Driver, dispatch_uid="driver_deleted_receiver")
+def dimension_deleted(sender, instance, **kwargs):  # pylint: disable=unused-argument
+    """Remove a deleted row from the pitcrew dimension cache."""
+    logger.debug("dimension_deleted: forgetting %s %s", sender.__name__, instance.pk)
+    dimension_cache.forget(instance)
+
+
+@receiver(post_save, sender=Game, dispatch_uid="game_saved_receiver")
+@receiver(post_save, sender=CarClass, dispatch_uid="car_class_saved_receiver")
+@receiver(post_save, sender=Car, dispatch_uid="car_saved_receiver")
+@receiver(post_save, sender=Track, dispatch_uid="track_saved_receiver")
+@receiver(post_save, sender=SessionType, dispatch_uid="session_type_saved_receiver")
+@receiver(post_save, sender=Driver, dispatch_uid="driver_saved_receiver")
+def dimension_saved(sender, instance, created=False, **kwargs):  # pylint: disable=unused-argument
+    """Remove an updated row from the pitcrew dimension cache, it is loaded again on the next lookup."""
+    if created:
+        return
+    logger.debug("dimension_saved: forgetting %s %s", sender.__name__, instance.pk)
+    dimension_cache.forget(instance)
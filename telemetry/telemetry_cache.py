@@ -0,0 +1,202 @@
+"""A local on-disk cache of telemetry queried from InfluxDB.
+
+Completed laps and finished sessions never change, but the web workers, the
+fast lap analyzer, the history of the coach and the replay command each used
+to query InfluxDB for them again. ``TelemetryCache`` keeps the dataframes in
+typed Parquet files, one file per (bucket, measurement, session_id, lap,
+fields, aggregate), in a directory every process on the host shares:
+
+* the file name is a hash of the key, so no index has to be shared
+* files are written to a temporary file and renamed into place, a reader
+  never sees a partial file and concurrent writers of a key both win
+* reading a file touches its mtime, when the directory grows beyond
+  ``max_bytes`` the least recently used files are removed
+* the directory is private to the user, files of other users are not read
+
+``B4MAD_RACING_TELEMETRY_CACHE`` sets the directory, an empty value or ``0``
+turns the cache off. ``B4MAD_RACING_TELEMETRY_CACHE_MB`` sets the size cap.
+Without pyarrow there is no cache.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import stat
+import tempfile
+import threading
+from typing import Iterable, Optional
+
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401
+
+    HAS_PARQUET = True
+except ImportError:  # pragma: no cover - depends on the environment
+    HAS_PARQUET = False
+
+DEFAULT_DIRECTORY = os.path.join(tempfile.gettempdir(), f"paddock-telemetry-{os.getuid()}")
+DEFAULT_MAX_MB = 2048
+SUFFIX = ".parquet"
+
+
+class TelemetryCache:
+    def __init__(self, directory=DEFAULT_DIRECTORY, max_bytes=DEFAULT_MAX_MB * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.suffix = SUFFIX
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # bytes in the directory, scanned on the first write
+        self._size: Optional[int] = None
+        # whether the directory is private to this user, checked on first use
+        self._private: Optional[bool] = None
+
+    @staticmethod
+    def key(bucket, measurement, session_id, lap=None, fields: Iterable[str] = (), aggregate="", end=None) -> str:
+        """Return the content address of a query result, ``end`` is when the lap or session was finished."""
+        canonical = json.dumps(
+            [str(bucket), str(measurement), str(session_id), None if lap is None else int(lap), sorted(fields), aggregate or "", None if end is None else str(end)],
+            separators=(",", ":"),
+        )
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key + self.suffix)
+
+    def private(self) -> bool:
+        """Create the directory only this user can access, False when an existing one is not like that."""
+        if self._private is None:
+            try:
+                os.makedirs(self.directory, mode=0o700, exist_ok=True)
+                info = os.lstat(self.directory)
+                self._private = stat.S_ISDIR(info.st_mode) and info.st_uid == os.getuid() and not info.st_mode & 0o077
+            except OSError as e:
+                logging.error(f"TelemetryCache: can not create {self.directory}: {e}")
+                self._private = False
+            if not self._private:
+                logging.error(f"TelemetryCache: {self.directory} is not a directory private to this user, not using it")
+        return self._private
+
+    def get(self, key: str) -> Optional[pd.DataFrame]:
+        path = self.path(key)
+        if not self.private():
+            self.misses += 1
+            return None
+        try:
+            info = os.lstat(path)
+            if not stat.S_ISREG(info.st_mode) or info.st_uid != os.getuid():
+                raise ValueError("not a file of this user")
+            df = pd.read_parquet(path)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except Exception as e:
+            logging.error(f"TelemetryCache: dropping unreadable {path}: {e}")
+            self._remove(path)
+            self.misses += 1
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            # evicted by another process while being read
+            pass
+        self.hits += 1
+        return df
+
+    def put(self, key: str, df: pd.DataFrame):
+        path = self.path(key)
+        if not self.private():
+            return
+        os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-", suffix=self.suffix)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                df.to_parquet(f, index=False)
+            size = os.path.getsize(tmp_path)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logging.error(f"TelemetryCache: could not write {path}: {e}")
+            self._remove(tmp_path)
+            return
+
+        with self._lock:
+            if self._size is None:
+                self._size = self.scan_size()
+            else:
+                self._size += size
+            evict = self._size > self.max_bytes
+        if evict:
+            self.evict()
+
+    def fetch(self, key: str, query):
+        """Return the cached dataframe of ``key``, or run ``query()`` and cache its result.
+
+        Empty results and exceptions of the query are not cached.
+        """
+        df = self.get(key)
+        if df is not None:
+            return df
+        df = query()
+        if df is not None and len(df) > 0:
+            self.put(key, df)
+        return df
+
+    def files(self):
+        try:
+            directories = list(os.scandir(self.directory))
+        except FileNotFoundError:
+            return []
+        files = []
+        for directory in directories:
+            if not directory.is_dir():
+                continue
+            for entry in os.scandir(directory.path):
+                if entry.name.endswith(self.suffix) and not entry.name.startswith(".tmp-"):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    files.append((stat.st_mtime, stat.st_size, entry.path))
+        return files
+
+    def scan_size(self) -> int:
+        return sum(size for mtime, size, path in self.files())
+
+    def evict(self):
+        """Remove the least recently used files until the cache is below 90% of ``max_bytes``."""
+        files = sorted(self.files())
+        size = sum(size for mtime, size, path in files)
+        target = self.max_bytes * 0.9
+        for mtime, file_size, path in files:
+            if size <= target:
+                break
+            self._remove(path)
+            size -= file_size
+        with self._lock:
+            self._size = size
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+_cache: Optional[TelemetryCache] = None
+_cache_lock = threading.Lock()
+
+
+def telemetry_cache() -> Optional[TelemetryCache]:
+    """Return the cache configured by the environment, None if it is turned off or pyarrow is missing."""
+    global _cache
+    directory = os.environ.get("B4MAD_RACING_TELEMETRY_CACHE", DEFAULT_DIRECTORY)
+    if directory in ("", "0") or not HAS_PARQUET:
+        return None
+    with _cache_lock:
+        if _cache is None or _cache.directory != directory:
+            max_mb = int(os.environ.get("B4MAD_RACING_TELEMETRY_CACHE_MB", DEFAULT_MAX_MB))
+            _cache = TelemetryCache(directory, max_bytes=max_mb * 1024 * 1024)
+        return _cache
@@ -0,0 +1,275 @@
+"""Where raw telemetry is read from.
+
+``TelemetryStore`` is what the analyzers, the API and the replay commands
+use to get at raw telemetry. ``Influx`` is the store of the live system,
+``LocalStore`` keeps sessions in column files on local disk, for offline
+analysis, benchmarks and tests without an InfluxDB.
+
+``telemetry_store()`` returns the store configured by
+``B4MAD_RACING_TELEMETRY_STORE``: ``influx``, the default, or the directory
+of a ``LocalStore``.
+"""
+
+import logging
+import os
+from abc import ABC, abstractmethod
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+import pandas as pd
+from django.db import DatabaseError
+from django.db.models import Max, Min
+
+from .centerline import GAME_AXES, plot_coordinates
+
+# where lap telemetry is looked for, in this order
+LAP_SOURCES = [("fast_laps", "fast_laps"), ("laps_cc", "racing")]
+
+# the range of queries nothing is known about, it makes influx scan every shard
+WIDE_RANGE = ("-10y", "now()")
+# slack around the times in Postgres, they are taken by the pitcrew, not by influx
+RANGE_MARGIN = timedelta(minutes=10)
+# sessions ended longer ago than this are not written to anymore
+SESSION_SETTLED = timedelta(minutes=10)
+
+
+def flux_time(value):
+    if isinstance(value, datetime):
+        if value.tzinfo:
+            value = value.astimezone(timezone.utc)
+        return value.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+    return value
+
+
+class RangePlanner:
+    """Narrow the range() of influx queries to when a session or lap was driven.
+
+    Sessions and laps in Postgres know their start and end, queries get that
+    span plus ``margin``. Spans reaching into the last ``margin`` end at now(),
+    the session may still be running. Without metadata the ``WIDE_RANGE`` is
+    used.
+    """
+
+    def __init__(self, margin=RANGE_MARGIN):
+        self.margin = margin
+
+    def span(self, start, end):
+        """Return the Flux (start, stop) around the datetimes start and end."""
+        if start is None or end is None:
+            return WIDE_RANGE
+        stop = end + self.margin
+        if stop >= datetime.now(tz=stop.tzinfo):
+            stop = "now()"
+        return flux_time(start - self.margin), flux_time(stop)
+
+    def times(self, queryset):
+        try:
+            times = queryset.aggregate(start=Min("start"), end=Max("end"))
+        except DatabaseError as e:
+            logging.error(f"Influx: no session metadata, querying the wide range: {e}")
+            return None, None
+        return times["start"], times["end"]
+
+    def session(self, session_id):
+        from telemetry.models import Session
+
+        return self.span(*self.times(Session.objects.filter(session_id=str(session_id))))
+
+    def laps(self, session_id, lap_numbers):
+        from telemetry.models import Lap
+
+        start, end = self.times(Lap.objects.filter(session__session_id=str(session_id), number__in=[int(number) for number in lap_numbers]))
+        if start is None:
+            return self.session(session_id)
+        return self.span(start, end)
+
+    def lap(self, lap):
+        return self.span(lap.start, lap.end)
+
+    def all_sessions(self):
+        from telemetry.models import Session
+
+        start, end = self.times(Session.objects.all())
+        if start is None:
+            return WIDE_RANGE
+        return flux_time(start - self.margin), "now()"
+
+
+class TelemetryStoreError(Exception):
+    """The telemetry store can not be reached."""
+
+
+class Record(dict):
+    """A row of telemetry, quacks like the FluxRecords of ``Influx.session``."""
+
+    @property
+    def values(self):
+        return self
+
+
+def records(df):
+    """Yield the rows of a dataframe as ``Record``, missing values are None."""
+    df = df.astype(object).where(df.notna(), None)
+    for row in df.to_dict("records"):
+        yield Record(row)
+
+
+class TelemetryStore(ABC):
+    """A store of raw telemetry, subclasses implement the abstract methods."""
+
+    # laps fetched in parallel by iter_lap_telemetry
+    LAP_WORKERS = 8
+    # completed laps are read through the local telemetry cache, see telemetry_cache
+    cache = None
+    planner = RangePlanner()
+
+    @abstractmethod
+    def session_df(
+        self,
+        session_id,
+        lap_number=None,
+        start="-1d",
+        end="now()",
+        measurement="laps_cc",
+        bucket="racing",
+        aggregate="",
+        fields=[],
+        drop_tags=False,
+    ) -> pd.DataFrame:
+        """Return the telemetry of a session, or a lap of it, as a dataframe.
+
+        Only the ``fields`` are read when given, tags are always returned.
+        Raises an exception when there is no telemetry.
+        """
+
+    @abstractmethod
+    def session(
+        self,
+        session_id=None,
+        lap=None,
+        lap_numbers=[],
+        start=None,
+        end=None,
+        measurement="laps_cc",
+        bucket="racing",
+        fields=[],
+    ):
+        """Yield the telemetry of a session, its ``lap_numbers`` or a ``lap``, one record per tick."""
+
+    @abstractmethod
+    def session_ids(self, measurement="fast_laps", bucket="racing"):
+        """Return the set of session ids with telemetry in the bucket."""
+
+    @abstractmethod
+    def copy_session(self, session_id, start="-1d", end="now()", from_bucket="racing", to_bucket="fast_laps"):
+        """Copy the laps_cc telemetry of a session to the fast_laps measurement of ``to_bucket``."""
+
+    def finish_session_df(self, df):
+        """Add the plot coordinates and ids to a session dataframe, and drop the ticks in neutral."""
+        game = df["GameName"].iloc[0]
+        has_position = "WorldPosition_x" in df.columns and "WorldPosition_z" in df.columns
+        if has_position and game in GAME_AXES:
+            # the same axes as the centerline of the track
+            df["x"], df["y"] = plot_coordinates(df, game)
+
+        df["id"] = df["SessionId"].astype(str) + "-" + df["CurrentLap"].astype(str)
+
+        df = df[df["Gear"] != 0]
+
+        return df
+
+    def telemetry_for_laps(self, laps=[], measurement="laps_cc", bucket="racing"):
+        data = []
+        for lap, df in self.iter_lap_telemetry(laps, sources=[(measurement, bucket)]):
+            if df is not None:
+                data.append(df)
+        return data
+
+    def lap_query(self, lap):
+        """Resolve everything a lap query needs, before it runs in a worker thread."""
+        game = lap.session.game.name
+        session = lap.session.session_id
+        track = lap.track.name
+
+        logging.info(f"Fetching telemetry for {game} - {track} - {lap.car}")
+        logging.info(f"  track.id {lap.track.id} car.id {lap.car.id}")
+        logging.info(f"  session {session} lap.id {lap.id} number {lap.number}")
+        logging.info(f"  length {lap.length} time {lap.time} valid {lap.valid}")
+        logging.info(f"  start {lap.start} end {lap.end}")
+        return {"session_id": session, "lap_number": lap.number, "start": lap.start, "end": lap.end, "settled": self.settled(lap)}
+
+    def settled(self, lap):
+        """Return True when the telemetry of a lap can not change anymore, only those laps are cached."""
+        end = lap.session.end
+        return bool(lap.completed) and isinstance(end, datetime) and end < datetime.now(tz=end.tzinfo) - SESSION_SETTLED
+
+    def fetch_lap(self, query, sources, min_rows=100, fields=()):
+        """Return the telemetry of a lap from the first source having it, or None."""
+        for measurement, bucket in sources:
+            try:
+                df = self.lap_df(query, measurement=measurement, bucket=bucket, fields=fields)
+                if len(df) > min_rows:
+                    return df
+            except Exception as e:
+                logging.error(e)
+            logging.info(f"No data found for lap {query['lap_number']} of session {query['session_id']} in {bucket}")
+        return None
+
+    def lap_df(self, query, measurement="laps_cc", bucket="racing", fields=()):
+        """Return the telemetry of a lap, settled laps are read through the cache."""
+
+        def session_df():
+            return self.session_df(
+                query["session_id"],
+                lap_number=query["lap_number"],
+                start=query["start"],
+                end=query["end"],
+                measurement=measurement,
+                bucket=bucket,
+                fields=fields,
+            )
+
+        if not self.cache or not query.get("settled"):
+            return session_df()
+        key = self.cache.key(bucket, measurement, query["session_id"], lap=query["lap_number"], fields=fields, end=flux_time(query["end"]))
+        return self.cache.fetch(key, session_df)
+
+    def iter_lap_telemetry(self, laps, sources=LAP_SOURCES, workers=None):
+        """Yield (lap, df) in lap order, df is None for laps without telemetry.
+
+        The laps are queried in parallel, every lap falls back through the
+        (measurement, bucket) sources on its own. At most ``workers`` laps are
+        fetched ahead of the consumer, so stopping early wastes few queries.
+        """
+        workers = workers or self.LAP_WORKERS
+        laps = iter(laps)
+        pending = deque()
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="telemetry") as executor:
+            try:
+                while True:
+                    while len(pending) < workers:
+                        lap = next(laps, None)
+                        if lap is None:
+                            break
+                        pending.append((lap, executor.submit(self.fetch_lap, self.lap_query(lap), sources)))
+                    if not pending:
+                        break
+                    lap, future = pending.popleft()
+                    yield lap, future.result()
+            finally:
+                for lap, future in pending:
+                    future.cancel()
+
+
+def telemetry_store(cache=True) -> TelemetryStore:
+    """Return the telemetry store configured by the environment."""
+    store = os.environ.get("B4MAD_RACING_TELEMETRY_STORE", "influx")
+    if store in ("", "influx"):
+        from .influx import Influx
+
+        return Influx(cache=cache)
+
+    from .local_store import LocalStore
+
+    return LocalStore(store)
@@ -0,0 +1,10 @@
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def clear_dimension_cache():
+    """The pitcrew dimension cache outlives the rows a TestCase rolls back."""
+    yield
+    from telemetry.pitcrew.dimension_cache import dimension_cache
+
+    dimension_cache.clear()
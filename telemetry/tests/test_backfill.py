@@ -0,0 +1,48 @@
+import os
+import tempfile
+
+from django.test import TestCase
+
+from telemetry.backfill import Backfill, Checkpoint
+from telemetry.local_store import LocalStore
+from telemetry.models import Game, Lap, Session
+
+from .utils import read_dataframe
+
+SESSION_ID = "1694266648"
+SESSION_FILE = os.path.join(os.path.dirname(__file__), "data", f"session_{SESSION_ID}_df.csv.gz")
+
+
+class TestBackfill(TestCase):
+    def setUp(self):
+        Game.objects.create(name="iRacing")
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        df = read_dataframe(SESSION_FILE).drop(columns=["id"])
+        df["CurrentLap"] = df["CurrentLap"].astype(str)
+        LocalStore(self.directory.name).write_session_df(df, SESSION_ID)
+        self.checkpoint = os.path.join(self.directory.name, "checkpoint.jsonl")
+
+    def test_backfill_resumes(self):
+        backfill = Backfill(workers=1, checkpoint=self.checkpoint, archive=self.directory.name)
+        results = backfill.run([SESSION_ID, "42"])
+
+        self.assertEqual([result["status"] for result in results], ["done", "empty"])
+        self.assertEqual(results[0]["ticks"], 11417)
+        # a session without telemetry has nothing to write
+        self.assertEqual(results[1]["ticks"], 0)
+        session = Session.objects.get(session_id=SESSION_ID)
+        self.assertEqual(session.driver.name, "durandom")
+        laps = {lap.number: lap for lap in Lap.objects.filter(session=session)}
+        self.assertEqual(sorted(laps), [2, 3, 4, 5, 6])
+        self.assertAlmostEqual(laps[2].time, 74.37, places=1)
+        self.assertTrue(laps[2].valid)
+
+        # the next run skips the finished sessions, not the ones without ticks
+        backfill = Backfill(workers=1, checkpoint=self.checkpoint, archive=self.directory.name)
+        self.assertEqual(backfill.pending([SESSION_ID, "42", "43"]), ["42", "43"])
+
+    def test_checkpoint_skips_failed_and_torn_lines(self):
+        with open(self.checkpoint, "w") as f:
+            f.write('{"session_id": "1", "status": "done"}\n{"session_id": "2", "status": "failed"}\n{"session_id": "3", "sta')
+        self.assertEqual(Checkpoint(self.checkpoint).done, {"1"})
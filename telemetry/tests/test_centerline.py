@@ -0,0 +1,96 @@
+import numpy as np
+import pytest
+from django.test import TestCase
+
+from telemetry.centerline import VERSION, Centerline, lap_positions
+from telemetry.management.commands.build_centerline import Command
+from telemetry.models import Car, Driver, Game, Lap, Session, SessionType, Track, TrackCenterline
+
+from .utils import get_session_df
+
+GAME = "Automobilista 2"
+
+
+def session_laps():
+    df = get_session_df(1683388042)
+    laps = []
+    for lap in sorted(df["CurrentLap"].unique())[1:4]:
+        laps.append(lap_positions(df[df["CurrentLap"] == lap], GAME))
+    return laps
+
+
+@pytest.mark.unittest
+class TestCenterline:
+    def setup_method(self):
+        self.laps = session_laps()
+        self.centerline = Centerline.build(self.laps)
+
+    def test_build(self):
+        centerline = self.centerline
+        assert np.all(np.diff(centerline.distance) == 1)
+        assert centerline.length == pytest.approx(max(distances.max() for distances, points in self.laps), abs=3)
+        for values in [centerline.x, centerline.y, centerline.heading, centerline.curvature]:
+            assert len(values) == len(centerline) and not np.isnan(values).any()
+        # a lap turns about once around, the ends of the line do not meet exactly
+        assert 5 < abs(centerline.heading[-1] - centerline.heading[0]) < 8
+
+    def test_match(self):
+        distances, points = self.laps[1]
+        matched, offsets = self.centerline.match(points[:, 0], points[:, 1])
+        inside = (distances > 50) & (distances < self.centerline.length - 50)
+        assert np.median(np.abs(matched[inside] - distances[inside])) < 3
+        assert np.median(np.abs(offsets)) < 5
+
+        x, y = self.centerline.position_at([100.0, 100.0 + self.centerline.length])
+        matched, offsets = self.centerline.match(x, y)
+        assert matched == pytest.approx([100.0, 100.0], abs=0.01)
+        assert offsets == pytest.approx([0.0, 0.0], abs=0.01)
+
+    def test_round_trip(self):
+        centerline = Centerline.from_dict(self.centerline.to_dict())
+        np.testing.assert_array_equal(centerline.curvature, self.centerline.curvature)
+        assert centerline.version == VERSION
+
+    def test_no_positions(self):
+        with pytest.raises(ValueError):
+            Centerline.build([])
+
+
+class TestTrackCenterline(TestCase):
+    def test_store_and_load(self):
+        game = Game.objects.create(name=GAME)
+        track = Track.objects.create(name="Road_America:Road_America_RC", game=game)
+        self.assertIsNone(track.centerline())
+
+        laps = session_laps()
+        stored = TrackCenterline.build(track, laps)
+        self.assertEqual(stored.laps, 3)
+        self.assertEqual(stored.version, VERSION)
+
+        # built again, replacing the stored one of the same version
+        TrackCenterline.build(track, laps[:2])
+        self.assertEqual(TrackCenterline.objects.filter(track=track).count(), 1)
+
+        centerline = Track.objects.get(pk=track.pk).centerline()
+        self.assertAlmostEqual(centerline.length, stored.length)
+        matched, offsets = centerline.match(centerline.x[500], centerline.y[500])
+        self.assertAlmostEqual(matched[0], 500.0, places=3)
+
+    def test_command_merges_completed_full_laps(self):
+        game = Game.objects.create(name=GAME)
+        track = Track.objects.create(name="Road_America:Road_America_RC", game=game, length=6500)
+        car = Car.objects.create(name="Ginetta G58", game=game)
+        session = Session.objects.create(
+            session_id="1683388042", driver=Driver.objects.create(name="durandom"), session_type=SessionType.objects.create(type="Practice"), game=game, track=track, car=car
+        )
+
+        def lap(number, time, length, completed=True):
+            return Lap.objects.create(number=number, session=session, track=track, car=car, time=time, length=length, valid=True, completed=completed)
+
+        full, slower = lap(1, 130, 6480), lap(2, 131, 6500)
+        # cut short, and still being driven
+        lap(3, 40, 2000)
+        lap(4, 120, 6400, completed=False)
+
+        self.assertEqual(Command().laps(track, 10), [full, slower])
+        self.assertEqual(Command().laps(track, 1), [full])
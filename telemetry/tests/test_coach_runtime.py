@@ -0,0 +1,76 @@
+import threading
+import time
+
+import pytest
+
+from telemetry.pitcrew.coach_runtime import CoachRuntime
+
+
+class FakeCoach:
+    def __init__(self, driver_name):
+        self.driver_name = driver_name
+        self.messages = []
+        self.stopped = False
+
+    def notify(self, topic, payload, now=None):
+        self.messages.append(payload["n"])
+        if payload["n"] % 10 == 0:
+            return (f"coach/{self.driver_name}", [f"{payload['n']}"])
+
+    def on_stop(self):
+        self.stopped = True
+
+
+@pytest.mark.unittest
+class TestCoachRuntime:
+    def start(self, **kwargs):
+        self.coaches = {}
+        self.published = []
+
+        def coach_factory(driver_name):
+            coach = FakeCoach(driver_name)
+            self.coaches[driver_name] = coach
+            return coach
+
+        runtime = CoachRuntime(coach_factory=coach_factory, publish=lambda topic, payload: self.published.append((topic, payload)), **kwargs)
+        thread = threading.Thread(target=runtime.run)
+        thread.start()
+        return runtime, thread
+
+    def wait_for(self, condition, timeout=5):
+        deadline = time.monotonic() + timeout
+        while not condition() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert condition()
+
+    def test_messages_are_routed_per_driver_in_order(self):
+        runtime, thread = self.start(replay=True, queue_size=5)
+        drivers = [f"driver-{i}" for i in range(20)]
+        for n in range(1, 51):
+            for driver in drivers:
+                runtime.notify(f"crewchief/{driver}/1/game/track/car/race", {"n": n})
+        runtime.notify("invalid", {"n": 0})
+        runtime.stop()
+        thread.join(5)
+
+        assert set(self.coaches) == set(drivers)
+        for coach in self.coaches.values():
+            assert coach.messages == list(range(1, 51))
+            assert coach.stopped
+        assert len(self.published) == 5 * len(drivers)
+        assert runtime.processed == 50 * len(drivers)
+
+    def test_inactive_coaches_are_stopped(self):
+        runtime, thread = self.start()
+        runtime.notify("crewchief/durandom/1/game/track/car/race", {"n": 1})
+        runtime.notify("crewchief/jim/1/game/track/car/race", {"n": 1})
+        self.wait_for(lambda: len(self.coaches) == 2)
+
+        runtime.sync(["durandom"])
+        self.wait_for(lambda: self.coaches["jim"].stopped)
+        assert runtime.drivers() == {"durandom"}
+        assert not self.coaches["durandom"].stopped
+
+        runtime.stop()
+        thread.join(5)
+        assert self.coaches["durandom"].stopped
@@ -0,0 +1,62 @@
+import random
+
+import pytest
+
+from telemetry.pitcrew.copilot_dispatcher import CopilotDispatcher
+
+
+class RecordingApp:
+    def __init__(self, name, calls, distances=None):
+        self.name = name
+        self.calls = calls
+        self.distances = distances
+
+    def trigger_distances(self):
+        return self.distances
+
+    def notify(self, distance, telemetry, now):
+        if self.distances is None or distance in self.distances:
+            self.calls.append((self.name, distance))
+
+
+@pytest.mark.unittest
+class TestCopilotDispatcher:
+    def dispatch(self, track_length, windows, every_meter):
+        calls = []
+        dispatcher = CopilotDispatcher(track_length)
+        apps = [
+            RecordingApp("brake", calls, [0, 120, 999]),
+            RecordingApp("gear", calls, [120, 500]),
+        ]
+        if every_meter:
+            apps.append(RecordingApp("debug", calls))
+        for app in apps:
+            dispatcher.register(app)
+        for start, stop in windows:
+            dispatcher.dispatch(start, stop, {}, None)
+        return [call for call in calls if call[0] != "debug"]
+
+    def test_triggers_match_every_meter(self):
+        random.seed(42)
+        track_length = 1000
+        windows = []
+        for _ in range(500):
+            start = random.randrange(track_length)
+            windows.append((start, (start + random.randrange(300)) % track_length))
+        windows.append((990, 5))
+
+        assert self.dispatch(track_length, windows, every_meter=False) == self.dispatch(track_length, windows, every_meter=True)
+
+    def test_wrap_around(self):
+        calls = self.dispatch(1000, [(990, 130)], every_meter=False)
+        assert calls == [("brake", 999), ("brake", 0), ("brake", 120), ("gear", 120)]
+
+    def test_empty_window(self):
+        assert self.dispatch(1000, [(120, 120)], every_meter=False) == []
+
+    def test_no_triggers(self):
+        calls = []
+        dispatcher = CopilotDispatcher(1000)
+        dispatcher.register(RecordingApp("commentator", calls, []))
+        dispatcher.dispatch(0, 999, {}, None)
+        assert calls == []
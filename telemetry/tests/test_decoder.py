@@ -0,0 +1,75 @@
+import json
+
+import pytest
+
+from telemetry.pitcrew.active_drivers import ActiveDrivers
+from telemetry.pitcrew.telemetry_decoder import (
+    JsonDecoder,
+    ProjectingDecoder,
+    ScanningDecoder,
+    decoder_for,
+    record_type,
+)
+
+TELEMETRY = {
+    "CarClass": 'GT3 "Pro"\\Am',
+    "CurrentLap": 3,
+    "CurrentLapIsValid": True,
+    "CurrentLapTime": 42.125,
+    "DistanceRoundTrack": 1234.5,
+    "Brake": 0.0,
+    "Throttle": 1e-3,
+    "Gear": None,
+}
+PAYLOAD = json.dumps({"time": 1694266648000, "telemetry": TELEMETRY}).encode("utf-8")
+FIELDS = ("CarClass", "CurrentLap", "CurrentLapIsValid", "DistanceRoundTrack", "Throttle", "Gear", "SpeedMs")
+
+
+@pytest.mark.unittest
+class TestDecoder:
+    @pytest.mark.parametrize("decoder_class", [ProjectingDecoder, ScanningDecoder])
+    def test_projects_declared_fields(self, decoder_class):
+        record = decoder_class(FIELDS).decode(PAYLOAD)
+
+        expected = {field: TELEMETRY[field] for field in FIELDS if field in TELEMETRY}
+        assert record.to_dict() == expected
+        assert record["CarClass"] == TELEMETRY["CarClass"]
+        assert record.get("SpeedMs") is None
+        assert "Brake" not in record
+        with pytest.raises(KeyError):
+            record["SpeedMs"]
+
+    def test_whitespace_in_payload(self):
+        payload = json.dumps({"telemetry": TELEMETRY}, indent=2).encode("utf-8")
+        record = ScanningDecoder(FIELDS).decode(payload)
+        assert record["DistanceRoundTrack"] == 1234.5
+        assert record["Gear"] is None
+
+    @pytest.mark.parametrize(
+        "payload",
+        [
+            {"Gear": 9, "telemetry": TELEMETRY},
+            {"telemetry": TELEMETRY, "CurrentLap": 7},
+            {"telemetry": {"CarClass": "GT4}"}, "meta": {"CurrentLap": 7}},
+            {"meta": {"telemetry": {"CurrentLap": 7}}, "telemetry": TELEMETRY},
+        ],
+    )
+    def test_keys_outside_telemetry(self, payload):
+        record = ScanningDecoder(FIELDS).decode(json.dumps(payload).encode("utf-8"))
+        assert record.to_dict() == ProjectingDecoder(FIELDS).decode(json.dumps(payload).encode("utf-8")).to_dict()
+        assert record.get("CurrentLap") != 7
+
+    @pytest.mark.parametrize("decoder_class", [JsonDecoder, ProjectingDecoder, ScanningDecoder])
+    def test_payload_without_telemetry(self, decoder_class):
+        decoder = decoder_class() if decoder_class is JsonDecoder else decoder_class(FIELDS)
+        assert decoder.decode(b'{"time": 1}') is None
+
+    def test_record_types_are_shared(self):
+        assert record_type(("Brake", "Throttle")) is record_type(("Brake", "Throttle"))
+        with pytest.raises(ValueError):
+            record_type(("items",))
+
+    def test_decoder_for_observer(self):
+        assert isinstance(decoder_for(object()), JsonDecoder)
+        assert decoder_for(object()).decode(PAYLOAD) == TELEMETRY
+        assert isinstance(decoder_for(ActiveDrivers()), ScanningDecoder)
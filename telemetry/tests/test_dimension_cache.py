@@ -0,0 +1,107 @@
+import threading
+
+from django.test import TestCase
+
+from telemetry.models import Car, CarClass, Game, Track
+from telemetry.pitcrew.dimension_cache import DimensionCache, LRUCache
+
+
+class TestDimensionCache(TestCase):
+    def setUp(self):
+        self.game = Game.objects.create(name="iRacing")
+        self.car_class = CarClass.objects.create(name="GT3", game=self.game)
+        Car.objects.create(name="Ferrari 488 GT3 Evo 2020", game=self.game, car_class=self.car_class)
+        Car.objects.create(name="Mazda MX-5 Cup", game=self.game)
+        Track.objects.create(name="fuji nochicane", length=4459, game=self.game)
+        self.cache = DimensionCache()
+
+    def test_game_miss_warms_up_game(self):
+        self.cache.game("iRacing", create=False)
+
+        with self.assertNumQueries(0):
+            game = self.cache.game("iRacing")
+            car_class = self.cache.car_class(game, "GT3")
+            self.cache.car(game, "Ferrari 488 GT3 Evo 2020", car_class=car_class)
+            self.cache.car(game, "Mazda MX-5 Cup")
+        # only the primary key of a track is cached, the row is loaded by it
+        with self.assertNumQueries(1):
+            track = self.cache.track(game, "fuji nochicane")
+        self.assertEqual(track.length, 4459)
+
+    def test_new_rows_are_created_once(self):
+        game = self.cache.game("iRacing")
+        track = self.cache.track(game, "okayama short", defaults={"length": 10})
+        self.assertEqual(track.length, 10)
+        self.assertEqual(self.cache.track(game, "okayama short"), track)
+        self.assertEqual(Track.objects.filter(name="okayama short").count(), 1)
+
+    def test_missing_game_is_not_created(self):
+        with self.assertRaises(Game.DoesNotExist):
+            self.cache.game("Richard Burns Rally", create=False)
+
+    def test_deleted_rows_are_forgotten(self):
+        from telemetry.pitcrew.dimension_cache import dimension_cache
+
+        dimension_cache.clear()
+        game = dimension_cache.game("iRacing")
+        track = dimension_cache.track(game, "fuji nochicane")
+        track.delete()
+        self.assertNotIn((game.pk, "fuji nochicane"), dimension_cache.tables["track"])
+
+    def test_updated_rows_are_forgotten(self):
+        from telemetry.pitcrew.dimension_cache import dimension_cache
+
+        game = dimension_cache.game("iRacing")
+        cached = dimension_cache.track(game, "fuji nochicane")
+        track = Track.objects.get(pk=cached.pk)
+        track.length = 4563
+        track.save()
+        self.assertEqual(dimension_cache.track(game, "fuji nochicane").length, 4563)
+
+    def test_tracks_changed_elsewhere_are_loaded(self):
+        game = self.cache.game("iRacing")
+        track = self.cache.track(game, "fuji nochicane")
+        # updates and deletes of other processes send no signals here
+        Track.objects.filter(pk=track.pk).update(length=4563)
+        self.assertEqual(self.cache.track(game, "fuji nochicane").length, 4563)
+
+        Track.objects.filter(pk=track.pk).delete()
+        track = self.cache.track(game, "fuji nochicane", defaults={"length": 10})
+        self.assertEqual(track.length, 10)
+        self.assertEqual(self.cache.track(game, "fuji nochicane"), track)
+
+    def test_concurrent_misses_share_one_load(self):
+        loads = []
+        started = threading.Event()
+        release = threading.Event()
+
+        def load():
+            loads.append(1)
+            started.set()
+            release.wait()
+            return "value"
+
+        results = []
+        first = threading.Thread(target=lambda: results.append(self.cache._get("driver", "durandom", load)))
+        first.start()
+        started.wait()
+        second = threading.Thread(target=lambda: results.append(self.cache._get("driver", "durandom", load)))
+        second.start()
+        release.set()
+        first.join()
+        second.join()
+
+        self.assertEqual(results, ["value", "value"])
+        self.assertEqual(len(loads), 1)
+
+
+class TestLRUCache(TestCase):
+    def test_eviction(self):
+        cache = LRUCache(maxsize=2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        cache.get("a")
+        cache.put("c", 3)
+        self.assertIn("a", cache)
+        self.assertNotIn("b", cache)
+        self.assertEqual(len(cache), 2)
@@ -0,0 +1,104 @@
+import csv
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from telemetry import flux_csv
+from telemetry.influx import Influx, field_filter
+
+PIVOTED = """#datatype,string,long,dateTime:RFC3339,string,string,double,double,double,long
+#group,false,false,false,true,true,false,false,false,false
+#default,_result,,,,,,,,
+,result,table,_time,CurrentLap,GameName,SpeedMs,CurrentLapTime,Gear,Ticks
+,,0,2023-09-09T12:00:00.1Z,1,Automobilista 2,10.5,0.1,2,1
+,,0,2023-09-09T12:00:00.2Z,1,Automobilista 2,,0.2,2,2
+,,1,2023-09-09T12:01:30Z,2,Automobilista 2,12.25,0.3,3,3
+
+#datatype,string,long,dateTime:RFC3339,string,string,double,double,boolean
+#group,false,false,false,true,true,false,false,false
+#default,_result,,,,,,,
+,result,table,_time,CurrentLap,GameName,SpeedMs,WorldPosition_x,CurrentLapIsValid
+,,2,2023-09-09T12:03:00Z,3,Automobilista 2,14.0,-3.5,true
+
+"""
+
+
+def rows(text):
+    return csv.reader(io.StringIO(text))
+
+
+@pytest.mark.unittest
+class TestFluxCsv:
+    def test_types_and_tables(self):
+        df = flux_csv.read_dataframe(rows(PIVOTED))
+
+        assert list(df.columns) == ["result", "table", "_time", "CurrentLap", "GameName", "SpeedMs", "CurrentLapTime", "Gear", "Ticks", "WorldPosition_x", "CurrentLapIsValid"]
+        assert len(df) == 4
+        assert list(df["result"]) == ["_result"] * 4
+        assert df["table"].dtype == np.int64
+        assert str(df["_time"].dtype) == "datetime64[ns, UTC]"
+        assert df["_time"].iloc[2] == pd.Timestamp("2023-09-09T12:01:30Z")
+        assert df["SpeedMs"].dtype == np.float32
+        assert df["CurrentLapTime"].dtype == np.float64
+        assert np.isnan(df["SpeedMs"].iloc[1])
+        assert list(df["CurrentLap"]) == ["1", "1", "2", "3"]
+        # columns missing in a table are filled in
+        assert list(df["Ticks"].iloc[:3]) == [1, 2, 3] and np.isnan(df["Ticks"].iloc[3])
+        assert np.isnan(df["WorldPosition_x"].iloc[0]) and df["WorldPosition_x"].iloc[3] == -3.5
+        assert df["CurrentLapIsValid"].iloc[3] is True and df["CurrentLapIsValid"].iloc[0] is None
+
+    def test_chunks(self, monkeypatch):
+        monkeypatch.setattr(flux_csv, "CHUNK_ROWS", 2)
+        df = flux_csv.read_dataframe(rows(PIVOTED))
+        assert list(df["SpeedMs"].fillna(0)) == [10.5, 0, 12.25, 14.0]
+        assert list(df["table"]) == [0, 0, 1, 2]
+
+    def test_empty_and_error(self):
+        assert flux_csv.read_dataframe(rows("")).empty
+        with pytest.raises(Exception, match="bad query"):
+            flux_csv.read_dataframe(rows("#datatype,string,string\n,error,reference\n,bad query,\n"))
+
+
+SESSION = """#datatype,string,long,dateTime:RFC3339,string,string,string,double,double
+#group,false,false,false,true,true,true,false,false
+#default,_result,,,,,,,
+,result,table,_time,CurrentLap,GameName,SessionId,SpeedMs,Gear
+,,0,2023-09-09T12:00:00.1Z,1,Automobilista 2,1694266648,10.5,2
+,,0,2023-09-09T12:00:00.2Z,1,Automobilista 2,1694266648,11.5,0
+,,0,2023-09-09T12:00:00.3Z,1,Automobilista 2,1694266648,12.5,3
+"""
+
+
+class FakeQueryApi:
+    def __init__(self, text):
+        self.text = text
+        self.queries = []
+
+    def query_csv(self, query):
+        self.queries.append(query)
+        return rows(self.text)
+
+
+@pytest.mark.unittest
+class TestSessionDf:
+    def influx(self, text=SESSION):
+        influx = Influx.__new__(Influx)
+        influx.query_api = FakeQueryApi(text)
+        return influx
+
+    def test_field_filter(self):
+        assert field_filter(["SpeedMs", "Gear", "SpeedMs"]) == '|> filter(fn: (r) => r["_field"] == "Gear" or r["_field"] == "SpeedMs")\n'
+
+    def test_fields_are_pushed_down(self):
+        influx = self.influx()
+        df = influx.session_df("1694266648", fields=["SpeedMs"])
+
+        query = influx.query_api.queries[0]
+        assert 'filter(fn: (r) => r["_field"] == "Gear" or r["_field"] == "SpeedMs")' in query
+        assert query.index('r["_field"]') < query.index("pivot(")
+        # neutral rows are dropped, without positions there is no x and y
+        assert list(df["SpeedMs"]) == [10.5, 12.5]
+        assert list(df["id"]) == ["1694266648-1", "1694266648-1"]
+        assert "x" not in df.columns
@@ -0,0 +1,77 @@
+import threading
+import time
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import pandas as pd
+import pytest
+
+from telemetry.influx import LAP_SOURCES, Influx
+
+
+def make_lap(number):
+    game = SimpleNamespace(name="iRacing")
+    session = SimpleNamespace(session_id="1694266648", game=game, end=datetime(2023, 9, 9, 13, tzinfo=timezone.utc))
+    return SimpleNamespace(
+        id=number,
+        number=number,
+        session=session,
+        track=SimpleNamespace(id=1, name="okayama short"),
+        car=SimpleNamespace(id=1, name="Mazda MX-5 Cup"),
+        length=3700,
+        time=90.0,
+        valid=True,
+        completed=True,
+        start=f"start-{number}",
+        end=f"end-{number}",
+    )
+
+
+class FakeInflux(Influx):
+    def __init__(self, missing_in_fast_laps=(), missing=()):
+        self.missing_in_fast_laps = missing_in_fast_laps
+        self.missing = missing
+        self.queries = []
+        self.running = 0
+        self.max_running = 0
+        self.lock = threading.Lock()
+
+    def session_df(self, session_id, lap_number=None, start=None, end=None, measurement=None, bucket=None, **kwargs):
+        with self.lock:
+            self.queries.append((lap_number, bucket))
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        # later laps answer faster, results must still come back in lap order
+        time.sleep(0.02 / lap_number)
+        with self.lock:
+            self.running -= 1
+        if lap_number in self.missing or (bucket == "fast_laps" and lap_number in self.missing_in_fast_laps):
+            raise Exception(f"No data found for {session_id} lap {lap_number}")
+        return pd.DataFrame({"CurrentLap": [lap_number] * 200, "bucket": [bucket] * 200})
+
+
+@pytest.mark.unittest
+class TestIterLapTelemetry:
+    def test_lap_order_and_fallback(self):
+        influx = FakeInflux(missing_in_fast_laps=(2, 4), missing=(3,))
+        laps = [make_lap(number) for number in range(1, 7)]
+
+        result = [(lap.number, df["bucket"].iloc[0] if df is not None else None) for lap, df in influx.iter_lap_telemetry(laps, sources=LAP_SOURCES, workers=4)]
+
+        assert result == [(1, "fast_laps"), (2, "racing"), (3, None), (4, "racing"), (5, "fast_laps"), (6, "fast_laps")]
+        assert influx.max_running > 1
+
+    def test_stopping_early_bounds_queries(self):
+        influx = FakeInflux()
+        laps = [make_lap(number) for number in range(1, 21)]
+
+        for lap, df in influx.iter_lap_telemetry(laps, workers=2):
+            break
+
+        assert len(influx.queries) <= 3
+
+    def test_telemetry_for_laps(self):
+        influx = FakeInflux(missing=(2,))
+        data = influx.telemetry_for_laps([make_lap(number) for number in range(1, 4)], measurement="laps_cc", bucket="racing")
+        assert [df["CurrentLap"].iloc[0] for df in data] == [1, 3]
+        assert {bucket for lap_number, bucket in influx.queries} == {"racing"}
@@ -0,0 +1,80 @@
+import datetime
+
+from django.test import TestCase
+from django.utils import timezone
+
+from telemetry.influx import WIDE_RANGE, Influx, RangePlanner
+from telemetry.models import Car, Driver, Game, Lap, Session, SessionType, Track
+
+START = datetime.datetime(2023, 9, 9, 12, 0, tzinfo=datetime.timezone.utc)
+
+
+class FakeQueryApi:
+    def __init__(self):
+        self.queries = []
+
+    def query_stream(self, query):
+        self.queries.append(query)
+        return iter([])
+
+
+class TestRangePlanner(TestCase):
+    def setUp(self):
+        game = Game.objects.create(name="iRacing")
+        track = Track.objects.create(name="okayama short", length=2500, game=game)
+        car = Car.objects.create(name="Mazda MX-5 Cup", game=game)
+        self.session = Session.objects.create(
+            session_id="1694266648",
+            driver=Driver.objects.create(name="durandom"),
+            session_type=SessionType.objects.create(type="Practice"),
+            game=game,
+            track=track,
+            car=car,
+            start=START,
+            end=START + datetime.timedelta(minutes=30),
+        )
+        self.laps = [
+            Lap.objects.create(
+                number=i,
+                session=self.session,
+                track=track,
+                car=car,
+                start=START + datetime.timedelta(minutes=2 * i),
+                end=START + datetime.timedelta(minutes=2 * i + 2),
+            )
+            for i in range(1, 5)
+        ]
+        self.planner = RangePlanner(margin=datetime.timedelta(minutes=1))
+        self.influx = Influx.__new__(Influx)
+        self.influx.planner = self.planner
+        self.influx.query_api = FakeQueryApi()
+
+    def test_session(self):
+        self.assertEqual(self.planner.session("1694266648"), ("2023-09-09T11:59:00.000000Z", "2023-09-09T12:31:00.000000Z"))
+
+    def test_laps(self):
+        self.assertEqual(self.planner.laps("1694266648", ["2", "3"]), ("2023-09-09T12:03:00.000000Z", "2023-09-09T12:09:00.000000Z"))
+        # laps not in Postgres take the session
+        self.assertEqual(self.planner.laps("1694266648", [9]), self.planner.session("1694266648"))
+
+    def test_missing_metadata_scans_wide(self):
+        self.assertEqual(self.planner.session("1"), WIDE_RANGE)
+        self.assertEqual(self.planner.laps("1", [1]), WIDE_RANGE)
+
+    def test_running_session_ends_now(self):
+        self.assertEqual(self.planner.span(START, timezone.now())[1], "now()")
+
+    def test_all_sessions(self):
+        self.assertEqual(self.planner.all_sessions(), ("2023-09-09T11:59:00.000000Z", "now()"))
+
+    def test_session_queries(self):
+        list(self.influx.session(session_id="1694266648"))
+        list(self.influx.session(lap=self.laps[0]))
+        self.influx.copy_session("1694266648", start=self.session.start, end=self.session.end)
+
+        session_query, lap_query, copy_query = self.influx.query_api.queries
+        self.assertIn("range(start: 2023-09-09T11:59:00.000000Z, stop: 2023-09-09T12:31:00.000000Z)", session_query)
+        self.assertIn("range(start: 2023-09-09T12:01:00.000000Z, stop: 2023-09-09T12:05:00.000000Z)", lap_query)
+        self.assertIn('r["CurrentLap"] == "1"', lap_query)
+        self.assertIn("range(start: 2023-09-09T11:59:00.000000Z, stop: 2023-09-09T12:31:00.000000Z)", copy_query)
+        self.assertNotIn("-10y", session_query + lap_query + copy_query)
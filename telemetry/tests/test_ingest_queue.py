@@ -0,0 +1,91 @@
+import threading
+
+import pytest
+
+from telemetry.pitcrew.ingest_queue import IngestQueue
+
+
+@pytest.mark.unittest
+class TestIngestQueue:
+    def test_messages_of_a_topic_are_handled_in_order(self):
+        handled = []
+        ingest_queue = IngestQueue(lambda topic, payload, now: handled.append((topic, payload)), workers=3, maxsize=1000)
+        ingest_queue.start()
+        for i in range(100):
+            for topic in ["a", "b", "c", "d"]:
+                ingest_queue.put(topic, i)
+        ingest_queue.stop()
+
+        assert len(handled) == 400
+        for topic in ["a", "b", "c", "d"]:
+            assert [payload for t, payload in handled if t == topic] == list(range(100))
+        assert ingest_queue.stats()["processed"] == 400
+
+    def _blocked_queue(self, policy, maxsize=3):
+        """Return a queue whose worker is stuck handling the first message."""
+        handled = []
+        started = threading.Event()
+        release = threading.Event()
+
+        def handler(topic, payload, now):
+            started.set()
+            release.wait()
+            handled.append(payload)
+
+        ingest_queue = IngestQueue(handler, maxsize=maxsize, policy=policy)
+        ingest_queue.start()
+        ingest_queue.put("a", 0)
+        started.wait()
+        return ingest_queue, handled, release
+
+    def test_drop_oldest(self):
+        ingest_queue, handled, release = self._blocked_queue(IngestQueue.POLICY_DROP_OLDEST)
+        for i in range(1, 6):
+            ingest_queue.put("a", i)
+        assert ingest_queue.depths() == {"a": 3}
+        assert ingest_queue.dropped == 2
+        release.set()
+        ingest_queue.stop()
+        assert handled == [0, 3, 4, 5]
+
+    def test_coalesce(self):
+        ingest_queue, handled, release = self._blocked_queue(IngestQueue.POLICY_COALESCE)
+        for i in range(1, 6):
+            ingest_queue.put("a", i)
+        ingest_queue.put("b", 1)
+        assert ingest_queue.depths() == {"a": 1, "b": 1}
+        assert ingest_queue.dropped == 4
+        release.set()
+        ingest_queue.stop()
+        assert handled == [0, 5, 1]
+
+    def test_counts_of_all_workers(self):
+        ingest_queue = IngestQueue(lambda topic, payload, now: None, workers=4, maxsize=1, policy=IngestQueue.POLICY_COALESCE)
+        topics = [f"crewchief/driver-{i}" for i in range(16)]
+        # without started workers every put after the first of a topic coalesces
+        producers = [threading.Thread(target=lambda: [ingest_queue.put(topic, n) for n in range(500) for topic in topics]) for i in range(4)]
+        for producer in producers:
+            producer.start()
+        for producer in producers:
+            producer.join()
+        assert ingest_queue.dropped == 4 * 500 * len(topics) - len(topics)
+        ingest_queue.start()
+        ingest_queue.stop()
+        assert ingest_queue.processed == len(topics)
+
+    def test_block(self):
+        ingest_queue, handled, release = self._blocked_queue(IngestQueue.POLICY_BLOCK, maxsize=1)
+        ingest_queue.put("a", 1)
+        producer = threading.Thread(target=ingest_queue.put, args=("a", 2))
+        producer.start()
+        producer.join(0.1)
+        assert producer.is_alive()
+        release.set()
+        producer.join()
+        ingest_queue.stop()
+        assert handled == [0, 1, 2]
+        assert ingest_queue.dropped == 0
+
+    def test_unknown_policy(self):
+        with pytest.raises(ValueError):
+            IngestQueue(lambda topic, payload, now: None, policy="drop_newest")
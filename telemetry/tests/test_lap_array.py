@@ -0,0 +1,66 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from telemetry.analyzer import Analyzer
+from telemetry.fast_lap_analyzer import FastLapAnalyzer
+from telemetry.lap_array import LapArray
+
+from .utils import get_lap_df
+
+
+@pytest.mark.unittest
+class TestLapArray:
+    def setup_method(self):
+        self.analyzer = Analyzer()
+        self.fast_lap_analyzer = FastLapAnalyzer()
+        self.df = self.fast_lap_analyzer.preprocess(get_lap_df(37672))
+        self.lap = LapArray.from_df(self.df)
+
+    def test_section_matches_section_df(self):
+        for start, end in [(0, 500), (120.5, 1800), (3000, 4458), (4000, 300), (4300, 20)]:
+            expected = self.analyzer.section_df(self.df, start, end)
+            section = self.lap.section(start, end)
+            assert len(section) == len(expected)
+            got = section.to_df()
+            for column in ["DistanceRoundTrack", "Brake", "SpeedMs", "Time"]:
+                np.testing.assert_allclose(got[column].to_numpy(), expected[column].to_numpy(dtype=float))
+            assert section.min_distance == expected["DistanceRoundTrack"].min()
+            assert section.max_distance == expected["DistanceRoundTrack"].max()
+            assert self.analyzer.sector_lap_time(section) == pytest.approx(self.analyzer.sector_lap_time(expected))
+
+    def test_sector_time(self):
+        expected = self.analyzer.section_df(self.df, 1000, 2000)
+        assert self.analyzer.sector_time(self.lap.section(1000, 2000)) == pytest.approx(self.analyzer.sector_time(expected), abs=1e-6)
+        assert self.analyzer.sector_time(self.lap) == pytest.approx(self.analyzer.sector_time(self.df), abs=1e-6)
+
+    def test_wrapped_section_is_views(self):
+        section = self.lap.section(4000, 300)
+        assert len(section.parts) == 2
+        tail, head = section.views("SpeedMs")
+        assert tail.base is not None and head.base is not None
+        assert tail[0] == self.lap.column("SpeedMs")[section.parts[0][0]]
+        # the time after the start line is added to the time before it
+        elapsed = self.lap.elapsed
+        (first, last), (zero, stop) = section.parts
+        assert section.time() == pytest.approx((elapsed[-1] - elapsed[first]) + (elapsed[stop - 1] - elapsed[zero]))
+
+    def test_empty_section(self):
+        section = self.lap.section(5000, 6000)
+        assert section.empty
+        assert np.isnan(section.min_distance)
+        assert self.analyzer.sector_time(section) == 0
+
+    def test_from_df_sorts_by_distance(self):
+        df = pd.DataFrame({"DistanceRoundTrack": [2.0, None, 0.0, 1.0], "SpeedMs": [3.0, 9.0, 1.0, 2.0], "CurrentLapTime": [3.0, 9.0, 1.0, 2.0]})
+        lap = LapArray.from_df(df)
+        assert lap.distance.tolist() == [0.0, 1.0, 2.0]
+        assert lap.column("SpeedMs").tolist() == [1.0, 2.0, 3.0]
+        assert lap.elapsed.tolist() == [0.0, 1.0, 2.0]
+
+    def test_fastest_sector(self):
+        frames = [self.df, self.df.assign(Time=self.df["Time"] * 1.0 + np.arange(len(self.df)) * 1e6)]
+        sector, index = self.fast_lap_analyzer.fastest_sector(frames, 500, 1500)
+        expected, expected_index = self.fast_lap_analyzer.fastest_sector([LapArray.from_df(df) for df in frames], 500, 1500)
+        assert index == expected_index == 0
+        pd.testing.assert_series_equal(sector["SpeedMs"].astype(float), expected["SpeedMs"], check_names=False)
@@ -0,0 +1,62 @@
+import os
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from telemetry.models import Session
+
+SESSION_FILE = os.path.join(os.path.dirname(__file__), "data", "session_1694266648_df.csv.gz")
+
+
+class TestLoadGenerator(TestCase):
+    def setUp(self):
+        # the benchmark never connects to a broker, but the mqtt module wants a host
+        patcher = mock.patch.dict(os.environ, {"MOSQUITTO_MQTT_SERVICE_HOST": os.environ.get("MOSQUITTO_MQTT_SERVICE_HOST", "localhost")})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_messages_interleave_drivers(self):
+        from telemetry.pitcrew.load_generator import LoadGenerator
+
+        generator = LoadGenerator(drivers=3, seconds=1, hz=10, files=[SESSION_FILE])
+        messages = list(generator.messages())
+        self.assertEqual(len(messages), generator.ticks())
+        self.assertEqual(
+            [message.topic.split("/")[1] for message in messages[:3]],
+            ["loadgen-0", "loadgen-1", "loadgen-2"],
+        )
+        self.assertNotEqual(messages[0].payload, messages[1].payload)
+
+    def test_pipeline_benchmark(self):
+        from telemetry.pitcrew.load_generator import LoadGenerator, PipelineBenchmark
+
+        generator = LoadGenerator(drivers=2, seconds=5, hz=60, files=[SESSION_FILE])
+        results = PipelineBenchmark(generator).run()
+
+        self.assertEqual(results["ticks"], 600)
+        for stage in ["on_message", "decode", "firehose", "coach", "persister"]:
+            self.assertEqual(results["stages"][stage]["count"], 600, stage)
+        self.assertEqual(results["stages"]["start"]["count"], 2)
+        self.assertGreater(results["queries"], 0)
+        self.assertEqual(results["queries_per_simulated_second"], results["queries"] / 5)
+        self.assertEqual(Session.objects.filter(driver__name__startswith="loadgen-").count(), 2)
+        self.assertEqual(results["stages"]["flush"]["count"], 2)
+
+    def test_flushes_follow_simulated_time(self):
+        from telemetry.pitcrew.load_generator import LoadGenerator, PipelineBenchmark
+
+        generator = LoadGenerator(drivers=1, seconds=12, hz=60, files=[SESSION_FILE])
+        benchmark = PipelineBenchmark(generator, coach=False)
+        benchmark.run()
+
+        # the write-behind latency is measured in seconds of telemetry, however fast the ticks ran
+        persister = benchmark.observer.observers["loadgen-0"]
+        self.assertIs(persister.write_behind.clock, benchmark.clock)
+        self.assertAlmostEqual(benchmark.clock(), 12 - 1 / 60)
+
+    def test_command_rolls_back(self):
+        out = StringIO()
+        call_command("benchmark_pitcrew", drivers=1, seconds=1, files=[SESSION_FILE], stdout=out)
+        self.assertFalse(Session.objects.filter(driver__name__startswith="loadgen-").exists())
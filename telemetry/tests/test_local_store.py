@@ -0,0 +1,137 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from telemetry.local_store import LocalStore, time_ns
+from telemetry.telemetry_store import TelemetryStore, telemetry_store
+
+from .test_influx_laps import make_lap
+
+SESSION_ID = "1694266648"
+
+
+def session_df(laps=3, rows=300):
+    frames = []
+    for lap in range(1, laps + 1):
+        start = pd.Timestamp("2023-09-09 12:00", tz="UTC") + pd.Timedelta(minutes=2 * lap)
+        frames.append(
+            pd.DataFrame(
+                {
+                    "result": "_result",
+                    "table": lap,
+                    "_time": pd.date_range(start, periods=rows, freq="100ms"),
+                    "_measurement": "laps_cc",
+                    "CurrentLap": str(lap),
+                    "GameName": "Automobilista 2",
+                    "SessionId": SESSION_ID,
+                    "SpeedMs": np.linspace(0, 50, rows, dtype=np.float32),
+                    "Gear": [0.0] + [3.0] * (rows - 1),
+                    "WorldPosition_x": np.arange(rows, dtype=np.float64),
+                    "WorldPosition_z": np.arange(rows, dtype=np.float64),
+                    "CurrentLapIsValid": [True, None] * (rows // 2),
+                }
+            )
+        )
+    return pd.concat(frames, ignore_index=True)
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = LocalStore(str(tmp_path))
+    store.write_session_df(session_df(), SESSION_ID)
+    return store
+
+
+@pytest.mark.unittest
+class TestLocalStore:
+    def test_session_df(self, store):
+        df = store.session_df(SESSION_ID, start="-10y")
+
+        # the ticks in neutral are dropped like by Influx.session_df
+        assert len(df) == 3 * 299
+        assert df["SpeedMs"].dtype == np.float32
+        assert str(df["_time"].dtype) == "datetime64[ns, UTC]"
+        assert df["_time"].is_monotonic_increasing
+        assert list(df["x"].iloc[:2]) == [1.0, 2.0]
+        assert df["id"].iloc[0] == f"{SESSION_ID}-1"
+        assert df["CurrentLapIsValid"].iloc[0] is None and df["CurrentLapIsValid"].iloc[1] is True
+
+    def test_column_and_lap_pushdown(self, store):
+        df = store.session_df(SESSION_ID, lap_number=2, start="-10y", fields=["SpeedMs"], drop_tags=True)
+
+        assert set(df.columns) == {"result", "table", "_time", "CurrentLap", "GameName", "SessionId", "SpeedMs", "Gear", "id"}
+        assert set(df["CurrentLap"]) == {"2"}
+
+    def test_time_pushdown(self, store):
+        manifest = store.manifest(store.session_path(SESSION_ID))
+        lap_2 = manifest["laps"]["2"]
+        assert lap_2["rows"] == 300
+
+        df = store.read(SESSION_ID, start=pd.Timestamp(lap_2["start"], tz="UTC"), end=pd.Timestamp(lap_2["end"], tz="UTC"))
+        assert set(df["CurrentLap"]) == {"2"}
+        # the end of a range is excluded
+        assert len(df) == 299
+
+    def test_aggregate(self, store):
+        df = store.session_df(SESSION_ID, lap_number=1, start="-10y", aggregate="1s")
+        assert len(df) == 30
+        assert df["_time"].iloc[0] == pd.Timestamp("2023-09-09 12:02:01", tz="UTC")
+
+    def test_missing_session(self, store):
+        with pytest.raises(Exception, match="No data found"):
+            store.session_df("1", start="-10y")
+
+    def test_session_records(self, store):
+        records = list(store.session(session_id=SESSION_ID, lap_numbers=[3], fields=["SpeedMs"]))
+
+        assert len(records) == 300
+        assert records[0]["CurrentLap"] == "3"
+        assert "Gear" not in records[0].values
+        assert records[0]["SpeedMs"] == 0.0
+
+    def test_laps_and_session_ids(self, store):
+        laps = [make_lap(number) for number in (1, 2)]
+        for lap in laps:
+            lap.session.session_id = SESSION_ID
+            lap.start, lap.end = None, None
+
+        data = store.telemetry_for_laps(laps)
+
+        assert [set(df["CurrentLap"]) for df in data] == [{"1"}, {"2"}]
+        assert store.session_ids(measurement="laps_cc") == {SESSION_ID}
+
+    def test_copy_session(self, store):
+        store.copy_session(SESSION_ID)
+
+        assert store.session_ids(measurement="fast_laps", bucket="fast_laps") == {SESSION_ID}
+        df = store.session_df(SESSION_ID, start="-10y", measurement="fast_laps", bucket="fast_laps")
+        assert set(df["_measurement"]) == {"fast_laps"}
+
+    def test_rewriting_a_lap(self, store):
+        store.write_lap(session_df(laps=1, rows=10), SESSION_ID, "1")
+
+        manifest = store.manifest(store.session_path(SESSION_ID))
+        assert manifest["laps"]["1"]["rows"] == 10
+        assert sorted(name for name in os.listdir(store.session_path(SESSION_ID)) if not name.startswith(".")) == ["lap-1", "lap-2", "lap-3", "manifest.json"]
+
+    def test_time_ns(self):
+        now = pd.Timestamp("2023-09-09 12:00", tz="UTC")
+        assert time_ns("now()", now=now) == now.value
+        assert time_ns("-1d", now=now) == (now - pd.Timedelta(days=1)).value
+        assert time_ns("2023-09-09T12:00:00.000000Z") == now.value
+        assert time_ns(None) is None
+
+    def test_configured_by_environment(self, tmp_path, monkeypatch):
+        monkeypatch.setenv("B4MAD_RACING_TELEMETRY_STORE", str(tmp_path))
+        assert isinstance(telemetry_store(), LocalStore)
+
+    def test_stores_implement_the_interface(self, tmp_path):
+        class PartialStore(TelemetryStore):
+            def session_df(self, session_id, **kwargs):
+                return pd.DataFrame()
+
+        with pytest.raises(TypeError):
+            PartialStore()
+        assert isinstance(LocalStore(str(tmp_path)), TelemetryStore)
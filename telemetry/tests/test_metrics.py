@@ -0,0 +1,67 @@
+import os
+import subprocess
+import sys
+
+import pytest
+from prometheus_client import REGISTRY, generate_latest
+
+from telemetry.pitcrew import metrics
+from telemetry.pitcrew.ingest_queue import IngestQueue
+
+
+@pytest.mark.unittest
+class TestMetrics:
+    def setup_method(self):
+        metrics.register()
+
+    def test_stage_observe(self):
+        before = REGISTRY.get_sample_value("pitcrew_stage_seconds_count", {"stage": "decode"}) or 0
+        metrics.DECODE.observe(0.00002)
+        assert REGISTRY.get_sample_value("pitcrew_stage_seconds_count", {"stage": "decode"}) == before + 1
+
+    def test_disabled(self, monkeypatch):
+        monkeypatch.setattr(metrics, "enabled", False)
+        before = REGISTRY.get_sample_value("pitcrew_stage_seconds_count", {"stage": "copilots"}) or 0
+        metrics.COPILOTS.observe(0.1)
+        metrics.tick("crewchief/disabled/1/game/track/car/race")
+        assert (REGISTRY.get_sample_value("pitcrew_stage_seconds_count", {"stage": "copilots"}) or 0) == before
+        assert REGISTRY.get_sample_value("pitcrew_ticks_total", {"topic": "crewchief/disabled/1/game/track/car/race"}) is None
+
+    def test_ticks_per_topic(self):
+        topic = "crewchief/durandom/1/game/track/car/race"
+        metrics.tick(topic)
+        metrics.tick(topic)
+        assert REGISTRY.get_sample_value("pitcrew_ticks_total", {"topic": topic}) == 2
+        metrics.forget_topic(topic)
+        assert REGISTRY.get_sample_value("pitcrew_ticks_total", {"topic": topic}) is None
+
+    def test_idle_topics_are_forgotten(self):
+        idle, active = "crewchief/durandom/1/game/track/car/race", "crewchief/durandom/2/game/track/car/race"
+        metrics.tick(idle)
+        metrics.tick(active)
+        metrics._ticks[idle][1] -= metrics.TOPIC_IDLE_SECONDS + 1
+        metrics.forget_idle_topics()
+        assert REGISTRY.get_sample_value("pitcrew_ticks_total", {"topic": idle}) is None
+        assert REGISTRY.get_sample_value("pitcrew_ticks_total", {"topic": active}) == 1
+        metrics.forget_topic(active)
+
+    def test_queue_depth(self):
+        queue = IngestQueue(lambda *args: None, maxsize=2)
+        metrics.collector.register_queue("test-queue", queue)
+        for n in range(3):
+            queue.put("crewchief/durandom", n, now=1)
+        exposition = generate_latest().decode("utf-8")
+        assert 'pitcrew_queue_depth{queue="test-queue"} 2.0' in exposition
+        assert 'pitcrew_queue_dropped_total{queue="test-queue"} 1.0' in exposition
+
+    def test_django_does_not_export_pitcrew_metrics(self):
+        # a fresh process loading the models and views, like the web app serving django_prometheus /metrics
+        script = (
+            "import django; django.setup(); from django.urls import get_resolver; get_resolver().url_patterns; "
+            "from prometheus_client import generate_latest; print(generate_latest().decode())"
+        )
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE="paddock.settings", SECRET_KEY=os.environ.get("SECRET_KEY", "x"))
+        root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        output = subprocess.run([sys.executable, "-c", script], env=env, cwd=root, capture_output=True, text=True, check=True).stdout
+        assert "django_db_query_duration_seconds" in output
+        assert "pitcrew_" not in output
@@ -0,0 +1,84 @@
+import time
+
+import pandas as pd
+import pytest
+
+from telemetry.local_store import LocalStore
+from telemetry.replay_source import (
+    FastClock,
+    RealTimeClock,
+    ReplaySource,
+    WaitClock,
+    clock,
+    record_ticks,
+)
+from telemetry.telemetry_store import records
+
+from .test_local_store import SESSION_ID, session_df
+
+TOPIC = f"crewchief/driver/{SESSION_ID}/Automobilista 2/Spa/Porsche 911/Race"
+
+
+def archived_session_df(session_id=SESSION_ID, offset="0s"):
+    df = session_df()
+    df["_time"] = df["_time"] + pd.Timedelta(offset)
+    df["SessionId"] = session_id
+    df["topic"] = TOPIC.replace(SESSION_ID, session_id)
+    return df
+
+
+@pytest.fixture
+def source(tmp_path):
+    store = LocalStore(str(tmp_path))
+    store.write_session_df(archived_session_df(), SESSION_ID)
+    return ReplaySource(store, batch_rows=64)
+
+
+@pytest.mark.unittest
+class TestReplaySource:
+    def test_session(self, source):
+        ticks = list(source.session(SESSION_ID))
+        assert len(ticks) == 900
+        topic, time_ns, telemetry = ticks[0]
+        assert topic == TOPIC
+        assert time_ns == pd.Timestamp("2023-09-09 12:02", tz="UTC").value
+        assert set(telemetry) == {"SpeedMs", "Gear", "WorldPosition_x", "WorldPosition_z", "CurrentLapIsValid", "CurrentLap"}
+        assert telemetry["CurrentLap"] == "1"
+        assert isinstance(telemetry["SpeedMs"], float)
+        assert ticks[1][2]["CurrentLapIsValid"] is None
+        assert [tick[1] for tick in ticks] == sorted(tick[1] for tick in ticks)
+
+    def test_same_ticks_as_records(self, source):
+        df = source.store.read(SESSION_ID, lap_numbers=[2])
+        expected = list(record_ticks(records(df)))
+        ticks = list(source.session(SESSION_ID, lap_numbers=[2]))
+        assert [(topic, time_ns) for topic, time_ns, telemetry in ticks] == [(topic, time_ns) for topic, time_ns, telemetry in expected]
+        assert [telemetry for topic, time_ns, telemetry in ticks] == [telemetry for topic, time_ns, telemetry in expected]
+
+    def test_time_range(self, source):
+        ticks = list(source.session(SESSION_ID, start="2023-09-09T12:04:10Z", end="2023-09-09T12:04:20Z"))
+        assert len(ticks) == 100
+        assert {tick[2]["CurrentLap"] for tick in ticks} == {"2"}
+
+    def test_stream_merges_sessions(self, source):
+        source.store.write_session_df(archived_session_df("1694266649", offset="50ms"), "1694266649")
+        ticks = list(source.stream(start="2023-09-09T12:02:00Z", end="2023-09-09T12:02:01Z"))
+        assert len(ticks) == 20
+        assert [tick[0].split("/")[2] for tick in ticks[:4]] == [SESSION_ID, "1694266649", SESSION_ID, "1694266649"]
+
+
+@pytest.mark.unittest
+class TestClock:
+    def test_clock_options(self):
+        assert isinstance(clock(), FastClock)
+        assert isinstance(clock(wait=0.001), WaitClock)
+        assert isinstance(clock(speed=0, wait=0.001), FastClock)
+        assert clock(speed=2).factor == 2
+
+    def test_real_time(self):
+        real_time = RealTimeClock(factor=10)
+        started = time.monotonic()
+        for tick in range(5):
+            # 100ms apart, 10ms at ten times the speed
+            real_time.wait(tick * 100_000_000)
+        assert 0.035 <= time.monotonic() - started < 0.5
@@ -0,0 +1,79 @@
+import numpy as np
+import pandas as pd
+import pytest
+from scipy.interpolate import interp1d
+
+from api.telemetry_loader import TelemetryLoader
+from telemetry.analyzer import Analyzer
+from telemetry.resampler import asof_indices, backfill_indices, resample_laps
+
+from .utils import get_lap_df, get_session_df
+
+COLUMNS = ["DistanceRoundTrack", "SpeedMs", "Throttle", "Brake", "CurrentLap", "Gear", "SteeringAngle", "CurrentLapTime"]
+
+
+def merge_asof_resample(lap_df, columns):
+    """The pandas implementation resample_channels replaced."""
+    lap_df = lap_df.sort_values("DistanceRoundTrack")
+    interpolate_columns = [column for column in columns if column not in ("DistanceRoundTrack", "Gear", "CurrentLap")]
+    backfill_columns = [column for column in columns if column in ("Gear", "CurrentLap")]
+    result = pd.DataFrame({"DistanceRoundTrack": np.arange(0, int(np.ceil(lap_df["DistanceRoundTrack"].max())), 1).astype(float)})
+    interp_df = pd.merge_asof(result, lap_df[interpolate_columns + ["DistanceRoundTrack"]], on="DistanceRoundTrack", direction="nearest").interpolate("linear")
+    result[interpolate_columns] = interp_df[interpolate_columns]
+    backfill_df = pd.merge_asof(result, lap_df[backfill_columns + ["DistanceRoundTrack"]], on="DistanceRoundTrack", direction="nearest").bfill()
+    result[backfill_columns] = backfill_df[backfill_columns]
+    return result
+
+
+@pytest.mark.unittest
+class TestResampler:
+    def setup_method(self):
+        self.analyzer = Analyzer()
+        self.session_df = get_session_df(1694266648)[COLUMNS].astype({"SpeedMs": float, "Throttle": float, "Brake": float, "SteeringAngle": float, "CurrentLapTime": float})
+
+    def test_resample_channels_matches_merge_asof(self):
+        for lap in self.session_df["CurrentLap"].unique():
+            lap_df = self.session_df[self.session_df["CurrentLap"] == lap]
+            expected = merge_asof_resample(lap_df, COLUMNS)
+            resampled = self.analyzer.resample_channels(lap_df, columns=COLUMNS)
+            pd.testing.assert_frame_equal(resampled, expected)
+
+    def test_resample_laps_in_one_call(self):
+        laps = [self.analyzer.resample_channels(self.session_df[self.session_df["CurrentLap"] == lap], columns=COLUMNS) for lap in self.session_df["CurrentLap"].unique()]
+        pd.testing.assert_frame_equal(self.analyzer.resample_laps(self.session_df, columns=COLUMNS), pd.concat(laps))
+
+    def test_float32(self):
+        resampled = resample_laps(self.session_df, COLUMNS, dtype=np.float32)
+        assert resampled["SpeedMs"].dtype == np.float32
+        np.testing.assert_allclose(resampled["SpeedMs"], resample_laps(self.session_df, COLUMNS)["SpeedMs"], rtol=1e-6)
+
+    def test_missing_values(self):
+        df = self.session_df.replace(np.nan, None).astype(object)
+        df.iloc[5:40, df.columns.get_loc("SpeedMs")] = None
+        df.iloc[3, df.columns.get_loc("DistanceRoundTrack")] = None
+        df = df.assign(_time=np.arange(len(df)), Rpms=0.0, Handbrake=0.0)
+        resampled = TelemetryLoader().process_dataframe(df)
+        assert not resampled["SpeedMs"].iloc[1:].isna().any()
+        assert resampled["CurrentLap"].dtype == int
+        assert len(resampled) == len(resample_laps(self.session_df, COLUMNS))
+
+    def test_resample_matches_interp1d(self):
+        df = get_lap_df(37672)
+        df = df[df["Gear"] != 0].copy()
+        df["Time"] = df["_time"].astype("int64")
+        columns = ["Brake", "SpeedMs", "Gear", "CurrentLapTime", "Time"]
+        for method in ["nearest", "linear"]:
+            resampled = self.analyzer.resample(df, columns=columns, method=method)
+            for column in columns:
+                interp = interp1d(df["DistanceRoundTrack"], df[column], kind=method, bounds_error=False, fill_value="extrapolate")
+                expected = interp(resampled["DistanceRoundTrack"])
+                if np.issubdtype(df[column].dtype, np.integer):
+                    expected = np.round(expected).astype(int)
+                np.testing.assert_array_equal(resampled[column].to_numpy(), expected)
+
+    def test_asof_indices(self):
+        distance = np.array([0.5, 1.5, 1.5, 2.5])
+        # halfway and equal distances pick the last sample before, like merge_asof
+        assert asof_indices(distance, np.array([0.0, 1.0, 1.5, 2.0, 3.0])).tolist() == [0, 0, 2, 2, 3]
+        missing = np.array([False, True, True, False])
+        assert backfill_indices(np.array([0, 1, 2, 3, 1]), missing).tolist() == [0, 3, 3, 3, 1]
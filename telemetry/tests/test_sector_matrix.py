@@ -0,0 +1,77 @@
+import time
+
+import numpy as np
+import pytest
+
+from telemetry.fast_lap_analyzer import FastLapAnalyzer
+from telemetry.lap_array import LapArray
+from telemetry.sector_matrix import LapStack, SectorMatrix
+
+from .utils import get_lap_df
+
+SECTORS = [{"start": 0, "end": 600}, {"start": 600, "end": 1900}, {"start": 1900, "end": 3100}, {"start": 3100, "end": 4450}]
+
+
+@pytest.mark.unittest
+class TestSectorMatrix:
+    def setup_method(self):
+        self.fast_lap_analyzer = FastLapAnalyzer()
+        df = self.fast_lap_analyzer.preprocess(get_lap_df(37672))
+        self.frames = []
+        rng = np.random.default_rng(7)
+        for number in range(6):
+            # every lap loses time somewhere else
+            pace = 1 + 0.02 * rng.random(len(df))
+            elapsed = np.concatenate([[0.0], np.cumsum(np.diff(df["Time"].to_numpy(dtype=float)) * pace[1:])])
+            self.frames.append(df.assign(Time=df["Time"].iloc[0] + elapsed))
+        self.laps = [LapArray.from_df(df) for df in self.frames]
+
+    def test_fastest_matches_fastest_sector(self):
+        matrix = SectorMatrix(LapStack(self.laps), SECTORS)
+        for number, sector in enumerate(SECTORS):
+            expected_sector, expected_index = self.fast_lap_analyzer.fastest_sector(self.frames, sector["start"], sector["end"])
+            times = [self.fast_lap_analyzer.analyzer.sector_time(lap.section(sector["start"], sector["end"])) for lap in self.laps]
+            np.testing.assert_allclose(matrix.times[:, number], times, atol=0.05)
+            assert matrix.fastest()[number] == expected_index
+
+    def test_theoretical_best(self):
+        matrix = SectorMatrix(LapStack(self.laps), SECTORS)
+        assert matrix.theoretical_best() == pytest.approx(np.nansum(matrix.best_times()))
+        assert matrix.theoretical_best() <= np.nansum(matrix.times, axis=1).min()
+
+    def test_coverage(self):
+        partial = LapArray.from_df(self.frames[0][self.frames[0]["DistanceRoundTrack"] > 1000])
+        matrix = SectorMatrix(LapStack([partial] + self.laps[1:2]), SECTORS)
+        assert matrix.covered[:, 0].tolist() == [False, True]
+        assert matrix.covered[:, 2].tolist() == [True, True]
+        assert np.isnan(matrix.times[0, 0])
+        assert matrix.fastest()[0] == 1
+
+        nothing = SectorMatrix(LapStack([partial]), SECTORS)
+        assert nothing.fastest()[0] == -1
+        assert np.isnan(nothing.theoretical_best())
+
+    def test_wrapped_sector(self):
+        lap = self.laps[0]
+        matrix = SectorMatrix(LapStack([lap]), [{"start": 4000, "end": 300}])
+        assert matrix.wrapped.tolist() == [True]
+        assert matrix.times[0, 0] == pytest.approx(lap.section(4000, 300).time(), abs=0.05)
+
+    def test_wrapped_sector_needs_the_finish_line(self):
+        frame = self.frames[1]
+        truncated = LapArray.from_df(frame[frame["DistanceRoundTrack"] <= 4099])
+        late_start = LapArray.from_df(frame[frame["DistanceRoundTrack"] >= 100])
+        matrix = SectorMatrix(LapStack([self.laps[0], truncated, late_start]), [{"start": 4000, "end": 300}, {"start": 600, "end": 1900}])
+        assert matrix.covered[:, 0].tolist() == [True, False, False]
+        assert matrix.fastest()[0] == 0
+        # sectors not crossing the line are covered as before
+        assert matrix.covered[:, 1].tolist() == [True, True, True]
+
+    def test_fifty_laps(self):
+        laps = self.laps * 9
+        sectors = [{"start": start, "end": start + 90} for start in range(0, 4300, 100)]
+        started = time.perf_counter()
+        matrix = SectorMatrix(LapStack(laps), sectors)
+        matrix.fastest()
+        assert time.perf_counter() - started < 1.0
+        assert matrix.times.shape == (54, len(sectors))
@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+from racing_telemetry.analysis import Streaming
+
+from telemetry.segment_features import FIELDS, SegmentFeatures
+
+
+def ticks(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    lap_time = np.cumsum(rng.choice([0.0, 1 / 60], size=rows))
+    throttle = np.clip(rng.normal(0.6, 0.5, size=rows), 0, 1)
+    brake = np.where(throttle > 0.2, 0.0, np.clip(rng.normal(0.4, 0.4, size=rows), 0, 1))
+    angle = np.linspace(0, np.pi / 2, rows) + rng.normal(0, 0.01, size=rows)
+    columns = {
+        "CurrentLapTime": lap_time,
+        "WorldPosition_x": np.cos(angle) * 100,
+        "WorldPosition_y": np.sin(angle) * 100,
+        "Throttle": throttle,
+        "Brake": brake,
+        "SpeedMs": np.abs(rng.normal(30, 10, size=rows)) * (rng.random(rows) > 0.05),
+        "DistanceRoundTrack": np.linspace(100, 400, rows),
+    }
+    return [dict(zip(FIELDS, row)) for row in zip(*(columns[name].tolist() for name in FIELDS))]
+
+
+def streaming(telemetry):
+    analysis = Streaming(coasting_time=True, braking_point=True, lift_off_point=True, apex=True, launch_wheel_slip_time=True)
+    for tick in telemetry:
+        analysis.notify(tick)
+    features = dict(analysis.get_features())
+    analysis.calculate_apex()
+    features["apex"] = analysis.computed_features["apex"]
+    return features
+
+
+@pytest.mark.unittest
+class TestSegmentFeatures:
+    @pytest.mark.parametrize("rows,seed", [(3, 2), (50, 3), (600, 4), (2000, 5)])
+    def test_same_as_streaming(self, rows, seed):
+        telemetry = ticks(rows, seed)
+        expected = streaming(telemetry)
+
+        features = SegmentFeatures(capacity=16)
+        for tick in telemetry:
+            features.append(tick)
+        result = features.get_features()
+        result["apex"] = features.apex()
+        for name in ["coasting_time", "braking_point", "lift_off_point", "launch_wheel_slip_time", "apex"]:
+            assert result[name] == expected[name], name
+
+    def test_short_segment_has_no_apex(self):
+        features = SegmentFeatures()
+        for tick in ticks(2):
+            features.append(tick)
+        assert features.apex() == -1
+
+    def test_extend_is_append(self):
+        telemetry = ticks(300)
+        appended = SegmentFeatures()
+        for tick in telemetry:
+            appended.append(tick)
+        extended = SegmentFeatures(capacity=8)
+        extended.extend({name: np.array([tick[name] for tick in telemetry[:100]]) for name in FIELDS})
+        extended.extend({name: np.array([tick[name] for tick in telemetry[100:]]) for name in FIELDS})
+        assert len(extended) == 300
+        assert extended.get_features() == appended.get_features()
+        assert extended.apex() == appended.apex()
+
+    def test_incremental(self):
+        telemetry = ticks(100)
+        features = SegmentFeatures()
+        for tick in telemetry[:50]:
+            features.append(tick)
+        assert features.get_features()["coasting_time"] == streaming(telemetry[:50])["coasting_time"]
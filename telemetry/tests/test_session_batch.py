@@ -0,0 +1,80 @@
+import os
+
+import numpy as np
+import pandas as pd
+from django.test import TestCase
+
+from telemetry.models import Car, Driver, Game, Landmark, Lap, Segment, Session, SessionType, Track
+from telemetry.pitcrew.write_behind import WriteBehind
+
+from .utils import read_dataframe
+
+SESSION_FILE = os.path.join(os.path.dirname(__file__), "data", "session_1694266648_df.csv.gz")
+LAP_FIELDS = ["number", "start", "end", "length", "time", "valid", "official_time", "completed"]
+SEGMENT_FIELDS = ["braking_point", "lift_off_point", "apex", "coasting_time", "launch_wheel_slip_time"]
+
+
+class TestSignalBatch(TestCase):
+    def setUp(self):
+        self.game = Game.objects.create(name="iRacing")
+        self.track = Track.objects.create(name="okayama short", length=2500, game=self.game)
+        self.car = Car.objects.create(name="Mazda MX-5 Cup", game=self.game)
+        self.driver = Driver.objects.create(name="durandom")
+        self.session_type = SessionType.objects.create(type="LonePractice")
+        for number, (start, end) in enumerate([(50, 400), (450, 900), (900, 1300), (1500, 2200)]):
+            Landmark.objects.create(name=f"turn {number}", start=start, end=end, kind=Landmark.KIND_SEGMENT, track=self.track)
+        df = read_dataframe(SESSION_FILE)
+        self.times = list(pd.to_datetime(df["_time"], utc=True).dt.to_pydatetime())
+        self.columns = {name: df[name].to_numpy() for name in Session.TELEMETRY_FIELDS if name in df.columns}
+        # iRacing sends no positions, the segment analysis needs them
+        angle = df["DistanceRoundTrack"].to_numpy() / 2500 * 2 * np.pi
+        self.columns["WorldPosition_x"] = np.cos(angle) * 400
+        self.columns["WorldPosition_y"] = np.sin(angle) * 400
+        # a gap in the telemetry, the ticks are invalid
+        self.columns["CurrentLapIsValid"] = self.columns["CurrentLapIsValid"].astype(object)
+        self.columns["CurrentLapIsValid"][5000:5003] = None
+
+    def session(self, session_id):
+        session = Session.objects.create(
+            session_id=session_id,
+            driver=self.driver,
+            session_type=self.session_type,
+            game=self.game,
+            track=self.track,
+            car=self.car,
+        )
+        session.prepare_for_analysis(write_behind=WriteBehind())
+        return session
+
+    def ticks(self):
+        names = list(self.columns)
+        values = [[None if value != value else value for value in self.columns[name].tolist()] for name in names]
+        for row in zip(*values):
+            yield dict(zip(names, row))
+
+    def finish(self, session):
+        session.save_analysis()
+        session.write_behind.flush()
+        laps = [tuple(getattr(lap, name) for name in LAP_FIELDS) for lap in Lap.objects.filter(session=session).order_by("number")]
+        segments = [
+            (segment.lap.number, segment.landmark.name) + tuple(getattr(segment, name) for name in SEGMENT_FIELDS)
+            for segment in Segment.objects.filter(lap__session=session).order_by("lap__number", "landmark__start")
+        ]
+        return laps, segments
+
+    def test_same_as_signal(self):
+        session = self.session("1")
+        for telemetry, now in zip(self.ticks(), self.times):
+            session.signal(telemetry, now)
+        expected = self.finish(session)
+
+        session = self.session("2")
+        for start in range(0, len(self.times), 1000):
+            columns = {name: values[start : start + 1000] for name, values in self.columns.items()}
+            session.signal_batch(columns, self.times[start : start + 1000])
+        laps, segments = self.finish(session)
+
+        self.assertEqual(len(expected[0]), 5)
+        self.assertGreater(len(expected[1]), 10)
+        self.assertEqual(laps, expected[0])
+        self.assertEqual(segments, expected[1])
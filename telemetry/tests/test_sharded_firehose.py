@@ -0,0 +1,117 @@
+import json
+import os
+import time
+from types import SimpleNamespace
+
+import pytest
+from prometheus_client import REGISTRY
+
+from telemetry.pitcrew import metrics
+from telemetry.pitcrew.sharded_firehose import ShardedFirehose, shard_for
+
+
+class FakeFirehose:
+    telemetry_fields = ("n",)
+
+    def __init__(self):
+        self.seen = {}
+
+    def notify(self, topic, payload, now=None):
+        driver = topic.split("/")[1]
+        previous = self.seen.get(driver, 0)
+        # payloads of a driver arrive in order
+        assert payload["n"] == previous + 1
+        self.seen[driver] = payload["n"]
+        if payload["n"] == 10:
+            return (f"coach/{driver}", [f"{os.getpid()}"])
+
+    def drivers(self):
+        return [SimpleNamespace(name=driver) for driver in self.seen]
+
+
+def fake_observer_factory(worker):
+    firehose = FakeFirehose()
+    return firehose, firehose
+
+
+class ArchivingFirehose(FakeFirehose):
+    def notify(self, topic, payload, now=None):
+        metrics.ARCHIVE.observe(0.001)
+        return super().notify(topic, payload, now)
+
+
+class SlowFirehose(FakeFirehose):
+    def notify(self, topic, payload, now=None):
+        time.sleep(0.01)
+
+
+def slow_observer_factory(worker):
+    firehose = SlowFirehose()
+    return firehose, firehose
+
+
+def archiving_observer_factory(worker):
+    firehose = ArchivingFirehose()
+    return firehose, firehose
+
+
+@pytest.mark.unittest
+class TestShardedFirehose:
+    def test_shard_for_partitions_by_driver(self):
+        assert shard_for("crewchief/durandom/1/game/track/car/race", 4) == shard_for("crewchief/durandom/2/other/track/car/race", 4)
+        shards = {shard_for(f"crewchief/driver-{i}/1/game/track/car/race", 4) for i in range(100)}
+        assert shards == {0, 1, 2, 3}
+
+    def test_payloads_are_handled_in_shard_processes(self):
+        published = []
+        firehose = ShardedFirehose(2, report_interval=0.05, observer_factory=fake_observer_factory)
+        firehose.publish = lambda topic, payload: published.append((topic, payload))
+        firehose.start()
+
+        drivers = [f"driver-{i}" for i in range(8)]
+        for n in range(1, 11):
+            for driver in drivers:
+                payload = json.dumps({"telemetry": {"n": n}}).encode("utf-8")
+                firehose.notify(f"crewchief/{driver}/1/game/track/car/race", payload)
+
+        deadline = time.monotonic() + 10
+        while len(published) < len(drivers) and time.monotonic() < deadline:
+            time.sleep(0.05)
+        while firehose.driver_names() != set(drivers) and time.monotonic() < deadline:
+            time.sleep(0.05)
+        firehose.stop()
+
+        assert firehose.driver_names() == set()
+        assert sum(firehose.stats()["processed"].values()) == 10 * len(drivers)
+        assert {topic for topic, payload in published} == {f"coach/{driver}" for driver in drivers}
+        pids = {payload for topic, payload in published}
+        assert len(pids) == 2
+        assert str(os.getpid()) not in pids
+
+    def test_stage_metrics_of_shards_are_exported(self, monkeypatch):
+        monkeypatch.setattr(metrics, "_shards", {})
+        metrics.register()
+        before = REGISTRY.get_sample_value("pitcrew_stage_seconds_count", {"stage": "archive"})
+        firehose = ShardedFirehose(2, report_interval=0.05, observer_factory=archiving_observer_factory)
+        firehose.start()
+        for n in range(1, 6):
+            for driver in ["durandom", "goern", "marcel"]:
+                firehose.notify(f"crewchief/{driver}/1/game/track/car/race", json.dumps({"telemetry": {"n": n}}).encode("utf-8"))
+        firehose.stop()
+
+        assert sorted(metrics._shards) == [0, 1]
+        assert REGISTRY.get_sample_value("pitcrew_stage_seconds_count", {"stage": "archive"}) == before + 15
+
+    def test_slow_shards_do_not_block_notify(self):
+        firehose = ShardedFirehose(1, report_interval=0.05, observer_factory=slow_observer_factory, queue_size=10)
+        firehose.start()
+        # far more than the pipe buffers, at 10ms per message in the shard
+        payload = json.dumps({"telemetry": {"n": 1, "padding": "x" * 4000}}).encode("utf-8")
+        start = time.monotonic()
+        for n in range(500):
+            firehose.notify("crewchief/durandom/1/game/track/car/race", payload)
+        elapsed = time.monotonic() - start
+        firehose.stop()
+
+        assert elapsed < 1
+        assert firehose.stats()["queue"]["dropped"] > 0
@@ -0,0 +1,130 @@
+import os
+import time
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import pandas as pd
+import pytest
+
+from telemetry.telemetry_cache import TelemetryCache, telemetry_cache
+
+from .test_influx_laps import FakeInflux, make_lap
+
+pytest.importorskip("pyarrow")
+
+
+def lap_df(rows=200, lap=1):
+    return pd.DataFrame(
+        {
+            "_time": pd.date_range("2023-09-09 12:00", periods=rows, freq="100ms", tz="UTC"),
+            "CurrentLap": [str(lap)] * rows,
+            "SpeedMs": [float(i) for i in range(rows)],
+            "Gear": [3] * rows,
+        }
+    )
+
+
+@pytest.mark.unittest
+class TestTelemetryCache:
+    def test_key(self):
+        key = TelemetryCache.key("racing", "laps_cc", "1694266648", lap=3, fields=["SpeedMs", "Brake"], aggregate="100ms")
+        assert key == TelemetryCache.key("racing", "laps_cc", 1694266648, lap="3", fields=("Brake", "SpeedMs"), aggregate="100ms")
+        assert key != TelemetryCache.key("fast_laps", "fast_laps", "1694266648", lap=3, fields=["SpeedMs", "Brake"], aggregate="100ms")
+        assert key != TelemetryCache.key("racing", "laps_cc", "1694266648", fields=["SpeedMs", "Brake"], aggregate="100ms")
+        assert key != TelemetryCache.key("racing", "laps_cc", "1694266648", lap=3, fields=["SpeedMs", "Brake"], aggregate="100ms", end="2023-09-09T12:00:00Z")
+
+    def test_roundtrip_keeps_types(self, tmp_path):
+        cache = TelemetryCache(str(tmp_path))
+        key = cache.key("racing", "laps_cc", "1", lap=1)
+        assert cache.get(key) is None
+
+        df = lap_df()
+        cache.put(key, df)
+        cached = cache.get(key)
+
+        pd.testing.assert_frame_equal(cached, df)
+        assert (cache.hits, cache.misses) == (1, 1)
+        # written atomically, no temporary files are left behind
+        assert [name for name in os.listdir(os.path.dirname(cache.path(key))) if name.startswith(".tmp-")] == []
+
+    def test_fetch_does_not_cache_empty_results(self, tmp_path):
+        cache = TelemetryCache(str(tmp_path))
+        key = cache.key("racing", "laps_cc", "1", lap=1)
+        assert cache.fetch(key, pd.DataFrame).empty
+        assert cache.files() == []
+        queries = []
+        cache.fetch(key, lambda: queries.append(1) or lap_df())
+        cache.fetch(key, lambda: queries.append(1) or lap_df())
+        assert queries == [1]
+
+    def test_evicts_least_recently_used(self, tmp_path):
+        cache = TelemetryCache(str(tmp_path))
+        keys = [cache.key("racing", "laps_cc", "1", lap=lap) for lap in range(4)]
+        for lap, key in enumerate(keys):
+            cache.put(key, lap_df(lap=lap))
+        file_size = max(size for mtime, size, path in cache.files())
+
+        # lap 0 is read, lap 1 is now the least recently used one
+        past = time.time() - 100
+        for lap, key in enumerate(keys):
+            os.utime(cache.path(key), (past + lap, past + lap))
+        assert cache.get(keys[0]) is not None
+
+        cache.max_bytes = int(file_size * 3.5)
+        cache.put(cache.key("racing", "laps_cc", "1", lap=4), lap_df(lap=4))
+
+        assert cache.get(keys[1]) is None
+        assert cache.get(keys[0]) is not None
+        assert cache.scan_size() <= cache.max_bytes
+
+    def test_refuses_shared_directories(self, tmp_path):
+        shared = tmp_path / "shared"
+        shared.mkdir(mode=0o777)
+        shared.chmod(0o777)
+        cache = TelemetryCache(str(shared))
+        key = cache.key("racing", "laps_cc", "1", lap=1)
+
+        cache.put(key, lap_df())
+        assert cache.files() == []
+        assert cache.get(key) is None
+
+        private = TelemetryCache(str(tmp_path / "private"))
+        private.put(key, lap_df())
+        assert oct(os.stat(private.directory).st_mode & 0o777) == oct(0o700)
+        assert private.get(key) is not None
+
+    def test_configured_by_environment(self, tmp_path, monkeypatch):
+        monkeypatch.setenv("B4MAD_RACING_TELEMETRY_CACHE", "")
+        assert telemetry_cache() is None
+        monkeypatch.setenv("B4MAD_RACING_TELEMETRY_CACHE", str(tmp_path))
+        assert telemetry_cache().directory == str(tmp_path)
+
+
+@pytest.mark.unittest
+class TestLapTelemetryCache:
+    def test_laps_are_read_through_the_cache(self, tmp_path):
+        influx = FakeInflux(missing_in_fast_laps=(2,))
+        influx.cache = TelemetryCache(str(tmp_path))
+        laps = [make_lap(number) for number in range(1, 4)]
+
+        first = [df["bucket"].iloc[0] for lap, df in influx.iter_lap_telemetry(laps, workers=2)]
+        queries = len(influx.queries)
+        second = [df["bucket"].iloc[0] for lap, df in influx.iter_lap_telemetry(laps, workers=2)]
+
+        assert first == second == ["fast_laps", "racing", "fast_laps"]
+        # only the lap missing in fast_laps queries the empty source again
+        assert influx.queries[queries:] == [(2, "fast_laps")]
+
+    def test_unsettled_laps_are_not_cached(self, tmp_path):
+        influx = FakeInflux()
+        influx.cache = TelemetryCache(str(tmp_path))
+        in_progress = make_lap(1)
+        in_progress.completed = False
+        running = make_lap(2)
+        running.session = SimpleNamespace(session_id="1694266648", game=running.session.game, end=datetime.now(tz=timezone.utc))
+
+        for i in range(2):
+            list(influx.iter_lap_telemetry([in_progress, running], sources=[("laps_cc", "racing")]))
+
+        assert sorted(influx.queries) == [(1, "racing"), (1, "racing"), (2, "racing"), (2, "racing")]
+        assert influx.cache.files() == []
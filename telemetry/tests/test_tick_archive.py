@@ -0,0 +1,65 @@
+import datetime
+
+import pytest
+
+from telemetry.local_store import LocalStore
+from telemetry.pitcrew.active_drivers import ActiveDrivers
+from telemetry.pitcrew.tick_archive import TickArchive
+
+TOPIC = "crewchief/driver/1694266648/Automobilista 2/Spa/Porsche 911/Race"
+START = datetime.datetime(2023, 9, 9, 12, 0, tzinfo=datetime.timezone.utc)
+
+
+def drive(archive, laps=2, ticks=10, topic=TOPIC):
+    for lap in range(1, laps + 1):
+        for tick in range(ticks):
+            now = START + datetime.timedelta(minutes=2 * lap, milliseconds=100 * tick)
+            payload = {"CurrentLap": lap, "SpeedMs": float(tick), "Gear": 3, "CarClass": "GT3"}
+            if tick == 5:
+                payload["Brake"] = 0.5
+            archive.notify(topic, payload, now)
+
+
+@pytest.fixture
+def archive(tmp_path):
+    return TickArchive(LocalStore(str(tmp_path)), idle_seconds=60)
+
+
+@pytest.mark.unittest
+class TestTickArchive:
+    def test_rolls_completed_laps(self, archive):
+        drive(archive, laps=3)
+        # wait for the writer thread
+        archive._executor.submit(lambda: None).result()
+        manifest = archive.store.manifest(archive.store.session_path("1694266648"))
+        assert sorted(manifest["laps"]) == ["1", "2"]
+
+        archive.stop()
+        df = archive.store.session_df("1694266648", start="-10y")
+        assert len(df) == 30
+        assert list(df["CurrentLap"].unique()) == ["1", "2", "3"]
+        assert set(df["GameName"]) == {"Automobilista 2"}
+        assert set(df["TrackCode"]) == {"Spa"}
+        # fields missing in some ticks are missing values
+        lap = df[df["CurrentLap"] == "1"]
+        assert lap["Brake"].notna().sum() == 1
+
+    def test_idle_roll_appends(self, archive):
+        drive(archive, laps=1, ticks=5)
+        archive.buffers[TOPIC].last_seen -= 120
+        archive.flush_idle()
+        assert TOPIC not in archive.buffers
+        drive(archive, laps=1, ticks=10)
+        archive.stop()
+        df = archive.store.read("1694266648", lap_numbers=[1])
+        assert len(df) == 15
+        assert df["_time"].is_monotonic_increasing
+
+    def test_ignores_invalid_topics(self, archive):
+        archive.notify("crewchief/invalid", {"CurrentLap": 1})
+        assert archive.buffers == {}
+
+    def test_active_drivers_decode_everything(self, archive):
+        assert ActiveDrivers.telemetry_fields == ("CarClass",)
+        assert ActiveDrivers(archive=archive).telemetry_fields is None
+        assert ActiveDrivers().telemetry_fields == ("CarClass",)
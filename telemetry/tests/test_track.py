@@ -0,0 +1,49 @@
+from django.test import TestCase
+
+from telemetry.models import Game, Landmark, Track
+from telemetry.pitcrew.dimension_cache import DimensionCache
+
+
+class TestTrackLandmarks(TestCase):
+    def setUp(self):
+        game = Game.objects.create(name="iRacing")
+        self.track = Track.objects.create(name="okayama short", length=2500, game=game)
+        for name, start, end in [("T1", 100, 300), ("T2", 400, 600), ("T3", 550, 900), ("T4", 1500, 2000)]:
+            Landmark.objects.create(name=name, start=start, end=end, kind=Landmark.KIND_SEGMENT, track=self.track)
+        Landmark.objects.create(name="Pit", start=0, end=2500, kind=Landmark.KIND_MISC, track=self.track)
+
+    def linear_scan(self, distance):
+        for landmark in Landmark.objects.filter(track=self.track, kind=Landmark.KIND_SEGMENT).order_by("start"):
+            if landmark.start <= distance <= landmark.end:
+                return landmark.name
+        return None
+
+    def test_get_landmark_matches_linear_scan(self):
+        for distance in [0, 99.5, 100, 250.3, 300, 300.1, 400, 575, 600.5, 900, 1499, 1500, 2000, 2400]:
+            landmark = self.track.get_landmark(distance)
+            name = landmark.name if landmark else None
+            self.assertEqual(name, self.linear_scan(distance), f"distance {distance}")
+
+    def test_landmark_numbers(self):
+        numbers = [self.track.get_landmark(d).number for d in [200, 500, 800, 1600]]
+        self.assertEqual(numbers, [0, 1, 2, 3])
+
+    def test_next_landmark_wraps_around(self):
+        self.assertEqual(self.track.get_next_landmark(50).name, "T1")
+        self.assertEqual(self.track.get_next_landmark(450).name, "T3")
+        self.assertEqual(self.track.get_next_landmark(1500).name, "T1")
+        self.assertEqual(self.track.get_next_landmark(2400).name, "T1")
+
+    def test_landmarks_are_loaded_per_session(self):
+        cache = DimensionCache()
+        game = cache.game("iRacing")
+        track = cache.track(game, "okayama short")
+        self.assertIsNone(track.get_landmark(1200))
+
+        # added by the web app, the running session keeps its landmarks
+        Landmark.objects.create(name="T5", start=1000, end=1300, kind=Landmark.KIND_SEGMENT, track=self.track)
+        self.assertIsNone(track.get_landmark(1200))
+        self.assertEqual(cache.track(game, "okayama short").get_landmark(1200).name, "T5")
+
+        Landmark.objects.filter(name="T5").delete()
+        self.assertIsNone(cache.track(game, "okayama short").get_landmark(1200))
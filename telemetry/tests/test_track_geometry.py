@@ -0,0 +1,125 @@
+import numpy as np
+import pytest
+
+from telemetry import track_geometry
+from telemetry.analyzer import Analyzer
+
+from .utils import get_session_df
+
+
+def loop_make_monotonic(distances, points):
+    max_distance = distances[0]
+    selected_idx = []
+    for idx in range(distances.shape[0]):
+        if distances[idx] > max_distance:
+            selected_idx.append(idx)
+            max_distance = distances[idx]
+    return distances[selected_idx], points[selected_idx]
+
+
+def loop_remove_outliers(points):
+    filter_window_index = 60 / 2
+    points = points.copy()
+    differences = np.diff(points, axis=0)
+    yaw_angles = np.arctan2(differences[:, 0], differences[:, 1])
+    mask = ~np.isnan(yaw_angles)
+    yaw_angles[mask] = np.unwrap(yaw_angles[mask])
+    yaw_changes = np.diff(yaw_angles)
+    for point_idx in range(points.shape[0] - 2):
+        if abs(yaw_changes[point_idx]) > 0.4:
+            start = int(max(0, point_idx - filter_window_index))
+            end = int(min(points.shape[0] - 1, point_idx + filter_window_index))
+            points[start:end, :] = np.nan
+    return points
+
+
+def loop_merge_track_points(distances_a, points_a, length):
+    filter_window_index = 60 / 2
+    track_distances = []
+    track_points = []
+    num_samples = int(length / 2)
+    for point_idx in range(num_samples):
+        window_distances, window_x, window_y = [], [], []
+        for lap_idx in range(len(distances_a)):
+            distances = distances_a[lap_idx].copy()
+            points = points_a[lap_idx].copy()
+            start = int(max(0, point_idx - filter_window_index))
+            end = int(min(num_samples - 1, point_idx + filter_window_index))
+            window_distances.extend(distances[start:end])
+            window_x.extend(points[start:end, 0])
+            window_y.extend(points[start:end, 1])
+        window_distances = np.array(window_distances)
+        window_x = np.array(window_x)
+        window_y = np.array(window_y)
+        window_distances = window_distances[~np.isnan(window_x)]
+        window_y = window_y[~np.isnan(window_x)]
+        window_x = window_x[~np.isnan(window_x)]
+        fx = np.poly1d(np.polyfit(window_distances, window_x, 2))
+        fy = np.poly1d(np.polyfit(window_distances, window_y, 2))
+        track_distances.append(distances[point_idx])
+        track_points.append(np.array([fx(distances[point_idx]), fy(distances[point_idx])]))
+    return np.array(track_distances), np.array(track_points)
+
+
+@pytest.mark.unittest
+class TestTrackGeometry:
+    def setup_method(self):
+        self.analyzer = Analyzer()
+        df = get_session_df(1683388042)
+        self.laps = []
+        for lap in sorted(df["CurrentLap"].unique())[1:4]:
+            lap_df = df[df["CurrentLap"] == lap]
+            distances = lap_df["DistanceRoundTrack"].to_numpy(dtype=float)
+            points = lap_df[["WorldPosition_x", "WorldPosition_z"]].to_numpy(dtype=float)
+            self.laps.append((distances, points))
+
+    def resampled(self):
+        laps = [self.analyzer.make_monotonic(distances, points) for distances, points in self.laps]
+        length = self.analyzer.track_length([distances for distances, points in laps])
+        return [self.analyzer.resample_(distances, points, length) for distances, points in laps], length
+
+    def test_make_monotonic(self):
+        for distances, points in self.laps:
+            distances = distances.copy()
+            distances[[0, 10, 500]] = [distances[0], np.nan, 0.0]
+            expected_distances, expected_points = loop_make_monotonic(distances, points)
+            got_distances, got_points = self.analyzer.make_monotonic(distances, points)
+            np.testing.assert_array_equal(got_distances, expected_distances)
+            np.testing.assert_array_equal(got_points, expected_points)
+
+    def test_remove_outliers(self):
+        laps, length = self.resampled()
+        for distances, points in laps:
+            points = points.copy()
+            # a position jumping off the track
+            points[700] += 40
+            points[5:9] = np.nan
+            np.testing.assert_array_equal(self.analyzer.remove_outliers(points), loop_remove_outliers(points))
+        batch = np.stack([points for distances, points in laps])
+        np.testing.assert_array_equal(self.analyzer.remove_outliers(batch)[1], loop_remove_outliers(batch[1]))
+
+    def test_merge_track_points(self):
+        laps, length = self.resampled()
+        distances_a = [distances for distances, points in laps]
+        points_a = [self.analyzer.remove_outliers(points) for distances, points in laps]
+        expected_distances, expected_points = loop_merge_track_points(distances_a, points_a, length)
+        got_distances, got_points = self.analyzer.merge_track_points(distances_a, points_a, length)
+        np.testing.assert_array_equal(got_distances, expected_distances)
+        np.testing.assert_allclose(got_points, expected_points, rtol=0, atol=1e-6)
+
+    def test_track_points(self):
+        distances, points = track_geometry.track_points([distances for distances, points in self.laps], [points for distances, points in self.laps])
+        assert distances[0] == 0 and np.all(np.diff(distances) == 2)
+        assert not np.isnan(points).any()
+        # the merged line is close to the positions of every lap
+        for lap_distances, lap_points in self.laps:
+            x = np.interp(distances, lap_distances, lap_points[:, 0])
+            assert np.nanmedian(np.abs(x - points[:, 0])) < 2
+
+    def test_window_without_positions(self):
+        grid = np.arange(0, 400, 2.0)
+        points = np.stack([np.column_stack([grid, grid * 0.5])])
+        points[0, 50:150] = np.nan
+        distances, merged = track_geometry.merge_points(grid, points, 400)
+        assert np.isnan(merged[100]).all()
+        np.testing.assert_allclose(merged[10], [20.0, 10.0])
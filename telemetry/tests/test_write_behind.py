@@ -0,0 +1,123 @@
+import os
+import time
+
+import pandas as pd
+from django.test import TestCase, TransactionTestCase
+
+from telemetry.models import Car, Driver, Game, Lap, Session, SessionType, Track
+from telemetry.pitcrew.persister_db import PersisterDb
+from telemetry.pitcrew.write_behind import WriteBehind
+
+from .utils import read_dataframe
+
+SESSION_FILE = os.path.join(os.path.dirname(__file__), "data", "session_1694266648_df.csv.gz")
+
+
+class TestWriteBehind(TestCase):
+    def setUp(self):
+        game = Game.objects.create(name="iRacing")
+        self.track = Track.objects.create(name="okayama short", length=2500, game=game)
+        self.car = Car.objects.create(name="Mazda MX-5 Cup", game=game)
+        self.session = Session.objects.create(
+            session_id="1694266648",
+            driver=Driver.objects.create(name="durandom"),
+            session_type=SessionType.objects.create(type="Practice"),
+            game=game,
+            track=self.track,
+            car=self.car,
+        )
+        self.laps = [Lap.objects.create(number=i, session=self.session, track=self.track, car=self.car) for i in range(10)]
+
+    def test_updates_are_deferred_until_flush(self):
+        write_behind = WriteBehind(max_latency=60)
+        for lap in self.laps:
+            lap.length = 2400
+            lap.valid = True
+            write_behind.add(lap)
+
+        self.assertEqual(len(write_behind), 10)
+        self.assertFalse(write_behind.is_due())
+        self.assertEqual(Lap.objects.filter(length=2400).count(), 0)
+
+        with self.assertNumQueries(3):
+            # savepoint, one bulk update, release savepoint
+            rows = write_behind.flush()
+
+        self.assertEqual(rows, 10)
+        self.assertEqual(len(write_behind), 0)
+        self.assertEqual(Lap.objects.filter(length=2400, valid=True).count(), 10)
+        self.assertFalse(self.laps[0].is_dirty())
+
+    def test_changes_after_add_are_written(self):
+        write_behind = WriteBehind()
+        lap = self.laps[0]
+        lap.length = 100
+        write_behind.add(lap)
+        lap.time = 97.0
+        write_behind.flush()
+
+        lap.refresh_from_db()
+        self.assertEqual(lap.length, 100)
+        self.assertEqual(lap.time, 97.0)
+
+    def test_clean_instances_are_ignored(self):
+        write_behind = WriteBehind()
+        write_behind.add(self.laps[0])
+        self.assertEqual(len(write_behind), 0)
+        self.assertEqual(write_behind.flush(), 0)
+
+    def test_new_instances_are_created(self):
+        write_behind = WriteBehind()
+        write_behind.add(Lap(number=10, session=self.session, track=self.track, car=self.car))
+        write_behind.add(Lap(number=11, session=self.session, track=self.track, car=self.car))
+        write_behind.flush()
+        self.assertEqual(self.session.laps.count(), 12)
+
+    def test_flush_if_due(self):
+        write_behind = WriteBehind(max_latency=0)
+        self.laps[0].length = 100
+        write_behind.add(self.laps[0])
+        self.assertEqual(write_behind.flush_if_due(), 1)
+        self.assertEqual(write_behind.flush_if_due(), 0)
+
+    def test_latency_follows_the_clock(self):
+        now = [100.0]
+        write_behind = WriteBehind(max_latency=5, clock=lambda: now[0])
+        self.laps[0].length = 100
+        write_behind.add(self.laps[0])
+        now[0] = 104.9
+        self.assertEqual(write_behind.flush_if_due(), 0)
+        now[0] = 105.0
+        self.assertEqual(write_behind.flush_if_due(), 1)
+
+
+class TestWriteBehindTimer(TransactionTestCase):
+    def test_timer_flushes_when_ticks_stop(self):
+        Game.objects.create(name="iRacing")
+        persister = PersisterDb(Driver.objects.create(name="durandom"), flush_latency=5)
+        clock = [0.0]
+        persister.write_behind.clock = lambda: clock[0]
+        topic = "crewchief/durandom/1694266648/iRacing/okayama short/Mazda MX-5 Cup/LonePractice"
+        df = read_dataframe(SESSION_FILE)
+        times = list(pd.to_datetime(df["_time"], utc=True).dt.to_pydatetime())
+        fields = [name for name in Session.TELEMETRY_FIELDS if name in df.columns]
+        rows = df[fields].astype(object).where(df[fields].notna(), None).to_dict("records")
+
+        # the driver crosses the line and stops sending
+        for telemetry, now in zip(rows, times):
+            persister.notify(topic, telemetry, now)
+            if any(getattr(instance, "official_time", 0) for instance in persister.write_behind.pending.values()):
+                break
+        self.assertFalse(Lap.objects.filter(official_time__gt=0).exists())
+
+        clock[0] = 5.0
+        persister.write_behind.start(interval=0.05)
+        try:
+            deadline = time.monotonic() + 5
+            while not Lap.objects.filter(official_time__gt=0).exists() and time.monotonic() < deadline:
+                time.sleep(0.05)
+        finally:
+            persister.write_behind.stop()
+        lap = Lap.objects.get(official_time__gt=0)
+        self.assertTrue(lap.completed)
+        self.assertEqual(len(persister.write_behind), 0)
@@ -5,8 +5,8 @@ from pprint import pprint
 import numpy as np
 import pandas as pd
 
-from telemetry.influx import Influx
 from telemetry.models import Lap
+from telemetry.telemetry_store import telemetry_store
 
 
 def read_dataframe(file_path):
@@ -30,7 +30,7 @@ def get_session_df(session_id, measurement="fast_laps", bucket="fast_laps"):
     if os.path.exists(file_path):
         session_df = read_dataframe(file_path)
     else:
-        influx = Influx()
+        influx = telemetry_store()
         session_df = influx.session_df(session_id, measurement=measurement, bucket=bucket, start="-10y")
         save_dataframe(session_df, file_path)
 
@@ -44,7 +44,7 @@ def get_lap_df(lap_id, measurement="fast_laps", bucket="fast_laps"):
     if os.path.exists(file_path):
         lap_df = read_dataframe(file_path)
     else:
-        influx = Influx()
+        influx = telemetry_store()
         lap = Lap.objects.get(id=lap_id)
         laps = influx.telemetry_for_laps([lap], measurement=measurement, bucket=bucket)
         lap_df = laps[0]
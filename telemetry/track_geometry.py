@@ -0,0 +1,148 @@
+"""Build the line of a track from the positions of several laps, all laps at once.
+
+The steps of ``Analyzer`` to build a track map looped over the samples in
+python, ``merge_track_points`` over every sample of every lap and copied the
+arrays of the lap on every step. Here the laps are a laps × samples × 2 array
+of positions on one grid of distances:
+
+1. ``monotonic``: the samples of a lap where the distance increases, with
+   ``np.fmax.accumulate``
+2. ``resample_points``: the positions of every lap every ``STEP`` meters,
+   nan outside of a lap
+3. ``remove_outliers``: nan the ``FILTER_WINDOW`` meters around a jump of
+   the yaw angle, the windows of all jumps at once with a running sum
+4. ``merge_points``: fit a quadratic to the positions of all laps in the
+   window around every sample, with the sums of the least squares fits of
+   all windows computed as matrix products of sliding windows
+
+The results are those of the loops, see ``test_track_geometry``, except that
+a window without enough positions for a fit is nan instead of an error.
+"""
+
+from typing import List, Sequence, Tuple
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+STEP = 2  # [meter]
+FILTER_WINDOW = 60  # [meter]
+YAW_THRESHOLD = 0.4  # [radian]
+
+
+def monotonic(distances: np.ndarray) -> np.ndarray:
+    """Return the indices of the samples with a distance above all distances before them."""
+    distances = np.asarray(distances, dtype=np.float64)
+    if not len(distances) or np.isnan(distances[0]):
+        return np.zeros(0, dtype=int)
+    before = np.empty_like(distances)
+    before[0] = distances[0]
+    # the largest distance before every sample, nan distances are never the largest
+    before[1:] = np.fmax.accumulate(distances[:-1])
+    return np.flatnonzero(distances > before)
+
+
+def track_length(distances_a: Sequence[np.ndarray]) -> float:
+    return max([0] + [lap.max() for lap in distances_a if lap.max() > 0])
+
+
+def resample_points(distances_a: Sequence[np.ndarray], points_a: Sequence[np.ndarray], length, step=STEP) -> Tuple[np.ndarray, np.ndarray]:
+    """Return the grid of distances and the laps × grid × 2 positions on it, nan outside of a lap."""
+    grid = np.arange(0, length, step)
+    points = np.full((len(points_a), len(grid), 2), np.nan)
+    for number, (distances, lap_points) in enumerate(zip(distances_a, points_a)):
+        for axis in range(2):
+            points[number, :, axis] = np.interp(grid, distances, lap_points[:, axis], left=np.nan, right=np.nan)
+    return grid, points
+
+
+def unwrap(angles: np.ndarray) -> np.ndarray:
+    """Unwrap the angles of every row along the samples, skipping nan like ``np.unwrap`` on the present angles."""
+    missing = np.isnan(angles)
+    if not missing.any():
+        return np.unwrap(angles, axis=-1)
+    count = angles.shape[-1]
+    # carry the last present angle over the gaps, the first present one back to the start
+    present = np.where(missing, 0, np.arange(count))
+    last = np.maximum.accumulate(present, axis=-1)
+    filled = np.take_along_axis(angles, last, axis=-1)
+    first = np.argmax(~missing, axis=-1)[..., None]
+    filled = np.where(np.arange(count) < first, np.take_along_axis(angles, first, axis=-1), filled)
+    unwrapped = np.unwrap(filled, axis=-1)
+    unwrapped[missing] = np.nan
+    return unwrapped
+
+
+def windows(flags: np.ndarray, before: int, after: int, end: int, size: int) -> np.ndarray:
+    """Return the rows × ``size`` mask of the ``[flag - before, flag + after)`` windows of the flags, cut at ``end``."""
+    rows = flags.shape[0]
+    changes = np.zeros((rows, size + 1), dtype=np.int64)
+    row, index = np.nonzero(flags)
+    np.add.at(changes, (row, np.maximum(0, index - before)), 1)
+    np.add.at(changes, (row, np.minimum(end, index + after)), -1)
+    return np.cumsum(changes[:, :size], axis=1) > 0
+
+
+def remove_outliers(points: np.ndarray, step=STEP, threshold=YAW_THRESHOLD, filter_window=FILTER_WINDOW) -> np.ndarray:
+    """Return the laps × samples × 2 positions with the windows around jumps of the yaw angle set to nan."""
+    points = np.array(points, dtype=np.float64)
+    samples = points.shape[1]
+    if samples < 3:
+        return points
+    window = int(filter_window / step)
+    differences = np.diff(points, axis=1)
+    yaw_changes = np.diff(unwrap(np.arctan2(differences[..., 0], differences[..., 1])), axis=1)
+    with np.errstate(invalid="ignore"):
+        jumps = np.abs(yaw_changes) > threshold
+    # the windows end before the last sample
+    points[windows(jumps, window, window, samples - 1, samples)] = np.nan
+    return points
+
+
+def merge_points(grid: np.ndarray, points: np.ndarray, length, step=STEP, filter_window=FILTER_WINDOW) -> Tuple[np.ndarray, np.ndarray]:
+    """Fit a quadratic to the positions of all laps around every sample of the grid, return the distances and positions.
+
+    The fits are least squares in the offsets of the samples from the center
+    of their window, the position at the center is the constant term. The
+    sums of the normal equations of all windows are the products of the
+    sliding windows over the laps with the powers of the offsets.
+    """
+    count = int(length / step)
+    half = int(filter_window / step)
+    grid = np.asarray(grid, dtype=np.float64)[:count]
+    points = np.asarray(points, dtype=np.float64)[:, :count]
+    present = ~np.isnan(points[..., 0])
+    weights = present.sum(axis=0).astype(np.float64)
+    x = np.where(present, points[..., 0], 0).sum(axis=0)
+    y = np.where(present, points[..., 1], 0).sum(axis=0)
+    # a window starts half before the sample and ends before half after it and before the last sample
+    usable = np.arange(count) < count - 1
+
+    def padded(values):
+        return np.concatenate([np.zeros(half), np.where(usable, values, 0), np.zeros(half)])
+
+    offsets = np.arange(-half, half).astype(np.float64)
+    powers = offsets[:, None] ** np.arange(5)
+    moments = sliding_window_view(padded(weights), 2 * half)[:count] @ powers
+    x_moments = sliding_window_view(padded(x), 2 * half)[:count] @ powers[:, :3]
+    y_moments = sliding_window_view(padded(y), 2 * half)[:count] @ powers[:, :3]
+
+    normal = moments[:, [[0, 1, 2], [1, 2, 3], [2, 3, 4]]]
+    # a quadratic needs positions at three distances
+    distinct = sliding_window_view(padded((weights > 0).astype(np.float64)), 2 * half)[:count].sum(axis=1)
+    solvable = distinct >= 3
+    normal[~solvable] = np.eye(3)
+    rhs = np.stack([x_moments, y_moments], axis=-1)
+    merged = np.linalg.solve(normal, rhs)[:, 0, :]
+    merged[~solvable] = np.nan
+    return grid, merged
+
+
+def track_points(distances_a: List[np.ndarray], points_a: List[np.ndarray], step=STEP) -> Tuple[np.ndarray, np.ndarray]:
+    """Return the distances and the merged positions of the track from the distances and positions of laps."""
+    laps = [monotonic(distances) for distances in distances_a]
+    distances_a = [distances[lap] for distances, lap in zip(distances_a, laps)]
+    points_a = [points[lap] for points, lap in zip(points_a, laps)]
+    length = track_length(distances_a)
+    grid, points = resample_points(distances_a, points_a, length, step=step)
+    points = remove_outliers(points, step=step)
+    return merge_points(grid, points, length, step=step)